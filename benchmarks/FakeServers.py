@@ -0,0 +1,401 @@
+# local stand-ins for a SysML v2 API server and an openLCA IPC server, for end-to-end benchmarks without a network
+# Each server runs in a thread of the calling process on a free port of 127.0.0.1 and implements the calls the
+# connector uses:
+# - FakeSysMLServer: projects, branches, commits, the elements of a commit with cursor pagination (Link header
+#   with rel="next"), single elements, the changes of a commit, query-results with primitive and composite
+#   constraints (paginated like the elements), posting commits and deleting projects
+# - FakeOpenLCAServer: the JSON-RPC methods data/get, data/get/all, data/get/descriptors, data/get/descriptor,
+#   data/put and data/delete of olca_ipc
+# The servers speak HTTP/1.1 with keep-alive, so connection pooling of the clients has the same effect as with
+# a real server. FaultInjection adds latency, limits the bandwidth and fails a share of the requests.
+#
+#   with FakeSysMLServer(FaultInjection(latency=0.01)) as sysml:
+#       project = sysml.addProject(generateModel(10000))
+#       model = SysMLLCAModel(sysml.url, project)
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+WRITE_SIZE = 64 * 1024 # bytes written at once, the bandwidth is limited per write
+DEFAULT_PAGE_SIZE = 100 # page size of the API if the request has none
+
+
+class FaultInjection:
+    # latency: seconds added to every request
+    # bandwidth: bytes per second of a response or None for unlimited, each response is limited on its own
+    # errorRate: share of the requests that fail, SysML requests with status 503, openLCA requests with a JSON-RPC error
+    def __init__(self, latency=0.0, bandwidth=None, errorRate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.errorRate = errorRate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def fails(self):
+        if self.errorRate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < self.errorRate
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, every response has a Content-Length
+    disable_nagle_algorithm = True # headers and body are written separately, which Nagle would delay by the delayed ACK
+
+    def setup(self):
+        super().setup()
+        self.server.fake.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        fake.count("requests")
+        faults = fake.faults
+        if faults.latency:
+            time.sleep(faults.latency)
+        if faults.fails():
+            fake.count("errors")
+            status, headers, data = fake.failure()
+        else:
+            try:
+                status, headers, data = fake.handle(method, urlsplit(self.path), body)
+            except Exception as e:
+                fake.count("errors")
+                status, headers, data = 500, {}, json.dumps({"error": str(e)}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        for start in range(0, len(data), WRITE_SIZE):
+            chunk = data[start:start + WRITE_SIZE]
+            self.wfile.write(chunk)
+            if faults.bandwidth:
+                time.sleep(len(chunk) / faults.bandwidth)
+        fake.count("bytes", len(data))
+
+
+class FakeServer:
+    # base class: runs the HTTP server and counts requests, connections, errors and bytes sent
+    # subclasses implement handle(method, url, body) -> (status, headers, body bytes) and failure()
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjection()
+        self.stats = Counter()
+        self.statsLock = threading.Lock()
+        self.lock = threading.RLock() # the data of the server
+        self.httpServer = None
+        self.url = None
+
+    def count(self, name, amount=1):
+        with self.statsLock:
+            self.stats[name] += amount
+
+    def resetStats(self):
+        # returns the statistics so far and starts counting from zero
+        with self.statsLock:
+            stats = dict(self.stats)
+            self.stats.clear()
+        return stats
+
+    def start(self):
+        self.httpServer = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.httpServer.daemon_threads = True
+        self.httpServer.block_on_close = False
+        self.httpServer.fake = self
+        threading.Thread(target=self.httpServer.serve_forever, name=type(self).__name__, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpServer.server_address[1]}"
+        return self.url
+
+    def stop(self):
+        if self.httpServer:
+            self.httpServer.shutdown()
+            self.httpServer.server_close()
+            self.httpServer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def failure(self):
+        return 503, {}, b'{"error": "injected fault"}'
+
+
+def encode(data):
+    return json.dumps(data).encode("utf-8")
+
+
+def notFound():
+    return 404, {}, b'{"error": "not found"}'
+
+
+class Commit:
+    # the state of a project after a commit: the elements in order and their JSON, encoded once for all pages
+    def __init__(self, id, previous, elements, changes):
+        self.id = id
+        self.previous = previous # id of the previous commit or None
+        self.elements = elements # {id: element} in the order of the pages
+        self.encoded = {}        # id -> JSON of the element, encoded on first use
+        self.ids = list(elements)
+        self.positions = {id: i for i, id in enumerate(self.ids)}
+        self.changes = changes   # [DataVersion, ...]
+        self.changeIds = [c['@id'] for c in changes]
+        self.changePositions = {id: i for i, id in enumerate(self.changeIds)}
+
+    def element(self, id):
+        data = self.encoded.get(id)
+        if data is None:
+            data = self.encoded[id] = encode(self.elements[id])
+        return data
+
+    def change(self, id):
+        return encode(self.changes[self.changePositions[id]])
+
+
+class FakeSysMLServer(FakeServer):
+
+    def __init__(self, faults=None):
+        super().__init__(faults)
+        self.projects = {} # project id -> {'data': project JSON, 'branch': branch id, 'head': commit id}
+        self.commits = {}  # commit id -> Commit
+
+    def addProject(self, elements, name=None, projectId=None):
+        # creates a project with one commit of the elements, returns the id of the project
+        projectId = projectId or str(uuid.uuid4())
+        branchId = str(uuid.uuid4())
+        with self.lock:
+            self.projects[projectId] = {
+                'data': {'@id': projectId, '@type': 'Project', 'name': name or f"project {len(self.projects) + 1}",
+                         'defaultBranch': {'@id': branchId}},
+                'branch': branchId, 'head': None}
+            self.addCommit(projectId, [{'@type': 'DataVersion', 'identity': {'@id': e['@id']}, 'payload': e}
+                                       for e in elements])
+        return projectId
+
+    def addCommit(self, project, changes):
+        # applies the changes [DataVersion, ...] to the head of the project, returns the id of the new commit
+        with self.lock:
+            head = self.projects[project]['head']
+            elements = dict(self.commits[head].elements) if head else {}
+            versions = []
+            for change in changes:
+                payload = change.get('payload')
+                id = (change.get('identity') or payload)['@id']
+                if payload is None:
+                    elements.pop(id, None)
+                else:
+                    elements[id] = payload
+                versions.append({'@id': str(uuid.uuid4()), '@type': 'DataVersion', 'identity': {'@id': id},
+                                 'payload': payload})
+            commit = Commit(str(uuid.uuid4()), head, elements, versions)
+            self.commits[commit.id] = commit
+            self.projects[project]['head'] = commit.id
+            return commit.id
+
+    def changeElements(self, project, count, seed=0):
+        # commits new names for count elements of the head, e.g. to measure incremental loading
+        with self.lock:
+            commit = self.commits[self.projects[project]['head']]
+            ids = random.Random(seed).sample(commit.ids, min(count, len(commit.ids)))
+            changes = [{'@type': 'DataVersion', 'identity': {'@id': id},
+                        'payload': dict(commit.elements[id], declaredName=f"changed {i}")} for i, id in enumerate(ids)]
+        return self.addCommit(project, changes)
+
+    def head(self, project):
+        return self.projects[project]['head']
+
+    def handle(self, method, url, body):
+        parts = [p for p in url.path.split('/') if p]
+        query = parse_qs(url.query)
+        if not parts or parts[0] != 'projects':
+            return notFound()
+        with self.lock:
+            if len(parts) == 1:
+                return 200, {}, encode([p['data'] for p in self.projects.values()])
+            project = self.projects.get(parts[1])
+            if project is None:
+                return notFound()
+            if len(parts) == 2:
+                if method == "DELETE":
+                    del self.projects[parts[1]]
+                    return 204, {}, b""
+                return 200, {}, encode(project['data'])
+            if parts[2] == 'branches' and len(parts) == 3:
+                return 200, {}, encode([{'@id': project['branch'], '@type': 'Branch', 'name': 'main',
+                                         'head': {'@id': project['head']}}])
+            if parts[2] == 'query-results' and method == "POST":
+                commit = self.commits.get(query.get('commitId', [project['head']])[0])
+                if commit is None:
+                    return notFound()
+                ids = self.query(commit, json.loads(body)['where'])
+                return self.page(url, query, ids, {id: i for i, id in enumerate(ids)}, commit.element)
+            if parts[2] == 'commits' and len(parts) == 3 and method == "POST":
+                id = self.addCommit(parts[1], json.loads(body).get('change') or [])
+                return 200, {}, encode({'@id': id, '@type': 'Commit', 'previousCommit': [{'@id': self.commits[id].previous}]})
+            commit = self.commits.get(parts[3]) if parts[2] == 'commits' and len(parts) > 3 else None
+            if commit is None:
+                return notFound()
+        if len(parts) == 4:
+            return 200, {}, encode({'@id': commit.id, '@type': 'Commit',
+                                    'previousCommit': [{'@id': commit.previous}] if commit.previous else []})
+        if parts[4] == 'elements' and len(parts) == 6:
+            if parts[5] not in commit.elements:
+                return notFound()
+            return 200, {}, commit.element(parts[5])
+        if parts[4] == 'elements' and len(parts) == 5:
+            return self.page(url, query, commit.ids, commit.positions, commit.element)
+        if parts[4] == 'changes' and len(parts) == 5:
+            return self.page(url, query, commit.changeIds, commit.changePositions, commit.change)
+        return notFound()
+
+    def page(self, url, query, ids, positions, encodeItem):
+        # a page of the items after the cursor page[after], the link to the next page has the last id as cursor
+        # and the commitId of a query
+        size = int(query.get('page[size]', [DEFAULT_PAGE_SIZE])[0])
+        after = query.get('page[after]', [None])[0]
+        start = positions[after] + 1 if after in positions else 0
+        pageIds = ids[start:start + size]
+        headers = {}
+        if start + size < len(ids):
+            commit = f"&commitId={query['commitId'][0]}" if 'commitId' in query else ""
+            headers['Link'] = f'<{self.url}{url.path}?page%5Bsize%5D={size}&page%5Bafter%5D={pageIds[-1]}{commit}>; rel="next"'
+        return 200, headers, b"[" + b",".join(encodeItem(id) for id in pageIds) + b"]"
+
+    def query(self, commit, constraint):
+        # the ids of the elements of the commit that match the constraint, disjunctions of ids are looked up directly
+        if constraint.get('@type') == 'CompositeConstraint' and constraint.get('operator') == 'or' and all(
+                c.get('@type') == 'PrimitiveConstraint' and c.get('property') == '@id' and not c.get('inverse')
+                for c in constraint['constraint']):
+            return list(dict.fromkeys(c['value'] for c in constraint['constraint'] if c['value'] in commit.elements))
+        return [id for id, element in commit.elements.items() if matches(element, constraint)]
+
+
+def matches(element, constraint):
+    if constraint['@type'] == 'CompositeConstraint':
+        results = (matches(element, c) for c in constraint['constraint'])
+        return all(results) if constraint['operator'] == 'and' else any(results)
+    value = element.get(constraint['property'])
+    if isinstance(value, dict):
+        value = value.get('@id')
+    result = value == constraint['value'] if constraint.get('operator', '=') == '=' else False
+    return result != bool(constraint.get('inverse'))
+
+
+NUMBER_OF_ITEMS = "01846770-4cfe-4a25-8ad9-919d8d378345" # the flow property of the product flows, see openLCAAPI
+
+
+class FakeOpenLCAServer(FakeServer):
+
+    def __init__(self, faults=None):
+        super().__init__(faults)
+        self.entities = {} # @type -> {@id: entity as JSON}
+        self.version = 0
+
+    def failure(self):
+        return 200, {}, encode({'jsonrpc': '2.0', 'id': None, 'error': {'code': 503, 'message': 'injected fault'}})
+
+    def store(self, entity):
+        with self.lock:
+            self.version += 1
+            entity['lastChange'] = f"2024-01-01T00:00:{self.version:06d}Z"
+            self.entities.setdefault(entity['@type'], {})[entity['@id']] = entity
+
+    def addFlows(self, ids, tags=('sysml',)):
+        # elementary flows measured in kg with the ids, and the flow property of the product flows
+        massUnits = {'@type': 'UnitGroup', '@id': str(uuid.uuid4()), 'name': 'Units of mass',
+                     'units': [{'@type': 'Unit', '@id': str(uuid.uuid4()), 'name': 'kg', 'isRefUnit': True, 'conversionFactor': 1.0}]}
+        itemUnits = {'@type': 'UnitGroup', '@id': str(uuid.uuid4()), 'name': 'Units of items',
+                     'units': [{'@type': 'Unit', '@id': str(uuid.uuid4()), 'name': 'Item(s)', 'isRefUnit': True, 'conversionFactor': 1.0}]}
+        mass = {'@type': 'FlowProperty', '@id': str(uuid.uuid4()), 'name': 'Mass', 'flowPropertyType': 'PHYSICAL_QUANTITY',
+                'unitGroup': {'@type': 'UnitGroup', '@id': massUnits['@id'], 'name': massUnits['name']}}
+        items = {'@type': 'FlowProperty', '@id': NUMBER_OF_ITEMS, 'name': 'Number of items', 'flowPropertyType': 'PHYSICAL_QUANTITY',
+                 'unitGroup': {'@type': 'UnitGroup', '@id': itemUnits['@id'], 'name': itemUnits['name']}}
+        for entity in (massUnits, itemUnits, mass, items):
+            self.store(entity)
+        for i, id in enumerate(ids):
+            self.store({'@type': 'Flow', '@id': id, 'name': f"flow {i}", 'flowType': 'ELEMENTARY_FLOW', 'tags': list(tags),
+                        'flowProperties': [{'@type': 'FlowPropertyFactor', 'isRefFlowProperty': True, 'conversionFactor': 1.0,
+                                            'flowProperty': {'@type': 'FlowProperty', '@id': mass['@id'], 'name': 'Mass', 'refUnit': 'kg'}}]})
+
+    def removeAll(self, type):
+        # e.g. the processes of a previous synchronization
+        with self.lock:
+            return len(self.entities.pop(type, {}))
+
+    def getAll(self, type):
+        with self.lock:
+            return list(self.entities.get(type, {}).values())
+
+    def find(self, params):
+        entities = self.entities.get(params.get('@type'), {})
+        if params.get('@id'):
+            return entities.get(params['@id'])
+        return next((e for e in entities.values() if e.get('name') == params.get('name')), None)
+
+    def handle(self, method, url, body):
+        request = json.loads(body)
+        try:
+            result = self.call(request.get('method'), request.get('params') or {})
+            response = {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+        except LookupError as e:
+            response = {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': e.args[0], 'message': e.args[1]}}
+        return 200, {}, encode(response)
+
+    def call(self, method, params):
+        # raises LookupError(code, message) for JSON-RPC errors
+        with self.lock:
+            if method == 'data/get':
+                entity = self.find(params)
+                if entity is None:
+                    raise LookupError(404, f"{params.get('@type')} {params.get('@id') or params.get('name')} not found")
+                return entity
+            if method == 'data/get/all':
+                return list(self.entities.get(params.get('@type'), {}).values())
+            if method == 'data/get/descriptors':
+                return [descriptor(e) for e in self.entities.get(params.get('@type'), {}).values()]
+            if method == 'data/get/descriptor':
+                entity = self.find(params)
+                if entity is None:
+                    raise LookupError(404, f"{params.get('@type')} {params.get('@id') or params.get('name')} not found")
+                return descriptor(entity)
+            if method == 'data/put':
+                self.store(params)
+                return descriptor(params)
+            if method == 'data/delete':
+                entity = self.entities.get(params.get('@type'), {}).pop(params.get('@id'), None)
+                if entity is None:
+                    raise LookupError(404, f"{params.get('@type')} {params.get('@id')} not found")
+                return descriptor(entity)
+        raise LookupError(-32601, f"method {method} not found")
+
+
+def descriptor(entity):
+    # the Ref of an entity as openLCA returns it
+    result = {key: entity[key] for key in ('@type', '@id', 'name', 'category', 'flowType', 'processType') if entity.get(key) is not None}
+    for factor in entity.get('flowProperties') or []:
+        if factor.get('isRefFlowProperty') and factor.get('flowProperty', {}).get('refUnit'):
+            result['refUnit'] = factor['flowProperty']['refUnit']
+    return result
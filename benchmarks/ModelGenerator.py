@@ -0,0 +1,192 @@
+# synthetic SysML v2 models as the element JSON of the API, for benchmarks
+# The models use the LCA library like the models of SysMLLCAModel: the metadata definitions LCA-Part,
+# LCA-Exchange, LCA-Flow and ExternalRef, flows with an openLCA uuid, part definitions with exchanges that
+# subset the flows and part usages with multiplicities that form the part hierarchy. The values of the
+# exchanges are rationals, negated integers and rationals with a unit, as written in the SysML text.
+# The generator is seeded, so a configuration always yields the same model.
+
+import random
+import uuid
+
+# derived properties the API returns for every element, most of them empty (realistic=True)
+DERIVED_FLAGS = ('isAbstract', 'isSufficient', 'isComposite', 'isConjugated', 'isDerived', 'isEnd', 'isOrdered',
+                 'isPortion', 'isReadOnly', 'isUnique', 'isVariation', 'isReference', 'isIndividual', 'isImplied')
+DERIVED_VALUES = ('direction', 'endOwningType', 'crossFeature', 'featureTarget', 'ownedConjugator',
+                  'individualDefinition', 'portionKind', 'ownedCrossSubsetting', 'namingFeature', 'owningUsage')
+DERIVED_LISTS = ('ownedImport', 'ownedDisjoining', 'ownedDifferencing', 'ownedIntersecting', 'ownedUnioning',
+                 'inheritedFeature', 'ownedEndFeature', 'chainingFeature', 'ownedRedefinition',
+                 'ownedReferenceSubsetting', 'ownedTypeFeaturing', 'directedUsage', 'nestedAction', 'nestedState')
+EMPTY_PROPERTIES = ('declaredShortName', 'documentation', 'aliasIds', 'isImpliedIncluded', 'textualRepresentation',
+                    'ownedAnnotation', 'shortName')
+
+
+class ModelGenerator:
+
+    def __init__(self, seed=0, lcaParts=None, reuse=0.3, multiplicity=0.7):
+        # lcaParts: number of part definitions with LCA-Part metadata, None: 70 % of them
+        # reuse: probability that a subpart is typed by an existing part definition instead of a new one
+        # multiplicity: probability that a part usage has a multiplicity
+        self.random = random.Random(seed)
+        self.elements = {}
+        self.lcaParts = lcaParts
+        self.reuse = reuse
+        self.multiplicity = multiplicity
+        self.annotatedParts = 0
+        self.definitions = []
+        self.package = self.newElement('Package', declaredName='Model')
+        self.metadataDefinitions = {}
+        for name in ('LCA-Part', 'LCA-Exchange', 'LCA-Flow', 'ExternalRef'):
+            self.metadataDefinitions[name] = self.newElement('MetadataDefinition', declaredName=name)
+            self.own(self.package, 'OwningMembership', self.metadataDefinitions[name])
+        self.flows = []
+        self.unit = self.newElement('AttributeUsage', declaredName='kilogram', declaredShortName='kg')
+        self.own(self.package, 'OwningMembership', self.unit)
+
+    def newId(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+    def newElement(self, elementType, **properties):
+        element = {'@id': self.newId(), '@type': elementType}
+        for key in EMPTY_PROPERTIES:
+            element[key] = None
+        element['ownedRelationship'] = []
+        element['isLibraryElement'] = False
+        element.update(properties)
+        self.elements[element['@id']] = element
+        return element
+
+    def own(self, owner, relationshipType, target, owning=True):
+        # owning=False: a membership that only references the target, e.g. the unit of a value
+        relationship = self.newElement(relationshipType, owningRelatedElement={'@id': owner['@id']},
+                                       source={'@id': owner['@id']}, target={'@id': target['@id']},
+                                       memberName=target.get('declaredName'))
+        if owning:
+            target['owningRelationship'] = {'@id': relationship['@id']}
+            target['owner'] = {'@id': owner['@id']}
+        owner['ownedRelationship'].append({'@id': relationship['@id']})
+        return relationship
+
+    def typing(self, feature, type):
+        typing = self.newElement('FeatureTyping', type={'@id': type['@id']}, typedFeature={'@id': feature['@id']},
+                                 owningRelatedElement={'@id': feature['@id']})
+        feature['ownedRelationship'].append({'@id': typing['@id']})
+        feature.setdefault('type', []).append({'@id': type['@id']})
+        return typing
+
+    def metadata(self, element, name):
+        usage = self.newElement('MetadataUsage', declaredName=None)
+        self.own(element, 'OwningMembership', usage)
+        self.typing(usage, self.metadataDefinitions[name])
+        return usage
+
+    def addFlows(self, count):
+        # attributes with LCA-Flow metadata and the uuid of an openLCA flow
+        for i in range(count):
+            flow = self.newElement('AttributeUsage', declaredName=f'flow{len(self.flows)}')
+            self.own(self.package, 'OwningMembership', flow)
+            usage = self.metadata(flow, 'LCA-Flow')
+            reference = self.newElement('ReferenceUsage', declaredName='uuid')
+            self.own(usage, 'FeatureMembership', reference)['memberName'] = 'uuid'
+            self.own(reference, 'FeatureValue', self.newElement('LiteralString', value=self.newId()))
+            self.flows.append(flow)
+
+    def addValue(self, attribute):
+        # 40 % rationals, 20 % negated integers, 40 % rationals with a unit
+        kind = self.random.random()
+        if kind < 0.4:
+            value = self.newElement('LiteralRational', value=round(self.random.uniform(0.1, 10), 3))
+        elif kind < 0.6:
+            value = self.newElement('OperatorExpression', operator='-')
+            self.addArgument(value, self.newElement('LiteralInteger', value=self.random.randint(1, 9)))
+        else:
+            value = self.newElement('OperatorExpression', operator='[')
+            self.addArgument(value, self.newElement('LiteralRational', value=round(self.random.uniform(0.1, 10), 3)))
+            unitReference = self.newElement('FeatureReferenceExpression')
+            self.own(unitReference, 'Membership', self.unit, owning=False)
+            self.addArgument(value, unitReference)
+        self.own(attribute, 'FeatureValue', value)
+
+    def addArgument(self, expression, argument):
+        parameter = self.newElement('Feature')
+        self.own(expression, 'ParameterMembership', parameter)
+        self.own(parameter, 'FeatureValue', argument)
+
+    def addExchange(self, part, index):
+        exchange = self.newElement('AttributeUsage', declaredName=f'x{index}')
+        self.own(part, 'FeatureMembership', exchange)
+        self.metadata(exchange, 'LCA-Exchange')
+        flow = self.random.choice(self.flows)
+        subsetting = self.newElement('Subsetting', subsettedFeature={'@id': flow['@id']},
+                                     owningRelatedElement={'@id': exchange['@id']})
+        exchange['ownedRelationship'].append({'@id': subsetting['@id']})
+        self.addValue(exchange)
+
+    def addPartDefinition(self, level, depth, fanout, name):
+        # a part definition with 1-4 exchanges and, above depth, fanout subparts
+        part = self.newElement('PartDefinition', declaredName=name, ownedPart=[])
+        self.own(self.package, 'OwningMembership', part)
+        annotate = self.random.random() < 0.7 if self.lcaParts is None else self.annotatedParts < self.lcaParts
+        if annotate:
+            self.metadata(part, 'LCA-Part')
+            self.annotatedParts += 1
+        for i in range(self.random.randint(1, 4)):
+            self.addExchange(part, i)
+        if level < depth:
+            for j in range(fanout):
+                if self.definitions and self.random.random() < self.reuse:
+                    child = self.random.choice(self.definitions)
+                else:
+                    child = self.addPartDefinition(level + 1, depth, fanout, f'{name}.{j}')
+                usage = self.newElement('PartUsage', declaredName=f'sub{j}', multiplicity=None)
+                self.own(part, 'FeatureMembership', usage)
+                self.typing(usage, child)
+                part['ownedPart'].append({'@id': usage['@id']})
+                if self.random.random() < self.multiplicity:
+                    multiplicity = self.newElement('MultiplicityRange')
+                    bound = self.newElement('LiteralInteger', value=self.random.randint(1, 4))
+                    self.own(multiplicity, 'OwningMembership', bound)
+                    multiplicity['lowerBound'] = multiplicity['upperBound'] = {'@id': bound['@id']}
+                    usage['multiplicity'] = {'@id': multiplicity['@id']}
+        self.definitions.append(part)
+        return part
+
+    def addDerivedProperties(self):
+        # the properties the API derives from the owned relationships
+        qualifiedNames = {}
+
+        def qualifiedName(element):
+            if element['@id'] not in qualifiedNames:
+                name = element.get('declaredName')
+                owner = self.elements.get((element.get('owner') or {}).get('@id'))
+                prefix = qualifiedName(owner) if owner else None
+                qualifiedNames[element['@id']] = None if name is None else f"{prefix}::{name}" if prefix else name
+            return qualifiedNames[element['@id']]
+
+        for element in self.elements.values():
+            element['elementId'] = element['@id']
+            element['name'] = element.get('declaredName')
+            element['qualifiedName'] = qualifiedName(element)
+            for key in DERIVED_FLAGS:
+                element.setdefault(key, False)
+            for key in DERIVED_VALUES:
+                element.setdefault(key, None)
+            for key in DERIVED_LISTS:
+                element.setdefault(key, [])
+            element['ownedElement'] = list(element['ownedRelationship'])
+            element['owningNamespace'] = element.get('owner')
+
+
+def generateModel(size=10000, depth=3, fanout=3, lcaParts=None, flows=20, seed=0, realistic=True):
+    # returns the elements of a model with at least size elements, hierarchies of part definitions
+    # with the depth and fanout are added until the size is reached (e.g. 1 000 to 1 000 000 elements)
+    # lcaParts: number of part definitions with LCA-Part metadata, None: 70 % of them
+    # realistic: add the derived properties of the API, which make the elements about three times larger
+    generator = ModelGenerator(seed, lcaParts)
+    generator.addFlows(flows)
+    i = 0
+    while len(generator.elements) < size:
+        generator.addPartDefinition(1, depth, fanout, f'P{i}')
+        i += 1
+    if realistic:
+        generator.addDerivedProperties()
+    return list(generator.elements.values())
@@ -0,0 +1,184 @@
+# microbenchmarks of the model layer on synthetic models of ModelGenerator
+# Each size is measured in the phases of opening a project: parse (decoding the JSON of the API like
+# SysMLAPI.getPages), load (SysMLModel.loadElements), index (buildIndexes), metadata (getElementsWithMetadata),
+# metachain (getMetaChain of the attributes and typings of all part definitions), rollup (computeLCAParts),
+# matrix (InventoryMatrix), html (writeHTML) and search (searchElements, the first search builds the search index).
+# The time is the best of --repeat runs, the memory is the peak allocated by the phase on top of what
+# was allocated before, measured in a separate run with tracemalloc. With --compact each size is also
+# measured with the elements in a CompactElementStore (compact=True), reported as <size>/compact.
+#
+#   python benchmarks/benchmark.py --sizes 1000,10000,100000 --compact --compare default
+#   python benchmarks/benchmark.py --sizes 1000,10000,100000 --compact --save default
+#
+# Baselines are stored in benchmarks/baselines/<name>.json. --compare reports the ratio to the baseline
+# and exits with 1 if a phase became slower than --threshold times its baseline by more than NOISE_SECONDS,
+# so the jitter of phases that take only milliseconds is not reported. Timings depend on the machine,
+# so compare only with baselines recorded on the same machine.
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+_here = Path(__file__).resolve().parent
+sys.path.insert(0, str(_here.parent / "src"))
+
+from ModelGenerator import generateModel
+from SysMLAPI import CHUNK_SIZE, SharedValues, iterJSONArray
+from SysMLwithLCA import SysMLLCAModel
+from InventoryMatrix import InventoryMatrix
+
+BASELINE_DIR = _here / "baselines"
+PHASES = ("parse", "load", "index", "metadata", "metachain", "rollup", "matrix", "html", "search")
+NOISE_SECONDS = 0.01 # slowdowns by less than this compared to the baseline are not reported as regressions
+SEARCH_QUERIES = ("P1", "sub", "flow1", "type:PartDefinition P", "x0 type:AttributeUsage")
+
+
+def chunks(data):
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+def runPhases(data, measure, compact=False):
+    # runs the phases on the JSON data of a model, measure(phase) is a context manager around each phase
+    with measure("parse"):
+        shared = SharedValues()
+        elements = [shared.element(element) for element in iterJSONArray(chunks(data))]
+    model = SysMLLCAModel.fromElements([], name="benchmark", compact=compact)
+    with measure("load"):
+        model.loadElements(elements)
+    del elements
+    with measure("index"):
+        model.buildIndexes()
+        model.findLCAMetadata()
+    with measure("metadata"):
+        model.getElementsWithMetadata("PartDefinition", model.LCAPartId)
+        model.getElementsWithMetadata("AttributeUsage", model.ExchangeId)
+        model.getElementsWithMetadata("AttributeUsage", model.FlowId)
+    parts = list(model.getElementsOfType("PartDefinition").values())
+    model.metaChainCache = {}
+    with measure("metachain"):
+        for part in parts:
+            model.getMetaChain(part, model.OWNED_ATTRIBUTES)
+            model.getMetaChain(part, model.FEATURE_TYPINGS)
+    model.metaChainCache = {}
+    with measure("rollup"):
+        model.computeLCAParts()
+    with measure("matrix"):
+        InventoryMatrix.fromModel(model).getLCAParts()
+    with measure("html"):
+        model.writeHTML(io.StringIO())
+    with measure("search"):
+        for query in SEARCH_QUERIES:
+            model.searchElements(query)
+
+
+def benchmark(size, repeat, depth, fanout, lcaParts, flows, seed, compact=False):
+    # returns {phase: {'seconds': best time, 'peakMB': peak memory}} for a model of the size
+    elements = generateModel(size, depth, fanout, lcaParts, flows, seed)
+    count = len(elements)
+    data = json.dumps(elements).encode("utf-8")
+    del elements
+    seconds = {}
+
+    @contextlib.contextmanager
+    def timed(phase):
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        seconds[phase] = min(seconds.get(phase, duration), duration)
+
+    peaks = {}
+
+    @contextlib.contextmanager
+    def traced(phase):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        yield
+        peaks[phase] = (tracemalloc.get_traced_memory()[1] - before) / 1e6
+
+    # the model prints warnings and progress, which would be measured as well
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            runPhases(data, timed, compact)
+        tracemalloc.start()
+        try:
+            runPhases(data, traced, compact)
+        finally:
+            tracemalloc.stop()
+    return {"elements": count, "bytes": len(data),
+            "phases": {phase: {"seconds": seconds[phase], "peakMB": peaks[phase]} for phase in PHASES}}
+
+
+def compare(results, baseline, threshold):
+    # prints the ratios to the baseline, returns the regressions [(size, phase, ratio), ...]
+    regressions = []
+    for size, result in results.items():
+        base = baseline["results"].get(size)
+        if base is None:
+            print(f"{size:>15}: no baseline")
+            continue
+        for phase in PHASES:
+            if phase not in base["phases"]:
+                continue
+            seconds, baseSeconds = result["phases"][phase]["seconds"], base["phases"][phase]["seconds"]
+            ratio = seconds / max(baseSeconds, 1e-9)
+            memoryRatio = result["phases"][phase]["peakMB"] / max(base["phases"][phase]["peakMB"], 1e-9)
+            slower = ratio > threshold and seconds - baseSeconds > NOISE_SECONDS
+            if slower:
+                regressions.append((size, phase, ratio))
+            print(f"{size:>15} {phase:<10} time x{ratio:5.2f}  memory x{memoryRatio:5.2f}{'  SLOWER' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the model layer on synthetic models.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="numbers of elements, comma separated (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per size, the best time is reported (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=3, help="depth of the part hierarchies (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=3, help="subparts per part definition (default: %(default)s)")
+    parser.add_argument("--lca-parts", type=int, default=None, help="part definitions with LCA-Part metadata (default: 70 %%)")
+    parser.add_argument("--flows", type=int, default=20, help="number of LCA flows (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true", help="also measure each size with compact=True, reported as <size>/compact")
+    parser.add_argument("--save", metavar="NAME", help="store the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="compare the results with baseline NAME")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown reported as regression (default: %(default)s)")
+    arguments = parser.parse_args(argv)
+
+    config = {"depth": arguments.depth, "fanout": arguments.fanout, "lcaParts": arguments.lca_parts,
+              "flows": arguments.flows, "seed": arguments.seed}
+    results = {}
+    print(f"{'size':>15} {'phase':<10} {'seconds':>9} {'peak MB':>9}")
+    variants = (False, True) if arguments.compact else (False,)
+    for size in (int(s) for s in arguments.sizes.split(",")):
+        for compact in variants:
+            name = f"{size}/compact" if compact else str(size)
+            result = benchmark(size, max(1, arguments.repeat), arguments.depth, arguments.fanout,
+                               arguments.lca_parts, arguments.flows, arguments.seed, compact)
+            results[name] = result
+            for phase in PHASES:
+                print(f"{name:>15} {phase:<10} {result['phases'][phase]['seconds']:9.4f} {result['phases'][phase]['peakMB']:9.1f}")
+
+    status = 0
+    if arguments.compare:
+        baseline = json.loads((BASELINE_DIR / f"{arguments.compare}.json").read_text(encoding="utf-8"))
+        if baseline.get("config") != config:
+            print(f"warning: baseline {arguments.compare} was recorded with {baseline.get('config')}")
+        if compare(results, baseline, arguments.threshold):
+            status = 1
+    if arguments.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        baseline = {"config": config, "python": platform.python_version(), "machine": platform.platform(),
+                    "results": results}
+        (BASELINE_DIR / f"{arguments.save}.json").write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# end-to-end benchmarks of loading and synchronizing a project against the local servers of FakeServers
+# A synthetic model of ModelGenerator is served by FakeSysMLServer and its flows by FakeOpenLCAServer, both with the
+# latency, bandwidth and error rate of the arguments. The scenarios show the effect of
+# - connection pooling: loading with a pool of 1 and of --pool connections (SysMLAPI.getClient)
+# - caching: loading from the element cache, loading only the changes of a commit, a warm flow cache for the sync
+# - concurrency: the LCA subset with concurrent id queries, the sync with --workers concurrent requests
+# - errors: loading and synchronizing with --error-rate failed requests
+# Every scenario reports its time and the requests, new connections, bytes and errors seen by the servers.
+#
+#   python benchmarks/endtoend.py --size 10000 --latency 0.005
+#   python benchmarks/endtoend.py --size 100000 --latency 0.02 --bandwidth 10 --json results.json
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+_here = Path(__file__).resolve().parent
+sys.path.insert(0, str(_here.parent / "src"))
+
+from FakeServers import FakeOpenLCAServer, FakeSysMLServer, FaultInjection
+from ModelGenerator import generateModel
+from ElementCache import PickleElementCache
+from SysMLAPI import POOL_SIZE, closeClient, getClient, setCache
+from SysMLwithLCA import SysMLLCAModel
+from openLCAAPI import openLCAServer
+
+CHANGED_SHARE = 0.01 # share of the elements changed by the commit of the incremental load
+
+
+class Benchmark:
+
+    def __init__(self, arguments, sysml, openLCA, cacheDirectory):
+        self.arguments = arguments
+        self.sysml = sysml
+        self.openLCA = openLCA
+        self.cacheDirectory = cacheDirectory
+        self.results = []
+        self.parts = None
+
+    def measure(self, name, function):
+        # runs the scenario and prints its line, function returns a short note on the result
+        for server in (self.sysml, self.openLCA):
+            server.resetStats()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            # the model prints its progress, which would be mixed into the table
+            with contextlib.redirect_stdout(io.StringIO()):
+                note = function()
+        except Exception as e:
+            status = "failed"
+            note = str(e)
+        seconds = time.perf_counter() - start
+        stats = Counter(self.sysml.resetStats()) + Counter(self.openLCA.resetStats())
+        result = {"scenario": name, "status": status, "seconds": seconds, "requests": stats["requests"],
+                  "connections": stats["connections"], "MB": stats["bytes"] / 1e6, "errors": stats["errors"], "note": note}
+        self.results.append(result)
+        print(f"{name:<28} {seconds:8.3f} {result['requests']:9} {result['connections']:6} {result['MB']:8.1f} "
+              f"{result['errors']:6}  {'' if status == 'ok' else status + ': '}{note}")
+        return result
+
+    def newCache(self, name):
+        # an empty element cache, so the next load downloads all elements
+        setCache(PickleElementCache(self.cacheDirectory / name))
+
+    def load(self, project, poolSize, lcaSubset=False):
+        closeClient(self.sysml.url)
+        getClient(self.sysml.url, poolSize)
+        model = SysMLLCAModel(self.sysml.url, project, lcaSubset=lcaSubset)
+        if self.parts is None:
+            self.parts = model.computeLCAParts()
+        return f"{len(model.theModel)} elements"
+
+    def sync(self, project, server, workers, clear=True):
+        # clear: remove the processes of the previous sync, so all processes are created
+        if clear:
+            self.openLCA.removeAll("Process")
+        report = server.syncProcesses(project, self.parts, workers)
+        actions = Counter(r["action"] for r in report["results"] if not r["error"])
+        failed = sum(1 for r in report["results"] if r["error"])
+        stored = len(self.openLCA.getAll("Process"))
+        return (", ".join(f"{count} {action}" for action, count in sorted(actions.items()))
+                + (f", {failed} failed" if failed else "") + f", {stored} stored")
+
+    def run(self, elements):
+        arguments = self.arguments
+        pool = arguments.pool
+        project = self.sysml.addProject(elements, name="benchmark")
+        print(f"{'scenario':<28} {'seconds':>8} {'requests':>9} {'conns':>6} {'MB':>8} {'errors':>6}  result")
+
+        self.newCache("pool1")
+        self.measure("load, pool 1", lambda: self.load(project, 1))
+        self.newCache(f"pool{pool}")
+        self.measure(f"load, pool {pool}", lambda: self.load(project, pool))
+        self.measure("load, cached", lambda: self.load(project, pool))
+        self.sysml.changeElements(project, max(1, int(len(elements) * CHANGED_SHARE)), arguments.seed)
+        self.measure("load, changes of a commit", lambda: self.load(project, pool))
+        self.measure("lca subset, pool 1", lambda: self.load(project, 1, lcaSubset=True))
+        self.measure(f"lca subset, pool {pool}", lambda: self.load(project, pool, lcaSubset=True))
+
+        self.openLCA.addFlows(sorted({uuid for uuid in SysMLLCAModel.fromElements(elements).getFlows().values() if uuid}))
+        server = None
+        for workers in arguments.workers:
+            server = openLCAServer(self.openLCA.url)
+            self.measure(f"sync, {workers} workers", lambda: self.sync(project, server, workers))
+        self.measure("sync, warm flow cache", lambda: self.sync(project, server, arguments.workers[-1]))
+        self.measure("sync, unchanged", lambda: self.sync(project, server, arguments.workers[-1], clear=False))
+
+        if arguments.error_rate > 0:
+            for fake in (self.sysml, self.openLCA):
+                fake.faults.errorRate = arguments.error_rate
+            self.newCache("errors")
+            self.measure("load, errors", lambda: self.load(project, pool))
+            self.measure("lca subset, errors", lambda: self.load(project, pool, lcaSubset=True))
+            server = openLCAServer(self.openLCA.url)
+            self.measure("sync, errors", lambda: self.sync(project, server, arguments.workers[-1]))
+        closeClient(self.sysml.url)
+        return self.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks of loading and synchronizing against local fake servers.")
+    parser.add_argument("--size", type=int, default=10000, help="number of elements of the model (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every request (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="MB per second of a response (default: unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.05,
+                        help="share of failed requests in the error scenarios, 0 skips them (default: %(default)s)")
+    parser.add_argument("--pool", type=int, default=POOL_SIZE, help="connections of the pooled scenarios (default: %(default)s)")
+    parser.add_argument("--workers", default="1,4,8", help="concurrent requests of the sync scenarios, comma separated (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="write the results as JSON to the file")
+    arguments = parser.parse_args(argv)
+    arguments.workers = [int(w) for w in arguments.workers.split(",")]
+    if arguments.pool < 1 or min(arguments.workers) < 1:
+        parser.error("--pool and --workers must be at least 1")
+
+    elements = generateModel(arguments.size, seed=arguments.seed)
+    # olca_ipc logs every failed call, the failures are counted in the table instead
+    logging.disable(logging.ERROR)
+    bandwidth = arguments.bandwidth * 1e6 if arguments.bandwidth else None
+    with tempfile.TemporaryDirectory() as directory, \
+            FakeSysMLServer(FaultInjection(arguments.latency, bandwidth, seed=arguments.seed)) as sysml, \
+            FakeOpenLCAServer(FaultInjection(arguments.latency, bandwidth, seed=arguments.seed)) as openLCA:
+        results = Benchmark(arguments, sysml, openLCA, Path(directory)).run(elements)
+    if arguments.json:
+        config = {key: value for key, value in vars(arguments).items() if key != "json"}
+        Path(arguments.json).write_text(json.dumps({"config": config, "elements": len(elements), "results": results}, indent=2),
+                                        encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
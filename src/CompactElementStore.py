@@ -0,0 +1,203 @@
+# memory-compact storage for the elements of a model
+# CompactElementStore is a drop-in replacement for the dictionary {id: element} of SysMLModel.theModel.
+# - ids are stored once and references {'@id': ...} are stored as integer indices into the list of ids
+# - elements with equal @type and equal keys share one Shape, which holds the keys and the @type
+# - None and [] values are only recorded in the shape, not in the element
+# - each element is a CompactElement with __slots__ that behaves like a read-only dictionary
+# References are returned as one shared dictionary {'@id': ...} per id, they must not be changed.
+# A CompactElement is a Mapping and no dict, so json.dumps does not accept it: serialize element.toDict().
+# Metachain traversals resolve the references with resolve() and are as fast as with a dictionary of dictionaries.
+# Deviation: other accesses of values are a Python call that decodes the value, e.g. computeLCAParts reads the
+# values of the exchanges this way and is about 1.2x slower than with dictionaries. So the store is optional.
+
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+# kinds of values
+_ID, _TYPE, _NONE, _EMPTY, _VALUE, _REFERENCE, _REFERENCES = range(7)
+
+
+def isReference(value):
+    return isinstance(value, dict) and len(value) == 1 and '@id' in value
+
+
+class Shape:
+    # keys, @type and the kinds of the values of elements with the same structure
+    __slots__ = ('type', 'keys', 'positions')
+
+    def __init__(self, type, keys, kinds):
+        self.type = type
+        self.keys = keys
+        # key -> (kind, position in CompactElement.fields)
+        self.positions = {}
+        position = 0
+        for key, kind in zip(keys, kinds):
+            if kind in (_VALUE, _REFERENCE, _REFERENCES):
+                self.positions[key] = (kind, position)
+                position += 1
+            else:
+                self.positions[key] = (kind, -1)
+
+
+class CompactElement(Mapping):
+    # the stored values are called fields, values() is the method of Mapping
+    __slots__ = ('store', 'number', 'shape', 'fields')
+
+    def __init__(self, store, number, shape, fields):
+        self.store = store
+        self.number = number
+        self.shape = shape
+        self.fields = fields
+
+    def get(self, key, default=None):
+        entry = self.shape.positions.get(key)
+        if entry is None:
+            return default
+        kind, position = entry
+        # ordered by frequency during traversals
+        if kind == _REFERENCES:
+            store = self.store
+            references = store.references
+            reference = store.reference
+            return [references[number] or reference(number) for number in self.fields[position]]
+        if kind == _REFERENCE:
+            number = self.fields[position]
+            return self.store.references[number] or self.store.reference(number)
+        if kind == _VALUE:
+            return self.fields[position]
+        if kind == _TYPE:
+            return self.shape.type
+        if kind == _ID:
+            return self.store.ids[self.number]
+        if kind == _EMPTY:
+            return []
+        return None
+
+    def resolve(self, key):
+        # the elements referenced by key as (True, element or None) or (True, [element or None, ...]) and
+        # (False, None) if the value of key is no reference, used by MetaChain.evaluate
+        entry = self.shape.positions.get(key)
+        if entry is not None:
+            kind, position = entry
+            if kind == _REFERENCES:
+                ids = self.store.ids
+                get = self.store.get
+                return True, [get(ids[number]) for number in self.fields[position]]
+            if kind == _REFERENCE:
+                return True, self.store.get(self.store.ids[self.fields[position]])
+        return False, None
+
+    def __getitem__(self, key):
+        if key == '@type': # the most frequent key of the traversals
+            return self.shape.type
+        if key not in self.shape.positions:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        return key in self.shape.positions
+
+    def __iter__(self):
+        return iter(self.shape.keys)
+
+    def __len__(self):
+        return len(self.shape.keys)
+
+    def toDict(self):
+        # a plain dictionary, e.g. for json.dumps, which does not accept a Mapping
+        return {key: self.get(key) for key in self.shape.keys}
+
+    def __reduce__(self):
+        # pickled as a plain dictionary, e.g. for the element cache
+        return (dict, (self.toDict(),))
+
+    def __repr__(self):
+        return repr(self.toDict())
+
+
+class CompactElementStore(MutableMapping):
+    # {id: CompactElement}, elements are added as dictionaries like the JSON of the API
+
+    def __init__(self, elements=()):
+        self.ids = []         # number -> id, also for referenced ids that are not in the store
+        self.numbers = {}     # id -> number
+        self.references = []  # number -> shared {'@id': id}, created on first use
+        self.shapes = {}      # (type, keys, kinds) -> Shape
+        self.elements = {}    # id -> CompactElement
+        self.get = self.elements.get # called for every step of a traversal, without the call of a method
+        for element in elements:
+            self[element['@id']] = element
+
+    def number(self, id):
+        number = self.numbers.get(id)
+        if number is None:
+            number = self.numbers[id] = len(self.ids)
+            self.ids.append(sys.intern(id))
+            self.references.append(None)
+        return number
+
+    def reference(self, number):
+        reference = self.references[number]
+        if reference is None:
+            reference = self.references[number] = {'@id': self.ids[number]}
+        return reference
+
+    def __setitem__(self, id, element):
+        if isinstance(element, CompactElement):
+            element = element.toDict()
+        keys = []
+        kinds = []
+        values = []
+        for key, value in element.items():
+            keys.append(key)
+            if key == '@id':
+                kinds.append(_ID)
+            elif key == '@type':
+                kinds.append(_TYPE)
+            elif value is None:
+                kinds.append(_NONE)
+            elif isinstance(value, list):
+                if not value:
+                    kinds.append(_EMPTY)
+                elif all(isReference(v) for v in value):
+                    kinds.append(_REFERENCES)
+                    values.append(array('i', [self.number(v['@id']) for v in value]))
+                else:
+                    kinds.append(_VALUE)
+                    values.append(value)
+            elif isReference(value):
+                kinds.append(_REFERENCE)
+                values.append(self.number(value['@id']))
+            else:
+                kinds.append(_VALUE)
+                values.append(value)
+        shapeKey = (element['@type'], tuple(keys), tuple(kinds))
+        shape = self.shapes.get(shapeKey)
+        if shape is None:
+            shape = self.shapes[shapeKey] = Shape(sys.intern(element['@type']), tuple(sys.intern(k) for k in keys), kinds)
+        self.elements[id] = CompactElement(self, self.number(id), shape, tuple(values))
+
+    def __getitem__(self, id):
+        return self.elements[id]
+
+    def __delitem__(self, id):
+        del self.elements[id]
+
+    def __iter__(self):
+        return iter(self.elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __contains__(self, id):
+        return id in self.elements
+
+    def keys(self):
+        return self.elements.keys()
+
+    def values(self):
+        return self.elements.values()
+
+    def items(self):
+        return self.elements.items()
@@ -0,0 +1,136 @@
+# the inventory of the LCA parts of a SysMLLCAModel as NumPy arrays
+# rows are the part definitions reachable from the LCA parts, columns are the LCA flows with their unit
+# - direct[i,k]: amount of flow k of the exchanges defined in part definition i itself
+# - composition: part definition parents[e] contains counts[e] times part definition children[e]
+#   (sparse, one entry per subpart, so large part hierarchies do not need a rows x rows matrix)
+# The total inventory T of all part definitions solves T = direct + C @ T with the composition matrix C.
+# The part hierarchy is acyclic, so T is computed level by level from the leaves with one vectorized
+# product per level. Changing counts or direct re-evaluates a variant without reading the model again.
+
+import numpy as np
+
+
+class InventoryMatrix:
+
+    def __init__(self, definitions, columns, direct, parents, children, counts, lcaParts, defined=None):
+        self.definitions = definitions # row -> part definition
+        self.rows = {d['@id']: row for row, d in enumerate(definitions)} # id -> row
+        self.columns = columns         # column -> {'id': external ref, 'name', 'flow': flow id, 'mRef': unit or None}
+        self.direct = direct
+        self.defined = direct != 0 if defined is None else defined # the entries with an exchange, also if its value is 0
+        self.parents = parents
+        self.children = children
+        self.counts = counts
+        self.lcaParts = lcaParts       # rows of the part definitions with LCA-Part metadata
+        self.levels = self.computeLevels()
+
+    @classmethod
+    def fromModel(cls, model):
+        flows = model.getFlows()
+        definitions = []
+        rows = {}
+        columns = []
+        columnIndex = {} # (flow id, unit id) -> column
+        entries = []     # (row, column, num)
+        edges = []       # (parent row, child row, count)
+        pending = []
+
+        def getRow(part):
+            row = rows.get(part['@id'])
+            if row is None:
+                row = rows[part['@id']] = len(definitions)
+                definitions.append(part)
+                pending.append(part)
+            return row
+
+        lcaParts = [getRow(part) for part in model.getElementsWithMetadata("PartDefinition", model.LCAPartId).values()]
+        while pending:
+            part = pending.pop()
+            row = rows[part['@id']]
+            for exchange in model.getOwnExchanges(part, flows):
+                value = exchange['value']
+                key = (exchange['flow'], value['mRef']['@id'] if value['mRef'] else None)
+                column = columnIndex.get(key)
+                if column is None:
+                    column = columnIndex[key] = len(columns)
+                    columns.append({'id': exchange['id'], 'name': exchange['name'], 'flow': exchange['flow'], 'mRef': value['mRef']})
+                entries.append((row, column, value['num']))
+            for count, partDefinition in model.getSubpartDefinitions(part):
+                edges.append((row, getRow(partDefinition), count))
+
+        direct = np.zeros((len(definitions), len(columns)))
+        defined = np.zeros(direct.shape, dtype=bool)
+        if entries:
+            entryRows, entryColumns, nums = zip(*entries)
+            entryRows, entryColumns = np.array(entryRows, dtype=np.intp), np.array(entryColumns, dtype=np.intp)
+            np.add.at(direct, (entryRows, entryColumns), np.array(nums, dtype=float))
+            defined[entryRows, entryColumns] = True
+        parents, children, counts = (np.array(a) for a in zip(*edges)) if edges else ([], [], [])
+        return cls(definitions, columns, direct,
+                   np.asarray(parents, dtype=np.intp), np.asarray(children, dtype=np.intp),
+                   np.asarray(counts, dtype=float), lcaParts, defined)
+
+    def computeLevels(self):
+        # groups the composition entries by the height of their parent in the part hierarchy
+        # returns [edge indices of height 1, of height 2, ...], a parent only depends on lower levels
+        rowCount = len(self.definitions)
+        childEdges = [[] for _ in range(rowCount)]
+        for e, parent in enumerate(self.parents.tolist()):
+            childEdges[parent].append(e)
+        height = [None] * rowCount
+        children = self.children.tolist()
+        for start in range(rowCount):
+            if height[start] is not None:
+                continue
+            # depth first without recursion, deep hierarchies would exceed the recursion limit
+            visiting = {start}
+            stack = [(start, 0)]
+            while stack:
+                row, position = stack[-1]
+                edgeList = childEdges[row]
+                if position < len(edgeList):
+                    stack[-1] = (row, position + 1)
+                    child = children[edgeList[position]]
+                    if child in visiting:
+                        raise Exception(f"Part definition {self.definitions[child].get('declaredName')} contains itself")
+                    if height[child] is None:
+                        visiting.add(child)
+                        stack.append((child, 0))
+                else:
+                    height[row] = 1 + max((height[children[e]] for e in edgeList), default=-1)
+                    visiting.discard(row)
+                    stack.pop()
+        levels = [[] for _ in range(max(height, default=0))]
+        for e, parent in enumerate(self.parents.tolist()):
+            levels[height[parent] - 1].append(e)
+        return [np.array(level, dtype=np.intp) for level in levels]
+
+    def compositionMatrix(self):
+        # the dense composition matrix C, C[i,j]: how often part definition i contains part definition j
+        result = np.zeros((len(self.definitions), len(self.definitions)))
+        np.add.at(result, (self.parents, self.children), self.counts)
+        return result
+
+    def totals(self, direct=None, counts=None):
+        # the total inventory of all part definitions including their subparts
+        # direct and counts replace self.direct and self.counts, e.g. to evaluate a variant
+        direct = self.direct if direct is None else direct
+        counts = self.counts if counts is None else counts
+        result = np.array(direct, dtype=float)
+        for level in self.levels:
+            np.add.at(result, self.parents[level], counts[level, None] * result[self.children[level]])
+        return result
+
+    def getLCAParts(self, totals=None):
+        # the totals of the LCA parts like SysMLLCAModel.getLCAParts, e.g. for openLCAServer.createProcess
+        # an exchange is listed if it occurs in the part or its subparts, even if its total is 0
+        totals = self.totals() if totals is None else totals
+        occurs = self.totals(direct=self.defined, counts=np.ones_like(self.counts)) > 0
+        result = []
+        for row in self.lcaParts:
+            part = self.definitions[row]
+            exchanges = [{'id': column['id'], 'name': column['name'], 'flow': column['flow'],
+                          'value': {'num': float(totals[row, k]), 'mRef': column['mRef']}}
+                         for k, column in enumerate(self.columns) if occurs[row, k]]
+            result.append({"id": part['@id'], "name": part['declaredName'], "exchanges": exchanges})
+        return result
@@ -0,0 +1,166 @@
+# virtualized browser for the elements of a SysMLModel in a QWebEngineView
+# The model stays in Python. The page only knows the number of elements and asks the ModelBridge through a
+# QWebChannel for the headers of the rows that are scrolled into view and for the details of the selected element.
+# So the first paint does not depend on the size of the model.
+
+import json
+from PyQt5.QtCore import QObject, QUrl, pyqtSlot
+from PyQt5.QtWebChannel import QWebChannel
+
+ROW_HEIGHT = 22 # pixels per element in the list, must match the row style of the page
+
+
+class ModelBridge(QObject):
+    # the methods called by the page, results are returned to JavaScript callbacks
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+
+    def setModel(self, model):
+        # also after model.refresh(), the page has to be reloaded to show the new elements
+        self.model = model
+        self.ids = list(model.theModel) if model else []
+        self.positions = None # id -> row, built on the first jump to an element
+        self.highlighted = set() # ids of the search results, see highlight
+
+    @pyqtSlot(result=int)
+    def count(self):
+        return len(self.ids)
+
+    def highlight(self, ids):
+        # marks the rows of the elements, e.g. the results of SysMLModel.searchElements
+        # the page has to call redraw() or showElement() to show them
+        self.highlighted = set(ids)
+
+    @pyqtSlot(int, int, result=str)
+    def headers(self, start, count):
+        # [[id, header html, highlighted], ...] of the rows start to start+count-1 as JSON
+        theModel = self.model.theModel
+        rows = []
+        for id in self.ids[max(0, start):max(0, start + count)]:
+            element = theModel.get(id)
+            if element is not None:
+                rows.append([id, self.model.getElementHeaderHTML(element), id in self.highlighted])
+        return json.dumps(rows)
+
+    @pyqtSlot(str, result=str)
+    def detail(self, id):
+        element = self.model.theModel.get(id) if self.model else None
+        if element is None:
+            return f"<p>{id} is not in the model</p>"
+        return f"<h3>{self.model.getElementHeaderHTML(element)}</h3>\n{self.model.getElementDetailHTML(element)}"
+
+    @pyqtSlot(str, result=int)
+    def indexOf(self, id):
+        # the row of the element or -1
+        if self.positions is None:
+            self.positions = {id: row for row, id in enumerate(self.ids)}
+        return self.positions.get(id, -1)
+
+
+PAGE = """<!doctype html><html><head><meta charset="UTF-8"><title>{title}</title>
+{style}
+<style>
+html, body {{margin:0; height:100%; overflow:hidden;}}
+#list {{position:absolute; left:0; top:0; bottom:0; width:45%; overflow-y:auto; border-right:1px solid Lightgrey;}}
+#rows {{position:relative;}}
+#detail {{position:absolute; left:45%; right:0; top:0; bottom:0; overflow-y:auto; padding-left:1em;}}
+div.row {{position:absolute; left:0; right:0; height:{rowHeight}px; line-height:{rowHeight}px; padding-left:0.5em;
+         white-space:nowrap; overflow:hidden; text-overflow:ellipsis; font-size:11pt; cursor:pointer;}}
+div.row.selected {{background-color:LightSteelBlue;}}
+.highlight {{background-color:yellow; color:black;}}
+</style>
+<script src="qrc:///qtwebchannel/qwebchannel.js"></script>
+</head><body>
+<div id="list"><div id="rows"></div></div>
+<div id="detail"></div>
+<script>
+var ROW = {rowHeight}, BUFFER = 20;
+var model = null, total = 0, rendered = {{first: 0, last: -1}}, request = 0, selected = null;
+var list = document.getElementById('list'), rows = document.getElementById('rows'), detail = document.getElementById('detail');
+
+function render() {{
+    var first = Math.max(0, Math.floor(list.scrollTop / ROW) - BUFFER);
+    var last = Math.min(total - 1, Math.ceil((list.scrollTop + list.clientHeight) / ROW) + BUFFER);
+    if (first >= rendered.first && last <= rendered.last) return;
+    var current = ++request;
+    model.headers(first, last - first + 1, function(json) {{
+        if (current != request) return; // the list has been scrolled again meanwhile
+        var html = [];
+        JSON.parse(json).forEach(function(row, i) {{
+            html.push('<div class="row' + (row[0] == selected ? ' selected' : '') + (row[2] ? ' highlight' : '') +
+                      '" data-id="' + row[0] +
+                      '" style="top:' + ((first + i) * ROW) + 'px">' + row[1] + '</div>');
+        }});
+        rows.innerHTML = html.join('');
+        rendered = {{first: first, last: last}};
+    }});
+}}
+
+function redraw() {{
+    // renders the visible rows again, e.g. after the highlighted elements have changed, also called from Python
+    rendered = {{first: 0, last: -1}};
+    render();
+}}
+
+function select(id) {{
+    selected = id;
+    rows.querySelectorAll('div.row').forEach(function(row) {{
+        row.classList.toggle('selected', row.getAttribute('data-id') == id);
+    }});
+    model.detail(id, function(html) {{ detail.innerHTML = html; detail.scrollTop = 0; }});
+}}
+
+function showElement(id) {{
+    // scrolls the element into view and shows its details, also called from Python
+    model.indexOf(id, function(row) {{
+        if (row < 0) return;
+        if (row * ROW < list.scrollTop || (row + 1) * ROW > list.scrollTop + list.clientHeight) {{
+            list.scrollTop = row * ROW - list.clientHeight / 3;
+        }}
+        redraw();
+        select(id);
+    }});
+}}
+
+document.addEventListener('click', function(event) {{
+    var link = event.target.closest('a[href^="#"]');
+    if (link) {{
+        event.preventDefault();
+        showElement(link.getAttribute('href').substring(1));
+        return;
+    }}
+    var row = event.target.closest('div.row');
+    if (row) select(row.getAttribute('data-id'));
+}});
+
+list.addEventListener('scroll', function() {{ window.requestAnimationFrame(render); }});
+window.addEventListener('resize', function() {{ window.requestAnimationFrame(render); }});
+
+new QWebChannel(qt.webChannelTransport, function(channel) {{
+    model = channel.objects.model;
+    model.count(function(n) {{
+        total = n;
+        rows.style.height = (total * ROW) + 'px';
+        render();
+    }});
+}});
+</script>
+</body></html>
+"""
+
+
+def showModel(browser, model, bridge=None):
+    # shows the model in the QWebEngineView browser, returns the ModelBridge, which must be kept alive
+    # an existing bridge is reused, so the channel of the page does not change
+    if bridge is None:
+        bridge = ModelBridge(model, browser)
+        channel = QWebChannel(browser.page())
+        channel.registerObject("model", bridge)
+        browser.page().setWebChannel(channel)
+    else:
+        bridge.setModel(model)
+    html = PAGE.format(title=model.name, style=model.HTML_STYLE, rowHeight=ROW_HEIGHT)
+    browser.setHtml(html, QUrl("qrc:///"))
+    return bridge
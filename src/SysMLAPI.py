@@ -1,29 +1,126 @@
 import requests
+from requests.adapters import HTTPAdapter
+import codecs
+import itertools
 import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from ElementCache import CorruptEntry, PickleElementCache
+from ViewCache import ViewCache
 
-PAGE_SIZE_FOR_ELEMENTS = 10000
+PAGE_SIZE_FOR_ELEMENTS = 1000
+POOL_SIZE = 8 # number of kept-alive connections and worker threads per server
+CHUNK_SIZE = 64 * 1024 # bytes read at once from a streamed response
+MAX_COMMITS_FOR_CHANGES = 50 # more commits between cached and requested commit are downloaded completely
+ID_BATCH_SIZE = 100 # number of ids requested with one query
+PROGRESS_ELEMENTS = 1000 # elements between two progress reports
+TIMEOUT = (10, 300) # seconds to connect and to wait for the next data of a response, e.g. while a commit is stored
 
 import sys
 _base = Path(sys.executable).parent if getattr(sys, "frozen", False) else Path(__file__).parent
 _CACHE_DIR = _base / ".cache"
+_cache = PickleElementCache(_CACHE_DIR)
+_viewCache = ViewCache(_CACHE_DIR, _cache)
+
+def setCache(cache):
+    # replaces the cache backend, e.g. JSONElementCache(_CACHE_DIR) or a different size limit
+    # the view cache moves into the directory of the new cache, so both are evicted together
+    global _cache
+    _cache = cache
+    _viewCache.elementCache = cache
+    _viewCache.directory = cache.directory
+
+def getCache():
+    return _cache
+
+def getViewCache():
+    # results derived from a commit like the HTML of the model, see ViewCache
+    return _viewCache
+
+
+class OperationCancelled(Exception):
+    # raised by a progress callback to stop a long running operation, e.g. when the user cancels it
+    # progress callbacks are called as progress(phase, done, total) with total None if it is unknown:
+    # "download" (bytes received), "elements" (elements parsed or read), "indexes", "parts", "html", "sync"
+    pass
+
+
+class SysMLClient:
+    # connection pool for one SysML v2 API server
+    # the session keeps the TCP/TLS connections alive between calls,
+    # the executor runs requests concurrently on a bounded number of threads
+    host=""
+    session=None
+    executor=None
+    timeout=TIMEOUT
+
+    def __init__(self, host, poolSize=POOL_SIZE):
+        self.host=host
+        self.session=requests.Session()
+        adapter=HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor=ThreadPoolExecutor(max_workers=poolSize, thread_name_prefix="SysMLClient")
+
+    def get(self, url, stream=False):
+        return self.session.get(url, stream=stream, timeout=self.timeout)
+
+    def post(self, url, json=None):
+        return self.session.post(url, json=json, timeout=self.timeout)
+
+    def delete(self, url):
+        return self.session.delete(url, timeout=self.timeout)
+
+    def submit(self, function, *args):
+        return self.executor.submit(function, *args)
+
+_clients = {}
+_clientsLock = threading.Lock()
+
+def _forgetClients():
+    # a forked process must not use the connections and threads of the parent: the sockets would be shared
+    # and the executor threads do not exist in the child, so it creates clients of its own
+    global _clientsLock
+    _clientsLock = threading.Lock()
+    _clients.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forgetClients)
+
+def getClient(host, poolSize=POOL_SIZE):
+    # returns the shared client for the host, the pool size is only used when the client is created
+    with _clientsLock:
+        if host not in _clients:
+            _clients[host] = SysMLClient(host, poolSize)
+        return _clients[host]
+
+def closeClient(host):
+    # closes the connections of the client for the host, the next getClient creates a new one
+    with _clientsLock:
+        client = _clients.pop(host, None)
+    if client:
+        client.executor.shutdown(wait=True)
+        client.session.close()
 
 
 def getProjects(host):
-    response = requests.get(f"{host}/projects?page%5Bsize%5D=1000") 
+    response = getClient(host).get(f"{host}/projects?page%5Bsize%5D=1000") 
     # default page size is 100, to get all projects, we need to set the page size to a large number
     if response.status_code != 200:
         raise Exception(f"Server returned code {response.status_code}")
     return response.json()
 
 def getProject(host, project):
-    response = requests.get(f"{host}/projects/{project}?page%5Bsize%5D=1000") 
+    response = getClient(host).get(f"{host}/projects/{project}?page%5Bsize%5D=1000") 
     if response.status_code != 200:
         raise Exception(f"Server returned code {response.status_code}") 
     return response.json()
 
 def getHeadCommit(host, project):
-    response=requests.get(f"{host}/projects/{project}/branches")
+    response=getClient(host).get(f"{host}/projects/{project}/branches")
     if response.status_code != 200:
         raise Exception(f"Server returned code {response.status_code}")
     branches = response.json()
@@ -31,19 +128,256 @@ def getHeadCommit(host, project):
         raise Exception("No branches found in project")
     return branches[0]['head']['@id']
 
-def getElements(host, project, commit=None):
+def countElements(elements, progress):
+    # passes the elements through and reports their number every PROGRESS_ELEMENTS elements
+    count = 0
+    for element in elements:
+        yield element
+        count += 1
+        if count % PROGRESS_ELEMENTS == 0:
+            progress("elements", count, None)
+    progress("elements", count, count)
+
+def getElements(host, project, commit=None, progress=None):
+    # generator over all elements of the commit
+    # follows the cursor pagination of the API (Link header with rel="next"),
+    # so only one page of PAGE_SIZE_FOR_ELEMENTS elements is held at a time
+    # progress: optional callback, see OperationCancelled
+    elements = readElements(host, project, commit, progress)
+    return countElements(elements, progress) if progress else elements
+
+def readElements(host, project, commit, progress):
+    # generator behind getElements, reads the elements from the cache, the changes or the server
     if commit is None:
         commit = getHeadCommit(host, project)
-    cache_file = _CACHE_DIR / f"{project}_{commit}.json"
-    if cache_file.exists():
-        return json.loads(cache_file.read_text(encoding="utf-8"))
-    response = requests.get(f"{host}/projects/{project}/commits/{commit}/elements?page%5Bsize%5D={PAGE_SIZE_FOR_ELEMENTS}")
+    # the ids passed on before a cache entry turned out to be corrupt are skipped when the commit is downloaded
+    passed = set()
+    if _cache.contains(project, commit):
+        try:
+            for element in _cache.read(project, commit):
+                passed.add(element['@id'])
+                yield element
+            return
+        except CorruptEntry:
+            pass
+    # a cached ancestor of the commit only needs the changes since then. The entry of the commit is written
+    # while the elements are passed on, which costs reading the ancestor and writing a complete entry, but
+    # the next load of the commit reads it directly
+    cached = _cache.commits(project)
+    if cached and not passed:
+        found = findChanges(host, project, commit, cached.__contains__, progress)
+        try:
+            elements = {element['@id']: element for element in _cache.read(project, found[0])} if found else None
+        except CorruptEntry:
+            elements = None
+        if elements is not None:
+            applyChanges(elements, found[1])
+            writer = _cache.writer(project, commit)
+            try:
+                page = []
+                for element in elements.values():
+                    page.append(element)
+                    if len(page) == PAGE_SIZE_FOR_ELEMENTS:
+                        writer.write(page)
+                        yield from page
+                        page = []
+                writer.write(page)
+                yield from page
+                writer.commit()
+            finally:
+                writer.discard()
+            return
+    # the cache entry is only written if all pages have been received
+    writer = _cache.writer(project, commit)
+    try:
+        for page in getElementPages(host, project, commit, progress):
+            writer.write(page)
+            if passed:
+                page = [element for element in page if element['@id'] not in passed]
+            yield from page
+        writer.commit()
+    finally:
+        writer.discard()
+
+def getElementPages(host, project, commit, progress=None):
+    # yields the elements page by page
+    return getPages(host, f"{host}/projects/{project}/commits/{commit}/elements?page%5Bsize%5D={PAGE_SIZE_FOR_ELEMENTS}", progress)
+
+def countBytes(chunks, progress, received):
+    # passes the chunks of a response through and reports the bytes received so far
+    for chunk in chunks:
+        received[0] += len(chunk)
+        progress("download", received[0], None)
+        yield chunk
+
+def getPages(host, url, progress=None):
+    # yields the pages of a paginated list
+    # the cursor for the next page is taken from the Link header as soon as the headers of a page have arrived,
+    # so the next request is already running while the body of the current one is received and decoded.
+    # The body is parsed while it is received, so the raw text of a page is never held completely.
+    # Servers that ignore the page size still deliver pages of at most PAGE_SIZE_FOR_ELEMENTS elements.
+    # A server that stops sending fails the download after the read timeout of the client.
+    client = getClient(host)
+    shared = SharedValues()
+    received = [0]
+    pending = client.submit(client.get, url, True)
+    while pending:
+        response = pending.result()
+        if response.status_code != 200:
+            response.close()
+            raise Exception(f"Server returned code {response.status_code}")
+        url = response.links.get("next", {}).get("url")
+        pending = client.submit(client.get, url, True) if url else None
+        count = 0
+        page = []
+        with response:
+            chunks = response.iter_content(CHUNK_SIZE)
+            if progress:
+                chunks = countBytes(chunks, progress, received)
+            for element in iterJSONArray(chunks):
+                page.append(shared.element(element))
+                count += 1
+                if len(page) == PAGE_SIZE_FOR_ELEMENTS:
+                    yield page
+                    page = []
+        if page:
+            yield page
+        if count == 0:
+            return
+
+class SharedValues:
+    # replaces equal keys, strings and references {'@id': ...} of elements by one shared object
+    # the JSON decoder only shares the keys within one decoded item, without sharing each element
+    # would keep its own copy of every key and each edge its own reference dictionary
+    def __init__(self):
+        self.strings = {}
+        self.references = {}
+
+    def value(self, value):
+        if isinstance(value, str):
+            return self.strings.setdefault(value, value)
+        if isinstance(value, list):
+            return [self.value(v) for v in value] if value else value
+        if isinstance(value, dict) and len(value) == 1 and '@id' in value:
+            reference = self.references.get(value['@id'])
+            if reference is None:
+                id = self.strings.setdefault(value['@id'], value['@id'])
+                reference = self.references[id] = {'@id': id}
+            return reference
+        return value
+
+    def element(self, element):
+        strings = self.strings
+        value = self.value
+        return {strings.setdefault(key, key): value(v) for key, v in element.items()}
+
+_SEPARATORS = re.compile(r"[\s,]*")
+_NUMBER_END = re.compile(r"[\s,\]]")
+_decoder = json.JSONDecoder()
+
+def iterJSONArray(chunks):
+    # parses a JSON array from an iterable of byte chunks and yields its items as soon as they are complete
+    # only the text of the item that is not yet completely received is kept
+    textDecoder = codecs.getincrementaldecoder("utf-8")()
+    text = ""
+    position = 0
+    started = False
+    for chunk in itertools.chain(chunks, [None]):
+        text = text[position:] + (textDecoder.decode(chunk) if chunk is not None else textDecoder.decode(b"", final=True))
+        position = 0
+        while True:
+            position = _SEPARATORS.match(text, position).end()
+            if position >= len(text):
+                break
+            if not started:
+                if text[position] != "[":
+                    raise Exception("Server returned no JSON array")
+                started = True
+                position += 1
+                continue
+            if text[position] == "]":
+                return
+            try:
+                item, end = _decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                break # incomplete item, wait for the next chunk
+            if chunk is not None and type(item) in (int, float) and not _NUMBER_END.match(text, end):
+                break # the number may continue in the next chunk, e.g. 0 and .5
+            position = end
+            yield item
+    raise Exception("Server returned an incomplete JSON array")
+
+def getCommit(host, project, commit):
+    response = getClient(host).get(f"{host}/projects/{project}/commits/{commit}")
     if response.status_code != 200:
         raise Exception(f"Server returned code {response.status_code}")
-    data = response.json()
-    _CACHE_DIR.mkdir(exist_ok=True)
-    cache_file.write_text(json.dumps(data), encoding="utf-8")
-    return data
+    return response.json()
+
+def getPreviousCommits(commitData):
+    # previousCommit is a list of references in the current API and a single reference in older versions
+    previous = commitData.get('previousCommit')
+    if isinstance(previous, dict):
+        previous = [previous]
+    return [p['@id'] for p in previous or [] if p and p.get('@id')]
+
+def getChanges(host, project, baseCommit, commit, progress=None):
+    # returns the elements changed between baseCommit and commit as {id: element}, deleted elements are None
+    # returns None, if baseCommit is no ancestor within MAX_COMMITS_FOR_CHANGES commits
+    # or the server does not provide the changes of a commit
+    found = findChanges(host, project, commit, lambda c: c == baseCommit, progress)
+    return found[1] if found else None
+
+def findChanges(host, project, commit, isBase, progress=None):
+    # follows the commits backwards from commit to the first one with isBase(commit), e.g. one in the cache,
+    # only first parents of merge commits are followed. Each step is one small request for the commit.
+    # returns (base commit, changes since then as in getChanges) or None, if there is no such commit
+    # within MAX_COMMITS_FOR_CHANGES commits or the server does not provide the changes of a commit
+    commits = []
+    current = commit
+    while not isBase(current):
+        if len(commits) >= MAX_COMMITS_FOR_CHANGES:
+            return None
+        try:
+            previous = getPreviousCommits(getCommit(host, project, current))
+        except Exception:
+            return None
+        if not previous:
+            return None # the first commit has been reached
+        commits.append(current)
+        current = previous[0]
+    changes = {}
+    for c in reversed(commits): # oldest first, newer changes replace older ones
+        try:
+            for page in getPages(host, f"{host}/projects/{project}/commits/{c}/changes?page%5Bsize%5D={PAGE_SIZE_FOR_ELEMENTS}", progress):
+                for dataVersion in page:
+                    payload = dataVersion.get('payload')
+                    identity = dataVersion.get('identity') or payload
+                    changes[identity['@id']] = payload
+        except OperationCancelled:
+            raise
+        except Exception:
+            return None
+    return current, changes
+
+def applyChanges(elements, changes):
+    # patches the dictionary {id: element} in place
+    for id, element in changes.items():
+        if element is None:
+            elements.pop(id, None)
+        else:
+            elements[id] = element
+
+def postCommit(host, project, changes, previousCommit=None):
+    # creates a commit on the default branch with the changes {id: element}, elements that are None are deleted
+    # the changes have the format of getChanges. Returns the id of the new commit
+    commit = {'@type': 'Commit',
+              'change': [{'@type': 'DataVersion', 'identity': {'@id': id}, 'payload': element} for id, element in changes.items()]}
+    if previousCommit:
+        commit['previousCommit'] = {'@id': previousCommit}
+    response = getClient(host).post(f"{host}/projects/{project}/commits", json=commit)
+    if response.status_code not in (200, 201):
+        raise Exception(f"Server returned code {response.status_code}")
+    return response.json()['@id']
 
 def getElementsAsString(host, project, commit=None):
     # returns the elements of the given project as multiline string
@@ -60,7 +394,7 @@ def getElementsAsString(host, project, commit=None):
 
 def deleteProject(host, project):
     print (f"{host}/projects/{project}")
-    response = requests.delete(f"{host}/projects/{project}")
+    response = getClient(host).delete(f"{host}/projects/{project}")
     if response.status_code != 204:
         raise Exception(f"Server returned code {response.status_code}")
 
@@ -100,7 +434,7 @@ def getExchangeID(host, project):
             }
         }
     query_url = f"{host}/projects/{project}/query-results" 
-    response = requests.post(query_url, json=query)
+    response = getClient(host).post(query_url, json=query)
 
     if response.status_code != 200:
          raise Exception(f"Server returned code {response.status_code}") 
@@ -112,3 +446,98 @@ def getExchangeID(host, project):
     #returns the ID of the attribute definition exchange
     return query_response_json[0]['@id']
  
+
+def primitiveConstraint(property, value, operator='='):
+    return {
+        '@type': 'PrimitiveConstraint',
+        'inverse': False,
+        'operator': operator,
+        'property': property,
+        'value': value
+    }
+
+def compositeConstraint(operator, constraints):
+    # operator is 'and' or 'or'
+    return {
+        '@type': 'CompositeConstraint',
+        'operator': operator,
+        'constraint': constraints
+    }
+
+def queryElements(host, project, constraint, commit=None):
+    # returns the elements of the commit (default: head) that match the constraint
+    # the results are requested in pages of PAGE_SIZE_FOR_ELEMENTS, like the elements of a commit,
+    # so a server that limits the size of a response returns the rest with the Link header rel="next"
+    query = {'@type':'Query', 'where': constraint}
+    query_url = f"{host}/projects/{project}/query-results?page%5Bsize%5D={PAGE_SIZE_FOR_ELEMENTS}"
+    if commit is not None:
+        query_url += f"&commitId={commit}"
+    result = []
+    while query_url:
+        response = getClient(host).post(query_url, json=query)
+        if response.status_code != 200:
+            raise Exception(f"Server returned code {response.status_code}")
+        result += response.json()
+        query_url = response.links.get("next", {}).get("url")
+    return result
+
+def getElement(host, project, commit, id):
+    # returns the element or None, if it does not exist in the commit
+    response = getClient(host).get(f"{host}/projects/{project}/commits/{commit}/elements/{id}")
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise Exception(f"Server returned code {response.status_code}")
+    return response.json()
+
+def getElementsById(host, project, commit, ids):
+    # returns {id: element} for the ids that exist in the commit
+    # the ids are requested in batches of ID_BATCH_SIZE with one query each, the batches run concurrently.
+    # If the server cannot evaluate the query, the elements of the batch are requested one by one.
+    # Ids missing in the result of a query, e.g. because the server limits the size of the result,
+    # are also requested one by one.
+    client = getClient(host)
+    ids = list(dict.fromkeys(ids))
+
+    def getBatch(batch):
+        try:
+            constraint = compositeConstraint('or', [primitiveConstraint('@id', id) for id in batch])
+            found = {e['@id']: e for e in queryElements(host, project, constraint, commit)}
+        except Exception:
+            found = {}
+        missing = [getElement(host, project, commit, id) for id in batch if id not in found]
+        return [found[id] for id in batch if id in found] + [e for e in missing if e is not None]
+
+    batches = [client.submit(getBatch, ids[i:i+ID_BATCH_SIZE]) for i in range(0, len(ids), ID_BATCH_SIZE)]
+    result = {}
+    for batch in batches:
+        for element in batch.result():
+            result[element['@id']] = element
+    return result
+
+def getClosure(host, project, commit, ids, properties, elements=None):
+    # returns {id: element} with the elements of ids and all elements reachable from them through the properties
+    # elements: already known elements {id: element}, they are not requested again and are part of the result
+    # the closure is requested level by level, each level with one call of getElementsById
+    known = elements or {}
+    result = dict(known)
+    visited = set()
+    pending = list(ids)
+    while pending:
+        level = [id for id in dict.fromkeys(pending) if id not in visited]
+        visited.update(level)
+        fetched = getElementsById(host, project, commit, [id for id in level if id not in known])
+        pending = []
+        for id in level:
+            element = known.get(id) or fetched.get(id)
+            if element is None:
+                continue
+            result[id] = element
+            if element.get('isLibraryElement'):
+                continue # library elements are not followed, only referenced
+            for property in properties:
+                value = element.get(property)
+                for reference in value if isinstance(value, list) else [value]:
+                    if isinstance(reference, dict) and reference.get('@id') and reference['@id'] not in visited:
+                        pending.append(reference['@id'])
+    return result
@@ -1,37 +1,453 @@
 # a class representing a SysML model
 
-from SysMLAPI import getProject, getElements, PAGE_SIZE_FOR_ELEMENTS
+import bisect
+import gc
+import heapq
+import re
+import threading
+from contextlib import contextmanager
+from collections.abc import Mapping
+from CompactElementStore import CompactElement, CompactElementStore
+from SysMLAPI import getClient, getProject, getHeadCommit, getElements, getChanges, applyChanges, getViewCache, PROGRESS_ELEMENTS
+
+class MetaChain:
+    """
+    A metachain compiled by compileMetaChain: the validated steps and result types with
+    the traversal of getMetaChain. Compiled metachains are shared, so they can be used as cache keys.
+    """
+    __slots__=('steps','resulttype','last')
+
+    def __init__(self, steps, resulttype):
+        self.steps=steps
+        self.resulttype=resulttype
+        self.last=len(steps)-1
+
+    def evaluate(self, theModel, element, position=0):
+        # element is an element, a list of elements or None
+        if element is None:
+            return None
+        if isinstance(element, list):
+            results=[]
+            for e in element:
+                if e is not None:
+                    r=self.evaluate(theModel, e, position)
+                    if isinstance(r, list):
+                        results.extend(item for item in r if item is not None)
+                    elif r is not None:
+                        results.append(r)
+            return results if results else None
+        wantedType, attributeName = self.steps[position]
+        if wantedType is not None and element['@type']!=wantedType:
+            return None
+        isLast = position==self.last
+        # the references of a compact element are resolved from the numbers of its store, without creating the
+        # shared reference dictionaries first
+        resolved, value = element.resolve(attributeName) if element.__class__ is CompactElement else (False, None)
+        if not resolved:
+            value=element.get(attributeName)
+            if value is None:
+                return None
+            if isinstance(value, dict):
+                # expected: reference to another element, just one entry for @id
+                value=theModel.get(value['@id']) if value.get('@id') else None
+            elif isinstance(value, list):
+                # expected: list of references to other elements
+                if not value:
+                    return None
+                value=[theModel.get(r['@id']) if isinstance(r, dict) and r.get('@id') else None for r in value]
+            elif isinstance(value, set):
+                return None
+            else:
+                # a value is never referencing another element
+                return value if isLast else None
+        if isinstance(value, list):
+            if isLast:
+                if self.resulttype is not None:
+                    value=[e for e in value if e is not None and e.get('@type') in self.resulttype]
+                    if not value:
+                        return None
+                return value
+            return self.evaluate(theModel, value, position+1)
+        if isLast:
+            if self.resulttype is not None and value is not None and value.get('@type') not in self.resulttype:
+                return None
+            return value
+        return self.evaluate(theModel, value, position+1)
+
+_compiledMetaChains={}
+
+def compileMetaChain(metachain, resulttype:list=None) -> MetaChain:
+    # validates the metachain (see SysMLModel.getMetaChain) and returns the shared compiled version
+    key=(tuple(tuple(step) for step in metachain), tuple(resulttype) if resulttype is not None else None)
+    chain=_compiledMetaChains.get(key)
+    if chain is None:
+        if not key[0]:
+            raise ValueError("metachain is empty")
+        for step in key[0]:
+            if len(step)!=2 or not (step[0] is None or isinstance(step[0], str)) or not isinstance(step[1], str):
+                raise ValueError(f"invalid metachain step {list(step)}, expected [type or None, attribute name]")
+        chain=_compiledMetaChains[key]=MetaChain(key[0], frozenset(resulttype) if resulttype is not None else None)
+    return chain
+
+FREEZE_ELEMENTS=1000 # elements loaded between two calls of gc.freeze(), see SysMLModel.loadElements
+_freezeLock=threading.Lock()
+_freezingLoads=0 # loads running in freezingLoads, the last one to finish unfreezes
+
+def freezeLoaded(elements):
+    # passes the elements through, the objects created so far are frozen every FREEZE_ELEMENTS elements
+    for count, element in enumerate(elements, 1):
+        yield element
+        if count % FREEZE_ELEMENTS == 0:
+            gc.freeze()
+
+@contextmanager
+def freezingLoads():
+    # gc.freeze() and gc.unfreeze() act on all objects of the process, so a load must not unfreeze while
+    # another load on a different thread is still running. The objects stay frozen until the last load is finished.
+    global _freezingLoads
+    with _freezeLock:
+        _freezingLoads+=1
+    try:
+        yield
+    finally:
+        with _freezeLock:
+            _freezingLoads-=1
+            if _freezingLoads==0:
+                gc.unfreeze()
 
 def listToDictonary(input: list) -> dict:
     # uses the @id as key for the dictionary
     return {element['@id']:element for element in input}
 
+SEARCH_LIMIT=1000 # default maximum number of results of searchElements
+_WORDS=re.compile(r"\w+")
+
 class SysMLModel:
     host=""
     project=""
     commit=None
     theModel={}
     name=""
+    compact=False
+    # indexes, rebuilt by buildIndexes whenever theModel changes
+    elementsByType={}      # @type -> {id: element}
+    elementIdsByName={}    # (declaredName, @type) -> id of the first element
+    elementsByMetadata={}  # id of the metadata definition -> {id: annotated element}
+    incomingReferences=None # target id -> {property name: [ids of the referencing elements]}, built on first use
+    cacheMetaChains=True
+    metaChainCache={}       # (element id, MetaChain) -> result of getMetaChain
+    searchIds=[]            # position -> id in the order of theModel, None for removed elements
+    searchTypes=[]          # position -> @type, None for removed elements like in searchIds
+    searchPositions=None    # id -> position, built on first use by getSearchPositions
+    searchTerms=None        # the sorted words of the search index, built by the first search, see buildSearchIndex
+    searchPostings=None     # word -> ascending positions of the elements with the word
+    SEARCH_FIELDS=('declaredName','declaredShortName','name','shortName','qualifiedName','value')
 
-    def __init__(self, host, project, commit=None):
+    def __init__(self, host, project, commit=None, compact=False, progress=None):
+        # compact: keep the elements in a CompactElementStore instead of a dictionary of dictionaries,
+        # about 4x less memory for slower access of values, see CompactElementStore
+        # progress: optional callback for the phases of loading, see SysMLAPI.OperationCancelled
         self.host=host
         self.project=project
+        self.compact=compact
+        # project data and head commit are independent requests, run them concurrently
+        projectRequest=getClient(host).submit(getProject,host,project)
+        if commit is None:
+            commit=getHeadCommit(host,project)
         self.commit = commit
-        projectData=getProject(host,project)
+        projectData=projectRequest.result()
         self.name=projectData.get('name')
-        self.theModel =listToDictonary(getElements(host,project,commit))
+        self.loadElements(self.fetchElements(progress))
         print ("model loaded \n size = ",len(self.theModel))
-        if len(self.theModel)==PAGE_SIZE_FOR_ELEMENTS:
-            print(f"Warning: the model contains exactly {PAGE_SIZE_FOR_ELEMENTS} elements. It probably hit the page size limit. Consider increasing the page size in the API call.")
+        if progress:
+            progress("indexes",0,None)
+        self.buildIndexes()
+
+    @classmethod
+    def fromElements(cls, elements, name="", project="", commit=None, compact=False):
+        # a model of the given elements without a server, e.g. for benchmarks
+        model=cls.__new__(cls)
+        model.host=None
+        model.project=project
+        model.commit=commit
+        model.compact=compact
+        model.name=name
+        model.loadElements(elements)
+        model.buildIndexes()
+        return model
+
+    def fetchElements(self, progress=None):
+        # the elements of self.commit to load, subclasses may load only a part of the model
+        return getElements(self.host,self.project,self.commit,progress)
+
+    def loadElements(self, elements):
+        # elements is consumed while it is downloaded or read from the cache, each element is inserted as soon as it is parsed
+        # With hundreds of thousands of new objects, the full runs of the cyclic garbage collector would traverse the
+        # growing model again and again. So the loaded objects are moved out of its generations with gc.freeze() every
+        # FREEZE_ELEMENTS elements and back with gc.unfreeze() at the end. The collector stays enabled, e.g. for the GUI
+        # while a large model is downloaded. Freezing is process-wide: the objects of other threads are frozen as well
+        # until the last concurrent load is finished, see freezingLoads, and no other code may use gc.freeze().
+        with freezingLoads():
+            if self.compact:
+                self.theModel=CompactElementStore(freezeLoaded(elements))
+            else:
+                self.theModel=listToDictonary(freezeLoaded(elements))
+
+    def elementsAsDicts(self):
+        # the elements of theModel as plain dictionaries, e.g. for the element cache
+        for element in self.theModel.values():
+            yield element if isinstance(element, dict) else element.toDict()
+
+    def buildIndexes(self):
+        self.metaChainCache={}
+        self.elementsByType={}
+        self.elementIdsByName={}
+        # the positions of the elements in the order of theModel, the words are only indexed by the first search
+        self.searchIds=[]
+        self.searchTypes=[]
+        for id, element in self.theModel.items():
+            self.elementsByType.setdefault(element['@type'],{})[id]=element
+            name=element.get('declaredName')
+            if name is not None:
+                self.elementIdsByName.setdefault((name,element['@type']),id)
+            self.searchIds.append(id)
+            self.searchTypes.append(element['@type'])
+        self.searchPositions=None
+        self.searchPostings=None
+        self.searchTerms=None
+        self.elementsByMetadata=self.indexMetadata()
+        self.incomingReferences=None
+
+    def updateIndexes(self, previous):
+        # updates the indexes after the elements with the ids of previous {id: element before the change or None}
+        # have been changed in theModel, the costs depend on the number of changed elements and not on the model
+        self.metaChainCache={}
+        self.updateSearchIndex(previous) # first, its positions give the order of the elements in theModel
+        order=self.getSearchPositions()
+        for id, old in previous.items():
+            new=self.theModel.get(id)
+            if old is not None and (new is None or new['@type']!=old['@type']):
+                self.elementsByType.get(old['@type'],{}).pop(id,None)
+            if new is not None:
+                self.elementsByType.setdefault(new['@type'],{})[id]=new
+        for id, old in previous.items():
+            new=self.theModel.get(id)
+            oldKey=(old.get('declaredName'),old['@type']) if old is not None else None
+            newKey=(new.get('declaredName'),new['@type']) if new is not None else None
+            if oldKey!=newKey and oldKey and oldKey[0] is not None and self.elementIdsByName.get(oldKey)==id:
+                # the first of the other elements with the name, if there is one
+                del self.elementIdsByName[oldKey]
+                others=[otherId for otherId, other in self.elementsByType.get(oldKey[1],{}).items() if other.get('declaredName')==oldKey[0]]
+                if others:
+                    self.elementIdsByName[oldKey]=min(others,key=order.get)
+        for id in previous:
+            new=self.theModel.get(id)
+            if new is not None and new.get('declaredName') is not None:
+                key=(new['declaredName'],new['@type'])
+                first=self.elementIdsByName.get(key)
+                if first is None or order[id]<order[first]:
+                    self.elementIdsByName[key]=id
+        self.updateMetadataIndex(previous)
+        if self.incomingReferences is not None:
+            for id, old in previous.items():
+                if old is not None:
+                    self.addIncomingReferences(self.incomingReferences,id,old,remove=True)
+                if self.theModel.get(id) is not None:
+                    self.addIncomingReferences(self.incomingReferences,id,self.theModel[id])
+
+    def indexMetadata(self):
+        # the annotated elements are the owners of the MetadataUsages: MetadataUsage.owningRelationship.owningRelatedElement
+        # only these candidates are checked with getUsedMetadata. Owners that are not loaded, e.g. in the LCA subset
+        # or outside of the repository, are skipped.
+        candidates={}
+        for usage in self.elementsByType.get('MetadataUsage',{}).values():
+            owner=self.getMetadataOwner(usage)
+            if owner is not None:
+                candidates[owner['@id']]=owner
+        annotated={}
+        for id, element in candidates.items():
+            metadataList=self.getUsedMetadata(element)
+            if metadataList:
+                annotated[id]=metadataList
+        # in the order of theModel, like a scan of the model
+        result={}
+        for id in self.theModel:
+            if id in annotated:
+                for metadata in annotated[id]:
+                    if metadata:
+                        result.setdefault(metadata['@id'],{})[id]=self.theModel[id]
+        return result
+
+    def getMetadataOwner(self, usage):
+        membership=self.getElement(usage.get('owningRelationship'))
+        return self.getElement(membership.get('owningRelatedElement')) if membership else None
+
+    def updateMetadataIndex(self, previous):
+        # the metadata of an element depends on its owned memberships, their MetadataUsages and the typings of these,
+        # so the elements up to three owners above a changed element are checked again
+        candidates=set()
+        for id, old in previous.items():
+            for element in (old, self.theModel.get(id)):
+                for _ in range(4):
+                    if element is None:
+                        break
+                    candidates.add(element['@id'])
+                    owner=element.get('owningRelatedElement') or element.get('owningRelationship')
+                    element=self.getElement(owner) or previous.get(owner['@id']) if owner and owner.get('@id') else None
+        for annotated in self.elementsByMetadata.values():
+            for id in candidates:
+                annotated.pop(id,None)
+        changed=set()
+        for id in candidates:
+            element=self.theModel.get(id)
+            # like indexMetadata, only owners of MetadataUsages are annotated
+            usages=self.getMetaChain(element,self.OWNED_USAGES) if element is not None else None
+            if not usages or not any(self.getMetadataOwner(usage) is element for usage in usages):
+                continue
+            for metadata in self.getUsedMetadata(element) or []:
+                if metadata:
+                    self.elementsByMetadata.setdefault(metadata['@id'],{})[id]=element
+                    changed.add(metadata['@id'])
+        # in the order of theModel like indexMetadata, e.g. for the order of getLCAParts
+        order=self.getSearchPositions()
+        for metadataId in changed:
+            annotated=self.elementsByMetadata[metadataId]
+            self.elementsByMetadata[metadataId]=dict(sorted(annotated.items(),key=lambda item: order[item[0]]))
+
+    def searchWords(self, element):
+        words={element['@type'].lower()}
+        for field in self.SEARCH_FIELDS:
+            value=element.get(field)
+            # 'value' of a FeatureValue is a reference, only literal values are words
+            if isinstance(value,(str,int,float)):
+                words.update(_WORDS.findall(str(value).lower()))
+        return words
+
+    def buildSearchIndex(self):
+        # inverted index over the words of the names, qualified names, types and literal values of the elements
+        # The elements are numbered by their positions in searchIds, so results come in the order of the model browser.
+        # It is built by the first search, so loads that never search, e.g. in sysml-lca-batch, do not pay for it.
+        postings={}
+        for position, id in enumerate(self.searchIds):
+            if id is not None:
+                for word in self.searchWords(self.theModel[id]):
+                    postings.setdefault(word,[]).append(position)
+        self.searchPostings=postings
+        self.searchTerms=sorted(postings)
+
+    def getSearchPositions(self):
+        # id -> position in searchIds, the order of the elements in theModel
+        if self.searchPositions is None:
+            self.searchPositions={id:position for position, id in enumerate(self.searchIds) if id is not None}
+        return self.searchPositions
+
+    def updateSearchIndex(self, previous):
+        # changed elements keep their position, removed elements leave a gap (None) and new ones are appended,
+        # like in theModel. The words are only updated if the search index has been built.
+        positions=self.getSearchPositions()
+        indexed=self.searchPostings is not None
+        for id, old in previous.items():
+            new=self.theModel.get(id)
+            position=positions.get(id)
+            oldWords=self.searchWords(old) if indexed and old is not None and position is not None else set()
+            if new is None:
+                if position is not None:
+                    self.searchIds[position]=None
+                    self.searchTypes[position]=None
+                    del positions[id]
+                newWords=set()
+            else:
+                if position is None:
+                    position=positions[id]=len(self.searchIds)
+                    self.searchIds.append(id)
+                    self.searchTypes.append(new['@type'])
+                self.searchTypes[position]=new['@type']
+                newWords=self.searchWords(new) if indexed else set()
+            for word in oldWords-newWords:
+                postings=self.searchPostings[word]
+                del postings[bisect.bisect_left(postings,position)]
+                if not postings:
+                    del self.searchPostings[word]
+                    del self.searchTerms[bisect.bisect_left(self.searchTerms,word)]
+            for word in newWords-oldWords:
+                postings=self.searchPostings.get(word)
+                if postings is None:
+                    postings=self.searchPostings[word]=[]
+                    bisect.insort(self.searchTerms,word)
+                bisect.insort(postings,position)
+
+    def searchElements(self, query, types=None, limit=SEARCH_LIMIT):
+        # the ids of the elements with a word starting with each word of the query, in the order of theModel
+        # words like type:PartDefinition in the query and types restrict the result to elements of these types
+        # returns at most limit ids, all if limit is None
+        typeFilter={t.lower() for t in types or []}
+        prefixes=[]
+        for word in query.split():
+            if word.lower().startswith("type:"):
+                typeFilter.add(word[5:].lower())
+            else:
+                prefixes.extend(_WORDS.findall(word.lower()))
+        if not prefixes and not typeFilter:
+            return []
+        matchingTypes={t for t in self.elementsByType if t.lower() in typeFilter}
+        if not prefixes:
+            # only types: the elements of the types in the order of theModel
+            order=self.getSearchPositions()
+            ids=[id for t in matchingTypes for id in self.elementsByType[t]]
+            return sorted(ids,key=order.__getitem__) if limit is None else heapq.nsmallest(limit,ids,key=order.__getitem__)
+        if self.searchPostings is None:
+            self.buildSearchIndex()
+        positions=None
+        for prefix in sorted(set(prefixes),key=len,reverse=True): # long prefixes match less
+            matches=set()
+            i=bisect.bisect_left(self.searchTerms,prefix)
+            while i<len(self.searchTerms) and self.searchTerms[i].startswith(prefix):
+                matches.update(self.searchPostings[self.searchTerms[i]])
+                i+=1
+            positions=matches if positions is None else positions & matches
+            if not positions:
+                return []
+        result=[]
+        for position in sorted(positions):
+            if typeFilter and self.searchTypes[position] not in matchingTypes:
+                continue
+            if self.searchIds[position] is None:
+                continue
+            result.append(self.searchIds[position])
+            if limit is not None and len(result)>=limit:
+                break
+        return result
+
+    def refresh(self):
+        # updates the model to the head commit of the project
+        # only the changes since the loaded commit are requested and patched into theModel,
+        # if the server cannot provide them, the model is loaded completely
+        # returns the number of changed elements
+        head=getHeadCommit(self.host,self.project)
+        if head==self.commit:
+            return 0
+        changes=getChanges(self.host,self.project,self.commit,head)
+        if changes is None:
+            self.commit=head
+            self.loadElements(self.fetchElements())
+            self.buildIndexes()
+            return len(self.theModel)
+        previous={id:self.theModel.get(id) for id in changes}
+        applyChanges(self.theModel,changes)
+        self.commit=head
+        self.updateIndexes(previous)
+        # no cache entry is written for head, the next load finds self.commit in the cache and applies the changes
+        print ("model refreshed \n changed elements = ",len(changes))
+        return len(changes)
 
     def getElements(self):
         return self.theModel
     
     def findElementId(self, name, type):
-        for element in self.theModel.values():
-            if element.get('declaredName') == name and element['@type'] == type:
-                return element['@id']
-        return None
+        return self.elementIdsByName.get((name,type))
+
+    def getElementsOfType(self, type):
+        return self.elementsByType.get(type,{})
 
     def getElementbyId(self, id):
         return self.theModel.get(id)
@@ -40,10 +456,60 @@ class SysMLModel:
         if reference and reference.get('@id'):
             return self.theModel.get(reference['@id'])
 
+    def buildIncomingReferences(self):
+        # inverts all references {'@id': ...} of the model
+        incoming={}
+        for id, element in self.theModel.items():
+            self.addIncomingReferences(incoming,id,element)
+        self.incomingReferences=incoming
+
+    def addIncomingReferences(self, incoming, id, element, remove=False):
+        # adds the references of the element to incoming or removes them
+        for property, value in element.items():
+            references=value if isinstance(value,list) else [value] if isinstance(value,dict) else []
+            for reference in references:
+                if isinstance(reference,dict) and reference.get('@id'):
+                    if not remove:
+                        incoming.setdefault(reference['@id'],{}).setdefault(property,[]).append(id)
+                        continue
+                    sources=incoming.get(reference['@id'],{}).get(property)
+                    if sources and id in sources:
+                        sources.remove(id)
+
+    def getIncomingReferences(self, id, property=None):
+        # returns the elements that reference the element with the given id
+        # if property is given, only references through this property are considered
+        if self.incomingReferences is None:
+            self.buildIncomingReferences()
+        byProperty=self.incomingReferences.get(id,{})
+        if property is not None:
+            sources=byProperty.get(property,[])
+        else:
+            sources=dict.fromkeys(source for ids in byProperty.values() for source in ids)
+        return [self.theModel[source] for source in sources if source in self.theModel]
+
+    def getWhereUsed(self, id):
+        # returns {property name: [referencing elements]} for the element with the given id
+        if self.incomingReferences is None:
+            self.buildIncomingReferences()
+        return {property:[self.theModel[source] for source in sources if source in self.theModel]
+                for property, sources in self.incomingReferences.get(id,{}).items()}
+
+    def getTypedUsages(self, definitionId):
+        # returns the features typed by the definition, found through FeatureTyping.type or the derived Feature.type
+        result={}
+        for element in self.getIncomingReferences(definitionId,'type'):
+            if element['@type']=='FeatureTyping':
+                element=self.getElement(element.get('typedFeature'))
+            if element:
+                result[element['@id']]=element
+        return result
+
     def getDirectSubclasses(self,superclass):
+        # Subclassification.general is the superclass, the subclass owns the subclassification
         result={}
-        for element in self.theModel.values():
-            if self.isDirectSubclass(element, superclass):
+        for subclassification in self.getIncomingReferences(superclass,'general'):
+            for element in self.getIncomingReferences(subclassification['@id'],'ownedSubclassification'):
                 result[element['@id']]=element
         return result
         
@@ -61,89 +527,68 @@ class SysMLModel:
         Retrieves the element(s) at the end of the metachain.
         Args:
             element (dict): The starting element from which to traverse the metachain.
-            metachain (list of lists): A list of lists, where each inner list contains two elements:
+            metachain (list of lists or MetaChain): A list of lists, where each inner list contains two elements:
                 - The type of the element (str).
                 - The name of the reference to the next element (str).
+                or a metachain compiled with compileMetaChain.
             resulttype (list, optional): A list of accepted types for the resulting element(s). If provided, only elements whose @type is in the list are returned.
+                Ignored for a compiled metachain, which contains its result types.
         Returns:
             The element(s) at the end of the metachain if found, otherwise None.
-        """      
-        def isValue(e):
-            return not isinstance(e, (list,set,dict))
-
-        wantedType = metachain[0][0]
-        attributeName = metachain[0][1]
+        """
+        chain = metachain if isinstance(metachain, MetaChain) else compileMetaChain(metachain, resulttype)
         if element is None:
             return None
         if isinstance(element, list):
-            results = [self.getMetaChain(e, metachain, resulttype) for e in element if e is not None]
-            results = [item for r in results for item in (r if isinstance(r, list) else [r]) if item is not None]
+            # the results of the single elements, flattened
+            results=[]
+            for e in element:
+                if e is not None:
+                    r=self.getMetaChain(e,chain)
+                    if isinstance(r,list):
+                        results.extend(item for item in r if item is not None)
+                    elif r is not None:
+                        results.append(r)
             return results if results else None
-        if wantedType==None or element['@type']==wantedType:
-            if attributeName not in element:
-                return None
-            if isValue( element[attributeName]):
-                # a value is never referencing another element
-                if len(metachain)==1:
-                    return element[attributeName]
-                else:
-                    return None # if we are not at the end of the chain, the value is not what we are looking for
-            elif isinstance(element[attributeName],dict):
-                # expected: reference to another element, just one entry for @id
-                subelement=self.getElement(element[attributeName])
-                if len(metachain)==1:
-                    if resulttype is not None and isinstance(subelement, dict) and subelement.get('@type') not in resulttype:
-                        return None
-                    return subelement
-                else:
-                    return self.getMetaChain(subelement,metachain[1:],resulttype)
-            elif isinstance(element[attributeName],list):
-                # expected: list of references to other elements
-                listOfSubelements=[]
-                for subElementReference in element[attributeName]:
-                    subelement=self.getElement(subElementReference)
-                    listOfSubelements.append(subelement)
-                if len(listOfSubelements)==0: listOfSubelements=None
-                if len(metachain)==1:
-                    if resulttype is not None and listOfSubelements is not None:
-                        listOfSubelements = [e for e in listOfSubelements if isinstance(e, dict) and e.get('@type') in resulttype]
-                        if len(listOfSubelements)==0: listOfSubelements=None
-                    return listOfSubelements
-                else:
-                    return self.getMetaChain(listOfSubelements,metachain[1:],resulttype)
-            else:
-                return None  
-
+        if not self.cacheMetaChains:
+            return chain.evaluate(self.theModel, element)
+        key=(element.get('@id'),chain)
+        if key in self.metaChainCache:
+            result=self.metaChainCache[key]
         else:
-            return None
+            result=self.metaChainCache[key]=chain.evaluate(self.theModel, element)
+        # the cached list must not be changed by the caller
+        return list(result) if isinstance(result,list) else result
+
+    SUBSETTED_FEATURES=compileMetaChain([[None,'ownedRelationship'],['Subsetting','subsettedFeature']])
+    OWNED_USAGES=compileMetaChain([[None,'ownedRelationship'],['OwningMembership','target']],['MetadataUsage'])
+    USED_METADATA=compileMetaChain([[None,'ownedRelationship'],['OwningMembership','target'],
+                                    ['MetadataUsage','ownedRelationship'],['FeatureTyping','type']])
+    LOWER_BOUND=compileMetaChain([['MultiplicityRange','lowerBound'],['LiteralInteger','value']])
+    UPPER_BOUND=compileMetaChain([['MultiplicityRange','upperBound'],['LiteralInteger','value']])
+    ARGUMENTS=compileMetaChain([[None,'ownedRelationship'],['ParameterMembership','target' ],
+                                ['Feature','ownedRelationship'],['FeatureValue','target']])
+    REFERENT=compileMetaChain([[None,'ownedRelationship'],['Membership','target']])
+    DEFAULT_VALUE_CANDIDATES=compileMetaChain([[None,'ownedRelationship'],['FeatureValue','target']],
+                                              ['LiteralInteger','LiteralRational','OperatorExpression'])
 
     def getSubsettedFeatures(self,element):
         # ownedSubsetting.subsettedFeature
         # return self.getMetaChain(element,[[None,'ownedSubsetting'],['Subsetting','subsettedFeature']]) only works if the repository contains derived values.       
-        return self.getMetaChain(element,[[None,'ownedRelationship'],['Subsetting','subsettedFeature']])        
+        return self.getMetaChain(element,self.SUBSETTED_FEATURES)
     
     def getUsedMetadata(self,element):
         # ownedMember.type.ownedMember
         #return self.getMetaChain(element,[[None,'ownedMember'],['MetadataUsage','type']])
         # this would only work, if derived fields have been stored.
-        return self.getMetaChain(element,[[None,'ownedRelationship'],['OwningMembership','target'],
-                                        ['MetadataUsage','ownedRelationship'],['FeatureTyping','type']]) 
+        return self.getMetaChain(element,self.USED_METADATA)
 
     def usesMetadata(self, element, metadataID):
-        metadataList = self.getUsedMetadata(element)
-        if metadataList:
-            for metadata in metadataList:
-                if metadata['@id'] == metadataID:
-                    return True
-        return False
+        return element is not None and element['@id'] in self.elementsByMetadata.get(metadataID,{})
 
     def getElementsWithMetadata(self, type, metadataID):
-        result={}
-        for element in self.theModel.values():
-            if element['@type'] == type:
-                if self.usesMetadata(element, metadataID):
-                    result[element['@id']]=element
-        return result
+        annotated=self.elementsByMetadata.get(metadataID,{})
+        return {id:element for id, element in annotated.items() if element['@type'] == type}
     
     def filterListByMetadata(self, elements, metadataID):
         result=[]
@@ -168,8 +613,8 @@ class SysMLModel:
         if multiplicityElement is None:
             return {'lowerBound': None, 'upperBound': None}
         elif multiplicityElement['@type']=='MultiplicityRange':
-            lowerBound=self.getMetaChain(multiplicityElement,[['MultiplicityRange','lowerBound'],['LiteralInteger','value']])# might be empty
-            upperBound=self.getMetaChain(multiplicityElement,[['MultiplicityRange','upperBound'],['LiteralInteger','value']])
+            lowerBound=self.getMetaChain(multiplicityElement,self.LOWER_BOUND)# might be empty
+            upperBound=self.getMetaChain(multiplicityElement,self.UPPER_BOUND)
             if not lowerBound: lowerBound=upperBound
         elif multiplicityElement['@type']=='Multiplicity':
             lowerBound=1 # the default
@@ -178,12 +623,11 @@ class SysMLModel:
 
     def getArguments(self, element):
         # returns the arguments of an element like OperatorExpression
-        return self.getMetaChain(element,[[None,'ownedRelationship'],['ParameterMembership','target' ], 
-            ['Feature','ownedRelationship'],['FeatureValue','target']])
+        return self.getMetaChain(element,self.ARGUMENTS)
 
     def getReferent(self, featureReferenceExpression):
         # returns the referent of a feature reference expression like ScalarQuantityValue
-        return self.getMetaChain(featureReferenceExpression,[[None,'ownedRelationship'],['Membership','target']])
+        return self.getMetaChain(featureReferenceExpression,self.REFERENT)
 
     def getDefaultValue(self,attributeUsage):
         # cases
@@ -191,7 +635,7 @@ class SysMLModel:
         # 2. negative numerical value: - ownedMember.argument[0].value for operator "-"
         # 3. positive scalar value:      ownedMember.argument[0].value for operator "[" ownedMember.argument[1].referent 
         # 4. negative scalar value:    - ownedMember.argument[0].argument[0].value for operator "-" ownedMember.argument[0].argument[1].referent
-        candidates = self.getOwnedFeaturesWithType(attributeUsage, ['LiteralInteger','LiteralRational','OperatorExpression'])
+        candidates = self.getMetaChain(attributeUsage, self.DEFAULT_VALUE_CANDIDATES)
         if not candidates:
             return None
         element = candidates[0]
@@ -212,68 +656,7 @@ class SysMLModel:
                 
                 return {'num':sign * argument[0]['value'],'mRef':self.getReferent(argument[1])[0]}
             
-    def asHTML(self):
-        def getName(element):
-            # if the element doesn't have a name, return the last 5 characters of the id
-            return (element.get('name') or element.get('declaredName') or element.get('shortName') or
-                    element.get('memberName') or element.get('memberShortName') or f"…{element['@id'][-5:]}")
-
-        def getHtmlReference(element):
-            try:
-                element= element if element.get('@type') else self.theModel[element['@id']]
-                return f"<span class=\"metaclass\">«{element.get('@type')}»</span> <a href=\"#{element.get('@id')}\">{getName(element)}</a>"
-            except:
-                return ""
-
-        def getValues(element,attributeName):
-            parts=[]
-            try:
-                if element.get(attributeName):
-                    theAttribute=element[attributeName]
-                    parts.append(f"<h4>{attributeName}</h4>\n")
-                    if isinstance(theAttribute,str):
-                        parts.append(f"<p>\"{theAttribute}\"</p>\n")
-                    elif isinstance(theAttribute,dict):
-                        # expected: reference to another element, just one entry for @id
-                        el=self.theModel.get(theAttribute['@id'])
-                        if el:
-                            parts.append(f"<p>{getHtmlReference(el)}</p>\n")
-                        else:
-                            parts.append(f"<p>{theAttribute['@id']}</p>\n")
-                    elif isinstance(theAttribute, (bool, int, float)):
-                        parts.append(f"<p>{theAttribute}</p>\n")
-                    else:
-                        # expected: list of references to other elements or list of strings
-                        for e in element.get(attributeName,[]):
-                            if isinstance(e, str):
-                                parts.append(f"<p>\"{e}\"</p>\n")
-                            elif isinstance(e, dict):
-                                theElement=self.theModel.get(e['@id'])
-                                if theElement:
-                                    parts.append(f"<p>{getHtmlReference(theElement)}</p>\n")
-                                else:
-                                    parts.append(f"<p>{e['@id']}</p>\n")
-                            else:
-                                parts.append(f"<p>unexpected type of {e}</p>\n")
-            except Exception as ex:
-                print(f"Error in getValues: {attributeName} - {ex}")
-            return "".join(parts)
-
-        def isReference(element):
-            # element is of {'@id': 'xyz} form
-            return isinstance(element,dict) and element.get('@id')
-
-        def isExternal(element):
-            # detect external elements:
-            # has only one property with Value: isLibraryElement==true
-            if not isinstance(element, dict):
-                return False
-            meaningful = [k for k, v in element.items() if v is not None and v != [] and k not in ['@id','@type','name','qualifiedName','elementId']]
-            return meaningful == ['isLibraryElement'] and element.get('isLibraryElement') is True
-        
-        print("asHTML")
-        parts=[f"<!doctype html><html><head><meta charset=\"UTF-8\"><title>{self.name}</title>"]
-        parts.append("""
+    HTML_STYLE="""
         <style>@import url('https://fonts.googleapis.com/css2?family=Roboto+Mono&display=swap');
         body {font-family: 'Roboto Mono', 'Courier New', monospace;}
         h3 {font-size: 12pt; font-weight: bold;margin-bottom:0;margin-top:6pt;border-top: 1px solid Lightgrey;}
@@ -281,32 +664,108 @@ class SysMLModel:
         p {font-size: 9pt; margin-left:2em; margin-top:0; margin-bottom:0;}
         summary {font-size: 9pt; font-weight: normal;margin-left:2em;}
         span.metaclass {font-size: 9pt; font-weight:normal;}</style>
-        </head>
+        """
+    VISIBLE_FIELDS=['owner','type','ownedSubclassification','superclassifier','ownedMember','argument','operator','referent','body']
+    HIDDEN_FIELDS=frozenset(VISIBLE_FIELDS).union({'@id','@type','name','qualifiedName','elementId'}) # not under more…
+
+    def getHtmlName(self, element):
+        # if the element doesn't have a name, return the last 5 characters of the id
+        return (element.get('name') or element.get('declaredName') or element.get('shortName') or
+                element.get('memberName') or element.get('memberShortName') or f"…{element['@id'][-5:]}")
+
+    def getHtmlReference(self, element):
+        try:
+            element= element if element.get('@type') else self.theModel[element['@id']]
+            return f"<span class=\"metaclass\">«{element.get('@type')}»</span> <a href=\"#{element.get('@id')}\">{self.getHtmlName(element)}</a>"
+        except:
+            return ""
+
+    def getHtmlValues(self, element, attributeName):
+        parts=[]
+        try:
+            if element.get(attributeName):
+                theAttribute=element[attributeName]
+                parts.append(f"<h4>{attributeName}</h4>\n")
+                if isinstance(theAttribute,str):
+                    parts.append(f"<p>\"{theAttribute}\"</p>\n")
+                elif isinstance(theAttribute,dict):
+                    # expected: reference to another element, just one entry for @id
+                    el=self.theModel.get(theAttribute['@id'])
+                    if el:
+                        parts.append(f"<p>{self.getHtmlReference(el)}</p>\n")
+                    else:
+                        parts.append(f"<p>{theAttribute['@id']}</p>\n")
+                elif isinstance(theAttribute, (bool, int, float)):
+                    parts.append(f"<p>{theAttribute}</p>\n")
+                else:
+                    # expected: list of references to other elements or list of strings
+                    for e in element.get(attributeName,[]):
+                        if isinstance(e, str):
+                            parts.append(f"<p>\"{e}\"</p>\n")
+                        elif isinstance(e, dict):
+                            theElement=self.theModel.get(e['@id'])
+                            if theElement:
+                                parts.append(f"<p>{self.getHtmlReference(theElement)}</p>\n")
+                            else:
+                                parts.append(f"<p>{e['@id']}</p>\n")
+                        else:
+                            parts.append(f"<p>unexpected type of {e}</p>\n")
+        except Exception as ex:
+            print(f"Error in getValues: {attributeName} - {ex}")
+        return "".join(parts)
+
+    def isExternal(self, element):
+        # detect external elements:
+        # has only one property with Value: isLibraryElement==true
+        if not isinstance(element, Mapping):
+            return False
+        meaningful = [k for k, v in element.items() if v is not None and v != [] and k not in ['@id','@type','name','qualifiedName','elementId']]
+        return meaningful == ['isLibraryElement'] and element.get('isLibraryElement') is True
+
+    def getElementHeaderHTML(self, element):
+        # metaclass, name and value of an element, without the enclosing heading
+        parts=[f"<span class=\"metaclass\">«{element['@type']}»</span>&nbsp;{self.getHtmlName(element)}"]
+        value=element.get('value')
+        if value:
+            if isinstance(value,dict) and value.get('@id'):
+                parts.append(f"&nbsp;=&nbsp;{self.getHtmlReference(value)}")
+            else:
+                parts.append(f"&nbsp;=&nbsp;{value}")
+        if self.isExternal(element):
+            parts.append(f"&nbsp;<span class=\"metaclass\">[external]</span>") 
+        return "".join(parts)
+
+    def getElementDetailHTML(self, element):
+        # the fields of an element, the less important ones under more…
+        if self.isExternal(element):
+            return ""
+        parts=[self.getHtmlValues(element,f) for f in self.VISIBLE_FIELDS]
+        parts.append("<details><summary>more…</summary>")
+        for subelement in element:
+            if subelement not in self.HIDDEN_FIELDS:
+                parts.append(self.getHtmlValues(element, subelement))
+        parts.append("</details>\n")
+        return "".join(parts)
+
+    def writeHTML(self, stream, progress=None):
+        # writes the whole model as one HTML document into the text stream, element by element
+        stream.write(f"<!doctype html><html><head><meta charset=\"UTF-8\"><title>{self.name}</title>")
+        stream.write(self.HTML_STYLE)
+        stream.write("""</head>
         <body>
         """)
-        visibleFields=['owner','type','ownedSubclassification','superclassifier','ownedMember','argument','operator','referent','body']
-        for element in self.theModel.values():
-            parts.append(f"<h3 id=\"{element['@id']}\"><span class=\"metaclass\">«{element['@type']}»</span>&nbsp;{getName(element)}")
-            if element.get('value'):
-                if isReference(element['value']):
-                    parts.append(f"&nbsp;=&nbsp;{getHtmlReference(element['value'])}")
-                else:
-                    parts.append(f"&nbsp;=&nbsp;{element['value']}")
-            if isExternal(element):
-                parts.append(f"&nbsp;<span class=\"metaclass\">[external]</span>") 
-                parts.append("</h3>\n")
-            else: 
-                parts.append("</h3>\n")
-                for f in visibleFields:
-                    parts.append(getValues(element,f))
-                parts.append("<details><summary>more…</summary>")
-                for subelement in element:
-                    if subelement not in set(visibleFields).union({'@id','@type','name','qualifiedName','elementId'}):
-                        parts.append(getValues(element, subelement))
-                parts.append("</details>\n")
-        parts.append("</body></html>")
-        s = "".join(parts)
-        with open("model.api.html", "w", encoding="utf-8") as f:
-            f.write(s)
-        print ("model.api.html created")
-        return s     
+        for count, element in enumerate(self.theModel.values()):
+            stream.write(f"<h3 id=\"{element['@id']}\">{self.getElementHeaderHTML(element)}</h3>\n")
+            stream.write(self.getElementDetailHTML(element))
+            if progress and count % PROGRESS_ELEMENTS == 0:
+                progress("html",count,len(self.theModel))
+        stream.write("</body></html>")
+
+    def getHTMLFile(self, progress=None):
+        # the path of the HTML document of the loaded commit, it is only written once per commit
+        return getViewCache().file(self.project, self.commit, "model.html", lambda stream: self.writeHTML(stream, progress))
+
+    def asHTML(self):
+        # the whole model as one HTML document, the file of getHTMLFile
+        # for large models the ModelBrowser is faster, it only renders the visible elements
+        return self.getHTMLFile().read_text(encoding="utf-8")
@@ -1,20 +1,134 @@
 # functions to retrieve LCA data from a SysML model
-from SysMLModel import SysMLModel
+import uuid
+from SysMLModel import SysMLModel, compileMetaChain
+from SysMLAPI import getHeadCommit, queryElements, getElementsById, getClosure, primitiveConstraint, compositeConstraint, postCommit, getViewCache
+
+LCA_METADATA_NAMES=["LCA-Part","LCA-Exchange","LCA-Flow","ExternalRef"]
+# properties followed from the annotated elements to reach everything getLCAParts needs:
+# owned relationships and their targets (metadata, exchanges, values, units), the subsetted flows,
+# the subparts with their multiplicities and their part definitions
+LCA_SUBSET_PROPERTIES=['ownedRelationship','target','subsettedFeature','ownedPart','type','multiplicity','lowerBound','upperBound']
+
+def getLCASubset(host, project, commit):
+    # returns {id: element} with only the LCA metadata definitions, the elements annotated with them
+    # and the closure of these elements through LCA_SUBSET_PROPERTIES
+    # The closure contains the whole part hierarchies of the LCA parts, so the subset only saves much
+    # when the LCA data is a small part of the model.
+    definitions=queryElements(host,project,compositeConstraint('and',[
+        primitiveConstraint('@type','MetadataDefinition'),
+        compositeConstraint('or',[primitiveConstraint('declaredName',name) for name in LCA_METADATA_NAMES])]),commit)
+    definitionIds={d['@id'] for d in definitions}
+    usages=queryElements(host,project,primitiveConstraint('@type','MetadataUsage'),commit)
+    elements={e['@id']:e for e in definitions+usages}
+    # the typings and owning memberships of the metadata usages tell which elements are annotated
+    related=[r['@id'] for u in usages for r in (u.get('ownedRelationship') or [])+[u.get('owningRelationship')] if r]
+    elements.update(getElementsById(host,project,commit,related))
+    annotated=[]
+    for usage in usages:
+        typings=[elements.get(r['@id']) for r in usage.get('ownedRelationship') or []]
+        if any(t and t['@type']=='FeatureTyping' and (t.get('type') or {}).get('@id') in definitionIds for t in typings):
+            membership=elements.get((usage.get('owningRelationship') or {}).get('@id'))
+            owner=membership.get('owningRelatedElement') if membership else None
+            if owner:
+                annotated.append(owner['@id'])
+    return getClosure(host,project,commit,annotated,LCA_SUBSET_PROPERTIES,elements)
+
+FLOWS_PACKAGE="openLCAFlows" # package with the LCA flows published from openLCA
+
+def newElement(elements, elementType, **properties):
+    # creates a new element for a commit and adds it to elements {id: element}
+    element={'@id':str(uuid.uuid4()),'@type':elementType,'ownedRelationship':[]}
+    element.update(properties)
+    elements[element['@id']]=element
+    return element
+
+def ownElement(elements, owner, relationshipType, target, **properties):
+    # adds target to owner with a new owning relationship like OwningMembership or FeatureValue
+    relationship=newElement(elements, relationshipType, owningRelatedElement={'@id':owner['@id']},
+                            source=[{'@id':owner['@id']}], target=[{'@id':target['@id']}],
+                            ownedRelatedElement=[{'@id':target['@id']}], **properties)
+    owner['ownedRelationship'].append({'@id':relationship['@id']})
+    target['owningRelationship']={'@id':relationship['@id']}
+    return relationship
+
+# derived from ownedRelationship, the server recomputes them for a changed namespace
+DERIVED_MEMBERS=('ownedMember','member','ownedElement','ownedMembership','membership')
+
+def withoutDerivedMembers(element):
+    # a copy of the namespace for a commit that changes its ownedRelationship,
+    # so the derived members do not keep pointing at removed elements
+    return {key:value for key,value in element.items() if key not in DERIVED_MEMBERS}
+
+def asList(value):
+    # properties like target are lists in the current API and single references in older versions
+    if value is None:
+        return []
+    return value if isinstance(value,list) else [value]
 
 class SysMLLCAModel(SysMLModel):
+    lcaSubset=False
     LCAPartId=""
     ExchangeId=""
     FlowId=""
     ExternalRefId=""
+
+    OWNED_ATTRIBUTES=compileMetaChain([[None,'ownedRelationship'],['FeatureMembership','target']],['AttributeUsage'])
+    OWNED_METADATA_USAGES=compileMetaChain([[None,'ownedRelationship'],['OwningMembership','target']],['MetadataUsage'])
+    FEATURE_MEMBERSHIPS=compileMetaChain([[None,'ownedRelationship']],['FeatureMembership'])
+    REFERENCED_STRING=compileMetaChain([[None,'target'],['ReferenceUsage','ownedRelationship'],
+                                        ['FeatureValue','target'],['LiteralString','value']])
+    OWNED_MEMBERS=compileMetaChain([[None,'ownedRelationship'],['OwningMembership','target']])
+    OWNED_FEATURES=compileMetaChain([[None,'ownedRelationship'],['FeatureMembership','target']])
+    FEATURE_TYPINGS=compileMetaChain([[None,'ownedRelationship']],['FeatureTyping'])
     
-    def __init__(self, host, project, commit=None):
+    def __init__(self, host, project, commit=None, compact=False, lcaSubset=False, progress=None):
+        # lcaSubset: load only the elements needed for the LCA data (see getLCASubset) instead of the whole project
         print ("SysMLLCAModel: ",host,project,commit)
-        super().__init__(host, project, commit)
+        self.lcaSubset=lcaSubset
+        super().__init__(host, project, commit, compact, progress)
+        self.findLCAMetadata()
+
+    @classmethod
+    def fromElements(cls, elements, name="", project="", commit=None, compact=False):
+        model=super().fromElements(elements, name, project, commit, compact)
+        model.lcaSubset=False
+        model.findLCAMetadata()
+        return model
+
+    def findLCAMetadata(self):
+        # the ids of the metadata definitions of the LCA library
         self.LCAPartId = self.findElementId(name="LCA-Part", type="MetadataDefinition")
         self.ExchangeId = self.findElementId(name="LCA-Exchange", type="MetadataDefinition")  
         self.FlowId = self.findElementId(name="LCA-Flow", type="MetadataDefinition")
         self.ExternalRefId = self.findElementId(name="ExternalRef", type="MetadataDefinition")
 
+    def fetchElements(self, progress=None):
+        # if the subset cannot be queried, e.g. because the server does not support the queries or failed,
+        # the complete model is loaded instead
+        if self.lcaSubset:
+            try:
+                elements=getLCASubset(self.host,self.project,self.commit)
+            except Exception as e:
+                print(f"Warning: LCA subset could not be loaded ({e}), loading the complete model")
+                self.lcaSubset=False
+                return super().fetchElements(progress)
+            if progress:
+                progress("elements",len(elements),len(elements))
+            return elements.values()
+        return super().fetchElements(progress)
+
+    def refresh(self):
+        # the changes of a commit are not limited to the subset, so the subset is loaded again
+        if not self.lcaSubset:
+            return super().refresh()
+        head=getHeadCommit(self.host,self.project)
+        if head==self.commit:
+            return 0
+        self.commit=head
+        self.loadElements(self.fetchElements())
+        self.buildIndexes()
+        return len(self.theModel)
+
     def getFlows(self):
         # all attributes with metadata LCA-Flow
         # returns {id1:extRef1, id2:extRef2,...}
@@ -29,57 +143,245 @@ class SysMLLCAModel(SysMLModel):
         # returns {id1:exchange1, id2:exchange2,...} 
         return self.getElementsWithMetadata("AttributeUsage", self.ExchangeId)
 
-    def getLCAParts(self):
-        # all part definitions with lcapart metadata
-        
-        def getExchangesOfPart(part, flows, factor=1):
-            result=[]
-            ownedAttributes=self.getMetaChain(part,[[None,'ownedRelationship'],['FeatureMembership','target']],['AttributeUsage'])
-            exchanges=self.filterListByMetadata(ownedAttributes,self.ExchangeId)
-            if exchanges:
-                for exchange in exchanges:
-                    lcaFlow=self.getSubsettedFeatures(exchange)
-                    for f in lcaFlow:
-                        if  f['@id'] in flows:
-                            value=self.getDefaultValue(exchange)
-                            value['num']=value['num']*factor
-                            result.append({'id':flows[f['@id']],'name':f['declaredName'],'value':value})
-                            break # we assume that there is only one LCA-Flow per exchange
+    def getLCAParts(self, progress=None):
+        # all part definitions with lcapart metadata, see computeLCAParts
+        # the result only depends on the commit, so it is computed once per commit. It is shared by all callers
+        # and must not be changed.
+        return getViewCache().value(self.project,self.commit,"lcaparts.pickle",lambda: self.computeLCAParts(progress))
+
+    def computeLCAParts(self, progress=None):
+        # The exchanges of a part definition are its own exchanges and the exchanges of the definitions
+        # of its subparts, down the whole part hierarchy and scaled by the multiplicities along the path.
+        # Each definition is rolled up only once and exchanges with the same flow and unit are added.
+        flows=self.getFlows()
+        rollups={} # definition id -> {(flow id, unit id): exchange}
+        visiting=set()
+
+        def addExchange(exchanges, exchange, factor):
+            value=exchange['value']
+            key=(exchange['flow'], value['mRef']['@id'] if value['mRef'] else None)
+            if key in exchanges:
+                exchanges[key]['value']['num']+=value['num']*factor
+            else:
+                exchanges[key]=dict(exchange,value=dict(value,num=value['num']*factor))
+
+        def getExchangesOfPart(part):
+            if part['@id'] in rollups:
+                return rollups[part['@id']]
+            if part['@id'] in visiting:
+                raise Exception(f"Part definition {part.get('declaredName')} contains itself")
+            visiting.add(part['@id'])
+            result={}
+            for exchange in self.getOwnExchanges(part,flows):
+                addExchange(result,exchange,1)
+            for count, partDefinition in self.getSubpartDefinitions(part):
+                for exchange in getExchangesOfPart(partDefinition).values():
+                    addExchange(result,exchange,count)
+            visiting.discard(part['@id'])
+            rollups[part['@id']]=result
             return result
 
         result=[]
-        flows=self.getFlows()
         lcaParts=self.getElementsWithMetadata("PartDefinition",self.LCAPartId)
         for part in lcaParts.values(): # create an LCA process
-            partEntry={"name":part['declaredName'],"exchanges":[]}
-            partEntry["exchanges"].extend(getExchangesOfPart(part, flows))
-            for subpart in part['ownedPart']:
-                subpartEntry=self.getElement(subpart)
-                count=self.getMultiplicity(subpartEntry).get('lowerBound',1)# we take the minimal value
-                print("Subpart: ",subpartEntry['declaredName'],count,subpartEntry.get('type'))
-                for type_ref in subpartEntry.get('type', []):
-                    print("Type: ",type_ref)
-                    partDefinition=self.getElement(type_ref)
-                    partEntry["exchanges"].extend(getExchangesOfPart(partDefinition, flows, count))
-            result.append(partEntry)
+            exchanges=[dict(exchange,value=dict(exchange['value'])) for exchange in getExchangesOfPart(part).values()]
+            result.append({"id":part['@id'],"name":part['declaredName'],"exchanges":exchanges})
+            if progress:
+                progress("parts",len(result),len(lcaParts))
         return result
     
+    def getOwnExchanges(self, part, flows):
+        # the exchanges defined directly in a part definition, without its subparts
+        # flows: the result of getFlows()
+        result=[]
+        ownedAttributes=self.getMetaChain(part,self.OWNED_ATTRIBUTES)
+        for exchange in self.filterListByMetadata(ownedAttributes,self.ExchangeId):
+            for f in self.getSubsettedFeatures(exchange) or []:
+                if f['@id'] in flows:
+                    value=self.getDefaultValue(exchange)
+                    if value is None:
+                        print(f"Warning: Exchange {exchange.get('declaredName')} of {part.get('declaredName')} has no value, skipping exchange")
+                    else:
+                        result.append({'id':flows[f['@id']],'name':f['declaredName'],'flow':f['@id'],'value':value})
+                    break # we assume that there is only one LCA-Flow per exchange
+        return result
+
+    def getPartCount(self, partUsage):
+        # we take the minimal value, a part without multiplicity counts once
+        count=self.getMultiplicity(partUsage)['lowerBound']
+        if isinstance(count,list):
+            count=count[0] if count else None
+        return 1 if count is None else count
+
+    def getSubpartDefinitions(self, part):
+        # returns [(count, part definition),...] for the subparts of a part definition
+        result=[]
+        for subpart in part.get('ownedPart') or []:
+            subpartEntry=self.getElement(subpart)
+            if subpartEntry is None:
+                continue
+            count=self.getPartCount(subpartEntry)
+            for type_ref in subpartEntry.get('type') or []:
+                partDefinition=self.getElement(type_ref)
+                if partDefinition is not None:
+                    result.append((count,partDefinition))
+        return result
+
+    def getInventoryMatrix(self):
+        # the exchanges and the part hierarchy of all LCA parts as NumPy arrays, see InventoryMatrix
+        # numpy is only needed for this method
+        from InventoryMatrix import InventoryMatrix
+        return InventoryMatrix.fromModel(self)
+
+    def getFlowsPackageChanges(self, flows, packageName=FLOWS_PACKAGE):
+        # compares the flows of openLCAServer.getSysMLFlows with the attributes with @lcaflow in the package
+        # returns the changes for postCommit {id: element or None} and the numbers of added, changed and removed flows
+        # flows that already have an attribute with @lcaflow outside of the package are not added
+        if not self.FlowId:
+            raise Exception("No LCA-Flow metadata definition found in project")
+        changes={}
+        counts={'added':0,'changed':0,'removed':0}
+        packageId=self.findElementId(name=packageName, type="Package")
+        if packageId:
+            package=withoutDerivedMembers(self.theModel[packageId])
+            package['ownedRelationship']=list(package.get('ownedRelationship') or [])
+        else:
+            root=next((n for n in self.getElementsOfType("Namespace").values() if not n.get('owningRelationship')),None)
+            if root is None:
+                raise Exception(f"No root namespace found in project for the package {packageName}")
+            package=newElement(changes,"Package",declaredName=packageName,name=packageName)
+            root=changes[root['@id']]=withoutDerivedMembers(root)
+            root['ownedRelationship']=list(root.get('ownedRelationship') or [])
+            ownElement(changes,root,"OwningMembership",package,memberName=packageName)
+        existing={} # uuid -> attribute in the package
+        for attribute in (self.getMetaChain(package,self.OWNED_MEMBERS) if packageId else None) or []:
+            if attribute['@type']=="AttributeUsage" and self.usesMetadata(attribute,self.FlowId):
+                existing.setdefault(self.getExternalRef(attribute),attribute)
+        elsewhere=set(self.getFlows().values())-set(existing)
+        published=set()
+        for flow in flows:
+            if flow['uuid'] in published:
+                continue
+            published.add(flow['uuid'])
+            typeId=self.findFlowPropertyType(flow['flowProperty'])
+            attribute=existing.get(flow['uuid'])
+            if attribute is not None:
+                if self.updateFlowAttribute(changes,attribute,flow['name'],typeId):
+                    counts['changed']+=1
+            elif flow['uuid'] not in elsewhere:
+                self.newFlowAttribute(changes,package,flow['name'],typeId,flow['uuid'])
+                counts['added']+=1
+        for flowId, attribute in existing.items():
+            if flowId not in published:
+                membership=attribute.get('owningRelationship')
+                package['ownedRelationship']=[r for r in package['ownedRelationship'] if r!=membership]
+                for id in self.getOwnedTree(attribute)+[membership['@id']]:
+                    changes[id]=None
+                counts['removed']+=1
+        if changes:
+            changes[package['@id']]=package
+        return changes, counts
+
+    def publishFlows(self, flows, packageName=FLOWS_PACKAGE):
+        # writes the changed flows of openLCAServer.getSysMLFlows as one commit into the package
+        # and updates the model to this commit. Returns the numbers of added, changed and removed flows
+        changes, counts=self.getFlowsPackageChanges(flows, packageName)
+        if changes:
+            postCommit(self.host,self.project,changes,self.commit)
+            self.refresh()
+        return counts
+
+    def findFlowPropertyType(self, flowProperty):
+        # the attribute definition for a flow property like Mass, e.g. from the openLCA library package
+        if not flowProperty:
+            return self.findElementId(name="Integer", type="DataType")
+        return self.findElementId(name=flowProperty, type="AttributeDefinition")
+
+    def findUuidFeature(self):
+        # the feature uuid of the metadata definitions LCA-Flow or ExternalRef, which is redefined by @lcaflow
+        for definitionId in (self.FlowId, self.ExternalRefId):
+            definition=self.getElementbyId(definitionId) if definitionId else None
+            for feature in (self.getMetaChain(definition,self.OWNED_FEATURES) if definition else None) or []:
+                if feature.get('declaredName')=="uuid":
+                    return feature
+        return None
+
+    def newFlowAttribute(self, changes, package, name, typeId, flowUuid):
+        # attribute 'name' : type { @lcaflow{uuid="flowUuid";} }
+        attribute=newElement(changes,"AttributeUsage",declaredName=name,name=name)
+        ownElement(changes,package,"OwningMembership",attribute,memberName=name)
+        if typeId:
+            typing=newElement(changes,"FeatureTyping",owningRelatedElement={'@id':attribute['@id']},
+                              typedFeature={'@id':attribute['@id']},type={'@id':typeId},
+                              source=[{'@id':attribute['@id']}],target=[{'@id':typeId}])
+            attribute['ownedRelationship'].append({'@id':typing['@id']})
+        metadata=newElement(changes,"MetadataUsage")
+        ownElement(changes,attribute,"OwningMembership",metadata)
+        metadataTyping=newElement(changes,"FeatureTyping",owningRelatedElement={'@id':metadata['@id']},
+                                  typedFeature={'@id':metadata['@id']},type={'@id':self.FlowId},
+                                  source=[{'@id':metadata['@id']}],target=[{'@id':self.FlowId}])
+        metadata['ownedRelationship'].append({'@id':metadataTyping['@id']})
+        reference=newElement(changes,"ReferenceUsage",declaredName="uuid",name="uuid")
+        ownElement(changes,metadata,"FeatureMembership",reference,memberName="uuid")
+        uuidFeature=self.findUuidFeature()
+        if uuidFeature:
+            redefinition=newElement(changes,"Redefinition",owningRelatedElement={'@id':reference['@id']},
+                                    redefiningFeature={'@id':reference['@id']},redefinedFeature={'@id':uuidFeature['@id']},
+                                    source=[{'@id':reference['@id']}],target=[{'@id':uuidFeature['@id']}])
+            reference['ownedRelationship'].append({'@id':redefinition['@id']})
+        ownElement(changes,reference,"FeatureValue",newElement(changes,"LiteralString",value=flowUuid))
+        return attribute
+
+    def updateFlowAttribute(self, changes, attribute, name, typeId):
+        # renames the attribute and changes its type, returns True if something changed
+        changed=False
+        if attribute.get('declaredName')!=name:
+            updated=changes[attribute['@id']]=dict(attribute,declaredName=name)
+            if 'name' in updated:
+                updated['name']=name
+            membership=self.getElement(attribute.get('owningRelationship'))
+            if membership is not None and membership.get('memberName')!=name:
+                changes[membership['@id']]=dict(membership,memberName=name)
+            changed=True
+        typings=self.getMetaChain(attribute,self.FEATURE_TYPINGS)
+        if typeId and typings and (typings[0].get('type') or {}).get('@id')!=typeId:
+            changes[typings[0]['@id']]=dict(typings[0],type={'@id':typeId},target=[{'@id':typeId}])
+            changed=True
+        return changed
+
+    def getOwnedTree(self, element):
+        # the ids of the element and of everything it owns through its owned relationships
+        result=[]
+        pending=[element]
+        while pending:
+            current=pending.pop()
+            result.append(current['@id'])
+            for relationshipRef in current.get('ownedRelationship') or []:
+                relationship=self.getElement(relationshipRef)
+                if relationship is None:
+                    continue
+                pending.append(relationship)
+                owned=relationship.get('ownedRelatedElement')
+                if owned is None: # older API versions only have target
+                    owned=[t for t in asList(relationship.get('target'))
+                           if (self.getElement(t) or {}).get('owningRelationship')==relationshipRef]
+                pending.extend(e for e in (self.getElement(r) for r in asList(owned)) if e is not None)
+        return result
+
     def getExternalRef(self, element):
         # finds the Metadata with the external reference uuid
         # assumption: the AttributeDefinition has only one MetadataUsage and this is ExternalRef or a substype like lca-flow
         # element.ownedMember.feature.ownedMember.value
-        metadataUsage = self.getMetaChain(element,[[None,'ownedRelationship'],['OwningMembership','target']],['MetadataUsage'])
+        metadataUsage = self.getMetaChain(element,self.OWNED_METADATA_USAGES)
         # tbd:filter those that are typed by ExternalRef
-        feature = self.getMetaChain(metadataUsage,[[None,'ownedRelationship']],['FeatureMembership'])
+        feature = self.getMetaChain(metadataUsage,self.FEATURE_MEMBERSHIPS)
         if feature:
             feature = [f for f in feature if f.get('memberName') == 'uuid']
         
             #print("getExternalRef: ", element['declaredName'],self.getMetaChain(feature,[[None,'target'],
             #                                ['ReferenceUsage','ownedRelationship'],['FeatureValue','target'],
             #                                ['LiteralString','value']])[0])
-            return self.getMetaChain(feature,[[None,'target'],
-                                            ['ReferenceUsage','ownedRelationship'],['FeatureValue','target'],
-                                            ['LiteralString','value']])[0]
+            return self.getMetaChain(feature,self.REFERENCED_STRING)[0]
         else:
             return None
         # return self.getMetaChain(element,[[None,'ownedMember'],['MetadataUsage','feature'],['ReferenceUsage','ownedMember'],['LiteralString','value']])
@@ -0,0 +1,120 @@
+# cache for results derived from a commit, like the HTML of the model or the LCA parts
+# A commit never changes, so a result is valid forever. The results are kept in memory and as files in the
+# directory of the element cache, which also removes them when the directory exceeds its size limit.
+# VIEW_VERSION is part of each key, it has to be increased when the rendering of a cached result changes
+# or when the classes of a pickled result change. Pickled results also depend on the Python version.
+# A result that cannot be read, e.g. a pickle of a renamed class, is computed again. Like the pickled entries of
+# the element cache, pickled results are only read from a directory that other users cannot write to.
+# Results of a model without a commit, e.g. of SysMLModel.fromElements, are not cached, because they have no key.
+# The cache is used by the GUI thread and the background workers, the memory is guarded by a lock. A result may be
+# computed twice if two threads ask for it at the same time.
+
+import io
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from ElementCache import isPrivateDirectory, makePrivateDirectory
+
+VIEW_VERSION = 1
+PICKLE_FORMAT = f"py{sys.version_info[0]}{sys.version_info[1]}"
+MEMORY_ENTRIES = 32 # results kept in memory, large HTML documents are only kept as files
+
+
+class ViewCache:
+
+    def __init__(self, directory, elementCache=None, memoryEntries=MEMORY_ENTRIES):
+        self.directory = Path(directory)
+        self.elementCache = elementCache # evicts the files of both caches together
+        self.memory = OrderedDict()
+        self.memoryEntries = memoryEntries
+        self.lock = threading.Lock()
+
+    def path(self, project, commit, name, format=""):
+        return self.directory / f"{project}_{commit}.v{VIEW_VERSION}{format}.{name}"
+
+    def remember(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memoryEntries:
+                self.memory.popitem(last=False)
+
+    def recall(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return True, self.memory[key]
+            return False, None
+
+    def writeFile(self, path, write, binary=False):
+        # write(stream) writes the content, the file only becomes visible when it is complete
+        makePrivateDirectory(self.directory)
+        handle, tempName = tempfile.mkstemp(dir=self.directory, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+                write(f)
+            os.replace(tempName, path)
+        finally:
+            Path(tempName).unlink(missing_ok=True)
+        if self.elementCache:
+            self.elementCache.evict(keep=path)
+
+    def file(self, project, commit, name, write):
+        # returns the path of the text file written by write(stream), e.g. a HTML document to open in a browser
+        # without a commit, the file is written again with a new name each time
+        path = self.path(project, commit if commit is not None else f"none-{uuid.uuid4()}", name)
+        if not path.exists():
+            self.writeFile(path, write)
+        elif self.elementCache:
+            self.elementCache.touch(path)
+        return path
+
+    def text(self, project, commit, name, write):
+        # returns the text written by write(stream)
+        if commit is None:
+            stream = io.StringIO()
+            write(stream)
+            return stream.getvalue()
+        key = (VIEW_VERSION, project, commit, name)
+        found, text = self.recall(key)
+        if not found:
+            path = self.path(project, commit, name)
+            if path.exists():
+                text = path.read_text(encoding="utf-8")
+            else:
+                stream = io.StringIO()
+                write(stream)
+                text = stream.getvalue()
+                self.writeFile(path, lambda f: f.write(text))
+            self.remember(key, text)
+        return text
+
+    def value(self, project, commit, name, compute):
+        # returns the result of compute(), it must be picklable. The same object is returned to all callers,
+        # so callers must not change it
+        if commit is None:
+            return compute()
+        key = (VIEW_VERSION, PICKLE_FORMAT, project, commit, name)
+        found, value = self.recall(key)
+        if not found:
+            path = self.path(project, commit, name, f".{PICKLE_FORMAT}")
+            try:
+                if not isPrivateDirectory(self.directory):
+                    raise PermissionError(f"{self.directory} is writable by other users")
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+            except Exception:
+                # missing, incomplete or written by an incompatible version
+                value = compute()
+                self.writeFile(path, lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL), binary=True)
+            self.remember(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
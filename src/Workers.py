@@ -0,0 +1,57 @@
+# runs long operations like loading a model or synchronizing with openLCA on a thread of the QThreadPool
+# The function gets a progress callback (see SysMLAPI.OperationCancelled), which passes the progress to the
+# GUI thread as a signal and raises OperationCancelled once cancel() has been called. So an operation stops
+# at its next progress report, which happens at least once per downloaded chunk, page or synchronized part.
+
+import time
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from SysMLAPI import OperationCancelled
+
+PROGRESS_INTERVAL = 0.1 # seconds between two progress signals of the same phase
+
+
+class WorkerSignals(QObject):
+    # a QRunnable is no QObject, so its signals are sent by this object. They are received in the GUI thread.
+    progress = pyqtSignal(str, int, int) # phase, done, total or -1 if unknown
+    finished = pyqtSignal(object)        # the result of the function
+    failed = pyqtSignal(str)             # the message of the exception
+    cancelled = pyqtSignal()
+
+
+class Worker(QRunnable):
+
+    def __init__(self, function, *args, **kwargs):
+        # runs function(*args, progress=callback, **kwargs)
+        super().__init__()
+        self.setAutoDelete(False) # the caller keeps a reference, so the worker is deleted by Python
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancelRequested = False
+        self.lastReport = {} # phase -> time of the last progress signal
+
+    def cancel(self):
+        self.cancelRequested = True
+
+    def progress(self, phase, done, total=None):
+        if self.cancelRequested:
+            raise OperationCancelled()
+        # downloads report each chunk, so the signals are limited to keep the event loop of the GUI responsive
+        now = time.monotonic()
+        if total is None or done < total:
+            if now - self.lastReport.get(phase, 0) < PROGRESS_INTERVAL:
+                return
+        self.lastReport[phase] = now
+        self.signals.progress.emit(phase, int(done), -1 if total is None else int(total))
+
+    def run(self):
+        try:
+            result = self.function(*self.args, progress=self.progress, **self.kwargs)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
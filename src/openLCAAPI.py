@@ -1,68 +1,227 @@
 import olca_ipc as openLCA
 import olca_schema
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from openLCAMirror import FlowCatalog
 
 numberOfItems="01846770-4cfe-4a25-8ad9-919d8d378345"
 # tbd: this is a hack to get the unit for the number of items. The unit should be retrieved from the flow property.
 # This only works for the elcd database 
 
+CACHE_SIZE=10000 # flows and flow properties kept per server
+SYNC_WORKERS=4 # concurrent requests to the openLCA server when processes are created
+
+def syncTag(name:str, value:str):
+    # tags of the objects created by syncProcesses, e.g. sysml-id:<id of the part definition>
+    return f"{name}:{value}"
+
+def getTagValue(entity, name:str):
+    prefix=f"{name}:"
+    for tag in entity.tags or []:
+        if tag.startswith(prefix):
+            return tag[len(prefix):]
+    return None
+
+def hashedValue(value):
+    # the value of an exchange with the unit element mRef replaced by its id
+    value=dict(value)
+    if value.get('mRef') is not None:
+        value['mRef']=value['mRef']['@id']
+    return value
+
+def exchangesHash(partName:str, exchanges):
+    # hash of the exchanges of a part including their units, independent of the order of the exchanges
+    content=[partName,sorted(json.dumps([str(exch['id']),hashedValue(exch['value'])],sort_keys=True,default=str)
+                             for exch in exchanges)]
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()[:16]
+
 class openLCAServer:
     client=None
+    cache=None # (type, id) -> entity or None if it does not exist, least recently used first
+    mirror=None # FlowCatalog of the database or None
 
-    def __init__(self, openLCAServer):
+    def __init__(self, openLCAServer, cacheSize=CACHE_SIZE, mirrorPath=None):
+        # mirrorPath: file of a local FlowCatalog for tag filters, statistics and search, e.g. openLCAMirror.mirrorPath(url)
+        self.url=openLCAServer
         self.client=openLCA.Client(openLCAServer)
+        self.cache=OrderedDict()
+        self.cacheSize=cacheSize
+        self.cacheLock=threading.Lock()
+        self.clients=threading.local()
+        self.clients.client=self.client
+        if mirrorPath:
+            self.mirror=FlowCatalog(self.getClient, mirrorPath)
+
+    def refreshMirror(self):
+        # updates the mirror from the server, e.g. after the database has been changed in openLCA
+        if self.mirror:
+            self.mirror.refresh(olca_schema.Flow)
+            self.mirror.refresh(olca_schema.Process)
+
+    def getClient(self):
+        # the olca_ipc client is based on a requests.Session, which should not be shared by threads,
+        # so each thread gets a client of its own
+        client=getattr(self.clients,'client',None)
+        if client is None:
+            client=self.clients.client=openLCA.Client(self.url)
+        return client
+
+    def getCached(self, type, id:str):
+        # returns the entity with the id from the cache or the server, each id is fetched only once
+        key=(type,id)
+        with self.cacheLock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        entity=self.getClient().get(type, id)
+        self.addToCache(type, id, entity)
+        return entity
+
+    def addToCache(self, type, id:str, entity):
+        with self.cacheLock:
+            self.cache[(type,id)]=entity
+            self.cache.move_to_end((type,id))
+            while len(self.cache)>self.cacheSize:
+                self.cache.popitem(last=False)
+
+    def invalidateCache(self, ids=None):
+        # removes the entities with the ids from the cache or all entities,
+        # e.g. after they have been changed in openLCA
+        with self.cacheLock:
+            if ids is None:
+                self.cache.clear()
+            else:
+                ids=set(ids)
+                for key in [key for key in self.cache if key[1] in ids]:
+                    del self.cache[key]
+
+    def getFlow(self, id:str) -> olca_schema.Flow | None:
+        return self.getCached(olca_schema.Flow, id)
+
+    def getFlowProperty(self, id:str) -> olca_schema.FlowProperty | None:
+        return self.getCached(olca_schema.FlowProperty, id)
+
+    def warmFlowCache(self, ids, executor=None):
+        # fetches the flows with the ids that are not cached yet, e.g. all flows referenced by the parts
+        # of a SysML model before they are synchronized. Returns the number of fetched flows.
+        # With an executor, e.g. the one of runParallel, the flows are fetched concurrently. A failed fetch
+        # is not raised here, the flow is fetched again by the task that needs it.
+        with self.cacheLock:
+            missing=[id for id in dict.fromkeys(ids) if (olca_schema.Flow,id) not in self.cache]
+        if executor is None:
+            for id in missing:
+                self.getFlow(id)
+        else:
+            wait([executor.submit(self.getFlow,id) for id in missing])
+        return len(missing)
 
     def getTaggedProcesses(self, tag:str):
-        # could be used for tag "from sysml model"
-        processes : list[olca_schema.Process] = self.client.get_all(olca_schema.Process)
+        # e.g. the processes of a SysML project synchronized by syncProcesses
+        if self.mirror:
+            # only the tagged processes are fetched completely
+            self.mirror.refreshIfStale(olca_schema.Process)
+            processes=[self.getClient().get(olca_schema.Process, id) for id in self.mirror.taggedIds(olca_schema.Process, tag)]
+            return [process for process in processes if process and process.tags and tag in process.tags]
+        processes : list[olca_schema.Process] = self.getClient().get_all(olca_schema.Process)
         # Filter processes by tag property
         filtered_processes = [process for process in processes if process.tags and tag in process.tags]
         return filtered_processes
 
     def getFlows(self) -> list[olca_schema.Flow]:
-        return self.client.get_all(olca_schema.Flow)
+        flows=self.getClient().get_all(olca_schema.Flow)
+        for flow in flows[:self.cacheSize]:
+            self.addToCache(olca_schema.Flow, flow.id, flow)
+        return flows
 
     def getTaggedFlows(self, tag:str) -> list[olca_schema.Flow]:
+        if self.mirror:
+            self.mirror.refreshIfStale(olca_schema.Flow)
+            flows = [self.getFlow(id) for id in self.mirror.taggedIds(olca_schema.Flow, tag)]
+            return sorted((flow for flow in flows if flow), key=lambda flow: flow.name or "")
         flows = self.getFlows()
         filtered_flows = [flow for flow in flows if flow.tags and tag in flow.tags]  
         return filtered_flows
 
-    def getSysMLFlowsPackage(self, tag:str):
-        flows = self.getTaggedFlows(tag)
-        s:str="package openLCAFlows{\n\n"
-        s+="    public import openLCA::*;\n\n"
+    def getSysMLFlows(self, tag:str):
+        # the tagged flows as they are represented in SysML
+        # returns [{'uuid', 'name', 'flowProperty': name of the reference flow property or None, 'unit'}, ...]
+        result=[]
+        for flow in self.getTaggedFlows(tag):
+            refProperty=next((fp.flow_property for fp in flow.flow_properties or [] if fp.is_ref_flow_property and fp.flow_property), None)
+            result.append({'uuid':flow.id,'name':flow.name,
+                           'flowProperty':refProperty.name if refProperty else None,
+                           'unit':refProperty.ref_unit if refProperty else None})
+        return result
+
+    def writeSysMLFlowsPackage(self, stream, tag:str, flows=None):
+        # writes the package openLCAFlows with the tagged flows as SysML text into the stream
+        flows = self.getSysMLFlows(tag) if flows is None else flows
+        stream.write("package openLCAFlows{\n\n")
+        stream.write("    public import openLCA::*;\n\n")
         for flow in flows:
-            s+="    attribute '"+flow.name+"' : '"
-            if flow.flow_properties:
-                for fp in flow.flow_properties:
-                    if (fp.is_ref_flow_property):
-                        s+=fp.flow_property.name + "'{// reference unit: "+fp.flow_property.ref_unit + "\n"
-            else :
-                s+="Integer'{\n"
-            s+='        @lcaflow{uuid="'+flow.id+'";}\n'
-            s+="    }\n\n"
-        s+="// attribute definitions for convenience. Just copy them to the appropriate parts of the model\n"
+            if flow['flowProperty']:
+                stream.write(f"    attribute '{flow['name']}' : '{flow['flowProperty']}'{{// reference unit: {flow['unit']}\n")
+            else:
+                stream.write(f"    attribute '{flow['name']}' : 'Integer'{{\n")
+            stream.write(f'        @lcaflow{{uuid="{flow["uuid"]}";}}\n')
+            stream.write("    }\n\n")
+        stream.write("// attribute definitions for convenience. Just copy them to the appropriate parts of the model\n")
         for flow in flows:
-            s+="    #exchg attribute :> '"+flow.name+"'"
-            if flow.flow_properties:
-                for fp in flow.flow_properties:
-                    if (fp.is_ref_flow_property):
-                        s+=" = 0 ["+fp.flow_property.ref_unit + "];\n"
-            else :
-                s+="= 0 [one];\n"
+            if flow['flowProperty']:
+                stream.write(f"    #exchg attribute :> '{flow['name']}' = 0 [{flow['unit']}];\n")
+            else:
+                stream.write(f"    #exchg attribute :> '{flow['name']}'= 0 [one];\n")
+        stream.write("}")
+
+    def getSysMLFlowsPackage(self, tag:str):
+        stream=io.StringIO()
+        self.writeSysMLFlowsPackage(stream, tag)
+        return stream.getvalue()
+
+    def put(self, entity):
+        # olca_ipc logs a failed put and returns None, so the failure is raised here to be reported per part
+        if self.getClient().put(entity) is None:
+            raise Exception(f"openLCA could not store {type(entity).__name__} {entity.name}")
+        if self.mirror and isinstance(entity, (olca_schema.Flow, olca_schema.Process)):
+            self.updateMirror(self.mirror.update, [entity])
 
-        s+="}"
-        return s
+    def delete(self, entity):
+        if self.getClient().delete(entity) is None:
+            raise Exception(f"openLCA could not delete {type(entity).__name__} {entity.name}")
+        if self.mirror:
+            self.updateMirror(self.mirror.discard, [entity.id])
 
-    def createProductFlow(self, name:str):    
-        flowProperty=self.client.get(olca_schema.FlowProperty, numberOfItems)
+    def updateMirror(self, function, arguments):
+        # the entity has been written to openLCA, so a failure of the mirror, e.g. a file locked by another
+        # process, is not a failure of the write. The mirror catches up with its next refresh.
+        try:
+            function(arguments)
+        except sqlite3.Error as e:
+            print(f"Warning: mirror of openLCA not updated ({e})")
+
+    def createProductFlow(self, name:str, tags:list[str]=None):    
+        flowProperty=self.getFlowProperty(numberOfItems)
         flow = olca_schema.new_flow(name,flow_type=olca_schema.FlowType.PRODUCT_FLOW,flow_property=flowProperty)	
-        self.client.put(flow)
+        flow.tags = tags
+        self.put(flow) # raises, so no process is created without its product flow
         return flow   
 
-    def createProcess(self, partName:str, exchanges:dict[str,dict[float,str]]):
+    def createProcess(self, partName:str, exchanges:dict[str,dict[float,str]], tags:list[str]=None, processId:str=None, productFlow=None):
         # returns the uuid of the created process  
-        productFlow=self.createProductFlow(partName)
+        # processId and productFlow (a Flow or Ref) are given when an existing process is replaced
+        if productFlow is None:
+            # the product flow does not change with the exchanges, so it gets the tags without the hash
+            productFlow=self.createProductFlow(partName, tags and [t for t in tags if not t.startswith("sysml-hash:")])
         process = olca_schema.new_process(f"produce {partName}")
+        if processId:
+            process.id = processId
+        process.tags = tags
 
         # one instance of the part is produced
         exchange = olca_schema.new_exchange(process, productFlow, 1)
@@ -70,7 +229,7 @@ class openLCAServer:
         exchange.is_quantitative_reference = True
 
         for exch in exchanges:
-            flow = self.client.get(olca_schema.Flow, exch['id'])
+            flow = self.getFlow(exch['id'])
             if not flow:
                 print(f"Warning: Flow with id {exch['id']} not found, skipping exchange")
                 continue
@@ -78,11 +237,125 @@ class openLCAServer:
             exchange = olca_schema.new_exchange(process, flow, abs(exch['value']['num']))
             exchange.is_input = exch['value']['num'] < 0
         
-        self.client.put(process)
+        self.put(process)
         return process.id
+
+    def updateProcess(self, process:olca_schema.Process, partName:str, exchanges, tags:list[str]):
+        # replaces the exchanges of a process created by syncProcesses, the product flow is kept
+        productFlow=next((e.flow for e in process.exchanges or [] if e.is_quantitative_reference), None)
+        if productFlow is not None and productFlow.name != partName:
+            flow=self.getClient().get(olca_schema.Flow, productFlow.id)
+            if flow:
+                flow.name=partName
+                self.put(flow)
+        return self.createProcess(partName, exchanges, tags, process.id, productFlow)
+
+    def deleteProcess(self, process:olca_schema.Process):
+        # deletes a process created by syncProcesses together with its product flow
+        self.delete(process)
+        for exchange in process.exchanges or []:
+            if exchange.is_quantitative_reference and exchange.flow:
+                self.delete(exchange.flow)
+        return process.id
+
+    def runParallel(self, tasks, workers=SYNC_WORKERS, progress=None, prepare=None):
+        # runs the tasks [(name, function, arguments), ...] with at most workers concurrent requests
+        # prepare(executor) is called before the tasks are started, e.g. to fetch what they share on the same workers
+        # progress(result, done, total) is called in the calling thread when a task is finished. If it raises an
+        # exception, e.g. SysMLAPI.OperationCancelled, the tasks that have not started yet are cancelled and the
+        # exception is passed on after the running tasks have finished
+        # returns {'results': [{'name':..., 'process': uuid or None, 'error': message or None}, ...] in the order
+        # of the tasks, 'seconds': duration, 'processesPerSecond': throughput}
+        start=time.perf_counter()
+        results=[None]*len(tasks)
+        with ThreadPoolExecutor(max_workers=max(1,workers)) as executor:
+            if prepare:
+                prepare(executor)
+            futures={executor.submit(function,*arguments):i for i,(name,function,arguments) in enumerate(tasks)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i=futures[future]
+                try:
+                    results[i]={'name':tasks[i][0],'process':future.result(),'error':None}
+                except Exception as e:
+                    results[i]={'name':tasks[i][0],'process':None,'error':str(e)}
+                if progress:
+                    try:
+                        progress(results[i], done, len(tasks))
+                    except BaseException:
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+        seconds=time.perf_counter()-start
+        finished=sum(1 for r in results if r['error'] is None)
+        return {'results':results,'seconds':seconds,'processesPerSecond':finished/seconds if seconds>0 else 0.0}
+
+    def prepareSync(self, parts, executor):
+        # each flow is fetched once and not by every worker that needs it, the fetches run on the workers of runParallel
+        flowProperty=executor.submit(self.getFlowProperty,numberOfItems)
+        self.warmFlowCache((exch['id'] for p in parts for exch in p['exchanges']), executor)
+        wait([flowProperty])
+
+    def createProcesses(self, parts, workers=SYNC_WORKERS, progress=None):
+        # creates new processes for the parts of getLCAParts, see runParallel
+        return self.runParallel([(p['name'],self.createProcess,(p['name'],p['exchanges'])) for p in parts], workers, progress,
+                                lambda executor: self.prepareSync(parts, executor))
+
+    def syncProcesses(self, project:str, parts, workers=SYNC_WORKERS, progress=None):
+        # creates, updates or deletes the processes of the SysML project so that they match the parts of getLCAParts
+        # The processes and product flows are tagged with the project, the id of the part definition and,
+        # for processes, a hash of the name and the exchanges. A process whose hash has not changed is not written.
+        # returns the result of runParallel, each result has an 'action': created, updated, deleted or unchanged
+        existing={}
+        duplicates=[]
+        for process in self.getTaggedProcesses(syncTag("sysml-project",project)):
+            partId=getTagValue(process,"sysml-id")
+            if partId in existing:
+                duplicates.append(process)
+            else:
+                existing[partId]=process
+        tasks=[]
+        actions=[]
+        unchanged=[]
+        changedParts=[]
+        for p in parts:
+            tags=["sysml",syncTag("sysml-project",project),syncTag("sysml-id",p['id']),syncTag("sysml-hash",exchangesHash(p['name'],p['exchanges']))]
+            process=existing.pop(p['id'],None)
+            if process is None:
+                tasks.append((p['name'],self.createProcess,(p['name'],p['exchanges'],tags)))
+                actions.append("created")
+                changedParts.append(p)
+            elif tags[-1] in (process.tags or []):
+                unchanged.append({'name':p['name'],'process':process.id,'error':None,'action':"unchanged"})
+            else:
+                tasks.append((p['name'],self.updateProcess,(process,p['name'],p['exchanges'],tags)))
+                actions.append("updated")
+                changedParts.append(p)
+        for process in list(existing.values())+duplicates: # the part has been removed from the model
+            tasks.append((process.name,self.deleteProcess,(process,)))
+            actions.append("deleted")
+        report=self.runParallel(tasks, workers, progress, lambda executor: self.prepareSync(changedParts, executor))
+        for result, action in zip(report['results'], actions):
+            result['action']=action
+        report['results']=unchanged+report['results']
+        return report
     
+    def searchFlows(self, text:str, flowType=None, limit=50):
+        # flows whose name contains the words of text, see FlowCatalog.searchFlows
+        if self.mirror:
+            self.mirror.refreshIfStale(olca_schema.Flow)
+            return self.mirror.searchFlows(text, flowType, limit)
+        words = text.lower().split()
+        return [{"id": flow.id, "name": flow.name, "category": flow.category, "flow_type": flow.flow_type.value if flow.flow_type else None,
+                 "ref_unit": None} for flow in self.getFlows()
+                if all(word in (flow.name or "").lower() for word in words)
+                and (flowType is None or flowType in (flow.flow_type, flow.flow_type.value if flow.flow_type else None))][:limit]
+
     def printListOfFlowPropertiesWithCount(self):
         # how often is a certain flow property used
+        if self.mirror:
+            self.mirror.refreshIfStale(olca_schema.Flow)
+            for name, count in self.mirror.flowPropertyCounts().items():
+                print(f"{name}: {count}")
+            return
         flows = self.getFlows()
         flow_property_count = {}
         for flow in flows:
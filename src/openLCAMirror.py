@@ -0,0 +1,213 @@
+# local SQLite mirror of the flows and processes of an openLCA database
+# get_all() transfers every complete entity, which takes long for databases like ELCD with tens of thousands of
+# flows. The mirror stores what is needed for filtering and searching: the descriptor, the tags and the flow
+# properties. It is filled once with get_all() and then kept up to date from the descriptors, which are small:
+# - new entities and entities whose descriptor changed are fetched completely
+# - entities that are no longer in the descriptors are removed
+# The descriptors of openLCA carry no version or last change, so changes that only affect the tags or the flow
+# properties of an entity are found by refresh(full=True) only.
+# Queries read SQLite only. The mirror is refreshed explicitly or by refreshIfStale once REFRESH_INTERVAL has
+# passed since the last refresh of the type, which is stored in the file and shared by all processes using it.
+# Writes of the connector are stored with update and discard right away.
+# Several processes may use the same file, e.g. the workers of sysml-lca-batch. A writer waits up to BUSY_TIMEOUT
+# for the others. The mirror has a directory of its own, so the eviction of the element cache never removes it.
+
+import olca_schema
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+_base = Path(sys.executable).parent if getattr(sys, "frozen", False) else Path(__file__).parent
+_MIRROR_DIR = _base / ".cache" / "openlca"
+BULK_FETCH_LIMIT = 500 # more new or changed entities are fetched with one get_all()
+REFRESH_INTERVAL = 300 # seconds after which refreshIfStale updates the entities of a type
+BUSY_TIMEOUT = 30 # seconds to wait for the lock of the file held by another process
+
+_SCHEMA = """
+create table if not exists entities(
+    id text primary key, type text not null, name text, category text, description text,
+    flow_type text, process_type text, ref_unit text, location text, version text, last_change text);
+create index if not exists entities_type on entities(type, flow_type);
+create table if not exists tags(id text not null, tag text not null);
+create index if not exists tags_tag on tags(tag);
+create index if not exists tags_id on tags(id);
+create table if not exists flow_properties(
+    flow_id text not null, property_id text, property_name text, ref_unit text, is_ref integer, factor real);
+create index if not exists flow_properties_name on flow_properties(property_name);
+create index if not exists flow_properties_flow on flow_properties(flow_id);
+create table if not exists refreshes(type text primary key, time real not null);
+"""
+_DESCRIPTOR_FIELDS = ("name", "category", "flow_type", "process_type", "ref_unit") # compared with the descriptors
+
+
+def mirrorPath(url: str):
+    # the default file of the mirror for an openLCA server
+    return _MIRROR_DIR / ("openlca_" + re.sub(r"[^A-Za-z0-9]+", "_", url).strip("_") + ".sqlite")
+
+
+def _text(value):
+    # enums like FlowType are stored by their value
+    return value.value if hasattr(value, "value") else value
+
+
+class FlowCatalog:
+    # the mirror of one openLCA database. getClient returns the olca_ipc.Client for the calling thread, like
+    # openLCAServer.getClient, so all methods may be called from several threads.
+
+    def __init__(self, getClient, path):
+        self.getClient = getClient
+        self.path = Path(path)
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.executescript(_SCHEMA)
+            try:
+                self.connection.execute("create virtual table if not exists names using fts5(name, id unindexed)")
+                self.fullText = True
+            except sqlite3.OperationalError:
+                # sqlite without fts5, searchFlows falls back to like
+                self.fullText = False
+
+    def close(self):
+        self.connection.close()
+
+    def count(self, type):
+        with self.lock:
+            return self.connection.execute("select count(*) from entities where type=?", (type.__name__,)).fetchone()[0]
+
+    def refreshIfStale(self, type=olca_schema.Flow, maxAge=REFRESH_INTERVAL):
+        # refreshes the entities of the type if they have not been refreshed within maxAge seconds
+        # returns True if the server has been asked
+        with self.lock:
+            row = self.connection.execute("select time from refreshes where type=?", (type.__name__,)).fetchone()
+        if row and time.time() - row[0] < maxAge:
+            return False
+        self.refresh(type)
+        return True
+
+    def refresh(self, type=olca_schema.Flow, full=False):
+        # updates the entities of the type, returns (number of stored entities, number of removed entities)
+        result = self.fetch(type, full)
+        with self.lock, self.connection:
+            self.connection.execute("insert or replace into refreshes values (?,?)", (type.__name__, time.time()))
+        return result
+
+    def fetch(self, type, full):
+        if full or self.count(type) == 0:
+            entities = self.getClient().get_all(type)
+            with self.lock, self.connection:
+                removed = self.removeAll(type, keep={e.id for e in entities})
+                self.store(entities)
+            return len(entities), removed
+        descriptors = {d.id: d for d in self.getClient().get_descriptors(type)}
+        with self.lock:
+            known = {row[0]: row[1:] for row in self.connection.execute(
+                f"select id, {', '.join(_DESCRIPTOR_FIELDS)} from entities where type=?", (type.__name__,))}
+        # fields that a server leaves out of the descriptors are not compared
+        changed = [id for id, d in descriptors.items() if id not in known or any(
+            value is not None and value != stored
+            for value, stored in zip((_text(getattr(d, f, None)) for f in _DESCRIPTOR_FIELDS), known[id]))]
+        if len(changed) > BULK_FETCH_LIMIT:
+            return self.fetch(type, full=True)
+        entities = [e for e in (self.getClient().get(type, id) for id in changed) if e is not None]
+        with self.lock, self.connection:
+            removed = self.removeAll(type, keep=descriptors.keys())
+            self.store(entities)
+        return len(entities), removed
+
+    def update(self, entities):
+        # stores entities written to the server, so the mirror needs no refresh for them
+        with self.lock, self.connection:
+            self.store(entities)
+
+    def discard(self, ids):
+        # removes entities deleted on the server
+        with self.lock, self.connection:
+            self.remove(ids)
+
+    def removeAll(self, type, keep):
+        # removes the entities of the type that are not in keep, the lock must be held
+        ids = [row[0] for row in self.connection.execute("select id from entities where type=?", (type.__name__,))
+               if row[0] not in keep]
+        self.remove(ids)
+        return len(ids)
+
+    def remove(self, ids):
+        rows = [(id,) for id in ids]
+        self.connection.executemany("delete from entities where id=?", rows)
+        self.connection.executemany("delete from tags where id=?", rows)
+        self.connection.executemany("delete from flow_properties where flow_id=?", rows)
+        if self.fullText:
+            self.connection.executemany("delete from names where id=?", rows)
+
+    def store(self, entities):
+        # inserts or replaces complete entities, the lock must be held
+        self.remove(e.id for e in entities)
+        self.connection.executemany("insert into entities values (?,?,?,?,?,?,?,?,?,?,?)", [
+            (e.id, type(e).__name__, e.name, e.category, e.description,
+             _text(getattr(e, "flow_type", None)), _text(getattr(e, "process_type", None)), self.refUnit(e),
+             e.location.name if getattr(e, "location", None) else None, e.version, e.last_change)
+            for e in entities])
+        self.connection.executemany("insert into tags values (?,?)",
+                                    [(e.id, tag) for e in entities for tag in e.tags or []])
+        self.connection.executemany("insert into flow_properties values (?,?,?,?,?,?)", [
+            (e.id, fp.flow_property.id if fp.flow_property else None, fp.flow_property.name if fp.flow_property else None,
+             fp.flow_property.ref_unit if fp.flow_property else None, 1 if fp.is_ref_flow_property else 0, fp.conversion_factor)
+            for e in entities if isinstance(e, olca_schema.Flow) for fp in e.flow_properties or []])
+        if self.fullText:
+            self.connection.executemany("insert into names(name, id) values (?,?)", [(e.name or "", e.id) for e in entities])
+
+    def refUnit(self, entity):
+        # the descriptors of flows contain the reference unit, the complete flows only the reference flow property
+        for fp in getattr(entity, "flow_properties", None) or []:
+            if fp.is_ref_flow_property and fp.flow_property:
+                return fp.flow_property.ref_unit
+        return None
+
+    def taggedIds(self, type, tag: str):
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                "select distinct t.id from tags t join entities e on e.id=t.id where t.tag=? and e.type=?", (tag, type.__name__))]
+
+    def taggedFlows(self, tag: str):
+        # returns [{'id', 'name', 'flow_property', 'ref_unit'}, ...] with the reference flow property of each flow
+        with self.lock:
+            rows = self.connection.execute(
+                """select e.id, e.name, fp.property_name, fp.ref_unit from tags t join entities e on e.id=t.id
+                   left join flow_properties fp on fp.flow_id=e.id and fp.is_ref=1
+                   where t.tag=? and e.type='Flow' order by e.name""", (tag,)).fetchall()
+        return [{"id": id, "name": name, "flow_property": property, "ref_unit": unit} for id, name, property, unit in rows]
+
+    def flowPropertyCounts(self):
+        # how often each flow property is used by the flows, {name: count}
+        with self.lock:
+            return dict(self.connection.execute(
+                "select property_name, count(*) from flow_properties group by property_name order by count(*) desc"))
+
+    def searchFlows(self, text: str, flowType=None, limit=50):
+        # flows whose name contains all words of text as prefixes, optionally only flows of the flow type
+        # returns [{'id', 'name', 'category', 'flow_type', 'ref_unit'}, ...]
+        words = re.findall(r"\w+", text)
+        if not words:
+            return []
+        flowType = _text(flowType)
+        with self.lock:
+            if self.fullText:
+                query = " ".join('"' + word + '"*' for word in words)
+                rows = self.connection.execute(
+                    """select e.id, e.name, e.category, e.flow_type, e.ref_unit from names n join entities e on e.id=n.id
+                       where names match ? and e.type='Flow' and (? is null or e.flow_type=?) order by rank limit ?""",
+                    (query, flowType, flowType, limit)).fetchall()
+            else:
+                conditions = " and ".join("e.name like ?" for _ in words)
+                rows = self.connection.execute(
+                    f"""select e.id, e.name, e.category, e.flow_type, e.ref_unit from entities e
+                        where e.type='Flow' and (? is null or e.flow_type=?) and {conditions} order by e.name limit ?""",
+                    (flowType, flowType, *("%" + word + "%" for word in words), limit)).fetchall()
+        return [{"id": id, "name": name, "category": category, "flow_type": type, "ref_unit": unit}
+                for id, name, category, type, unit in rows]
@@ -0,0 +1,183 @@
+# headless batch synchronization of SysML projects with openLCA, e.g. for CI or nightly runs
+# Each project is loaded and synchronized in a process of its own, so the parsing of large models runs
+# in parallel as well. No Qt is imported.
+#
+#   python sysml-lca-batch.py --all --processes 8 --summary summary.json
+#   python sysml-lca-batch.py <project id> <project id> --no-sync
+#
+# The summary is JSON with the timing, the number of elements and parts and the actions of the
+# synchronization per project. Exit codes: 0 all projects synchronized, 1 at least one project or
+# process failed, 2 invalid arguments or the projects could not be listed.
+
+import argparse
+import configparser
+import json
+import olca_schema
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from SysMLAPI import closeClient, getProjects
+from SysMLwithLCA import SysMLLCAModel
+from openLCAAPI import openLCAServer, SYNC_WORKERS
+from openLCAMirror import mirrorPath
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_ERROR = 2
+
+_base = Path(sys.executable).parent if getattr(sys, "frozen", False) else Path(__file__).parent
+_server = None # the openLCAServer of a worker process, its flow cache is kept for all projects of the process
+
+
+def read_defaults():
+    # the servers of the preferences of the GUI, if there are any
+    config = configparser.ConfigParser()
+    config.read(_base / "preferences.ini")
+    preferences = config["DEFAULT"]
+    return {
+        "sysmlserver": preferences.get("sysmlserver", "http://localhost:9000"),
+        "openlcaserver": preferences.get("openlcaserver", "http://localhost:8080"),
+        "syncworkers": int(preferences.get("syncworkers", SYNC_WORKERS)),
+    }
+
+
+def initWorker(openLCAServerURL, useMirror):
+    # stdout is reserved for the summary
+    global _server
+    sys.stdout = sys.stderr
+    if openLCAServerURL:
+        _server = openLCAServer(openLCAServerURL, mirrorPath=mirrorPath(openLCAServerURL) if useMirror else None)
+
+
+def newResult(project):
+    # the summary of a project, actions: {created|updated|deleted|unchanged: number of processes}
+    return {"project": project, "name": None, "commit": None, "status": "ok", "error": None,
+            "elements": 0, "parts": 0, "actions": {}, "failed": [], "seconds": {}}
+
+
+def runProject(sysmlServer, project, syncWorkers, lcaSubset):
+    # loads the project and synchronizes its LCA parts, runs in a worker process
+    # returns the summary of the project, errors are reported in it and not raised
+    result = newResult(project)
+    start = time.perf_counter()
+    phase = "load"
+    try:
+        model = SysMLLCAModel(sysmlServer, project, lcaSubset=lcaSubset)
+        result.update(name=model.name, commit=model.commit, elements=len(model.theModel))
+        result["seconds"]["load"] = time.perf_counter() - start
+        phase = "parts"
+        parts = model.getLCAParts()
+        result["parts"] = len(parts)
+        result["seconds"]["parts"] = time.perf_counter() - start - result["seconds"]["load"]
+        if _server and parts:
+            phase = "sync"
+            report = _server.syncProcesses(project, parts, syncWorkers)
+            for r in report["results"]:
+                if r["error"]:
+                    result["failed"].append({"name": r["name"], "error": r["error"]})
+                else:
+                    result["actions"][r["action"]] = result["actions"].get(r["action"], 0) + 1
+            result["seconds"]["sync"] = report["seconds"]
+            if result["failed"]:
+                result["status"] = "failed"
+                result["error"] = f"{len(result['failed'])} processes failed"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{phase}: {e}"
+    result["seconds"]["total"] = time.perf_counter() - start
+    return result
+
+
+def parseArguments(argv, defaults):
+    parser = argparse.ArgumentParser(description="Synchronizes the LCA parts of SysML projects with openLCA without the GUI.")
+    parser.add_argument("projects", nargs="*", help="ids of the projects")
+    parser.add_argument("--all", action="store_true", help="all projects of the SysML server")
+    parser.add_argument("--sysml", default=defaults["sysmlserver"], help="URL of the SysML API (default: %(default)s)")
+    parser.add_argument("--openlca", default=defaults["openlcaserver"], help="URL of the openLCA IPC server (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="projects processed in parallel (default: %(default)s)")
+    parser.add_argument("--sync-workers", type=int, default=defaults["syncworkers"],
+                        help="concurrent requests to openLCA per project (default: %(default)s)")
+    parser.add_argument("--no-sync", action="store_true", help="only load the projects and compute their LCA parts")
+    parser.add_argument("--no-mirror", action="store_true", help="do not use the local mirror of the openLCA database")
+    parser.add_argument("--lca-subset", action="store_true", help="load only the elements needed for the LCA data")
+    parser.add_argument("--summary", default="-", help="file for the JSON summary, - for stdout (default)")
+    arguments = parser.parse_args(argv)
+    if not arguments.projects and not arguments.all:
+        parser.error("give project ids or --all")
+    if arguments.processes < 1 or arguments.sync_workers < 1:
+        parser.error("--processes and --sync-workers must be at least 1")
+    return arguments
+
+
+def main(argv=None):
+    try:
+        arguments = parseArguments(argv, read_defaults())
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_ERROR
+    projects = list(dict.fromkeys(arguments.projects))
+    if arguments.all:
+        try:
+            projects += [p["@id"] for p in getProjects(arguments.sysml) if p["@id"] not in projects]
+        except Exception as e:
+            print(f"Failed to get projects: {e}", file=sys.stderr)
+            return EXIT_ERROR
+        finally:
+            # forked worker processes would otherwise share the kept-alive connection of the listing
+            closeClient(arguments.sysml)
+    openLCAServerURL = None if arguments.no_sync else arguments.openlca
+    if openLCAServerURL and not arguments.no_mirror:
+        # updated once here, so the worker processes only read the unchanged part of the mirror
+        try:
+            mirror = openLCAServer(openLCAServerURL, mirrorPath=mirrorPath(openLCAServerURL)).mirror
+            mirror.refresh(olca_schema.Process)
+            mirror.close()
+        except Exception as e:
+            print(f"Failed to update the mirror of {openLCAServerURL}: {e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    start = time.perf_counter()
+    results = []
+    processes = max(1, min(arguments.processes, len(projects)))
+    with ProcessPoolExecutor(max_workers=processes, initializer=initWorker,
+                             initargs=(openLCAServerURL, not arguments.no_mirror)) as executor:
+        futures = {executor.submit(runProject, arguments.sysml, project, arguments.sync_workers, arguments.lca_subset): project
+                   for project in projects}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process died
+                result = newResult(futures[future])
+                result.update(status="failed", error=str(e))
+            results.append(result)
+            print(f"[{len(results)}/{len(projects)}] {result.get('name') or result['project']}: {result['status']}"
+                  + (f" ({result['error']})" if result["error"] else ""), file=sys.stderr)
+    seconds = time.perf_counter() - start
+
+    order = {project: i for i, project in enumerate(projects)}
+    results.sort(key=lambda r: order[r["project"]])
+    serialSeconds = sum(r["seconds"].get("total", 0) for r in results)
+    summary = {
+        "sysmlServer": arguments.sysml,
+        "openLCAServer": openLCAServerURL,
+        "processes": processes,
+        "seconds": seconds,
+        "serialSeconds": serialSeconds, # the sum of the times of the projects
+        "speedup": serialSeconds / seconds if seconds > 0 else 0.0,
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "projects": results,
+    }
+    text = json.dumps(summary, indent=2)
+    if arguments.summary == "-":
+        print(text)
+    else:
+        Path(arguments.summary).write_text(text, encoding="utf-8")
+    return EXIT_OK if summary["failed"] == 0 else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
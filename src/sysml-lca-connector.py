@@ -1,8 +1,12 @@
 import os
 import sys
+import time
 import logging
+from contextlib import contextmanager
 from pathlib import Path
 
+startTime = time.perf_counter()
+
 # Basisverzeichnis bestimmen (neben der EXE, wenn gefrozener PyInstaller-Build)
 if getattr(sys, "frozen", False):
     base_dir = Path(sys.executable).parent
@@ -22,17 +26,27 @@ logging.debug("cwd=%s", os.getcwd())
 logging.debug("executable=%s", sys.executable)
 logging.debug("frozen=%s", getattr(sys, "frozen", False))
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QActionGroup, QSizePolicy, QMessageBox
-from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QListWidget
-from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import QUrl
+@contextmanager
+def timedImport(name):
+    # logs the time of the first import of the module to startup.log
+    # The web engine, requests, olca_ipc and the model modules take seconds in the frozen build, so they are
+    # imported where they are used first and not before the main window is shown. The imports stay plain
+    # import statements, so PyInstaller still finds them.
+    first = name not in sys.modules
+    start = time.perf_counter()
+    yield
+    if first:
+        logging.debug("import %s: %.3f s", name, time.perf_counter() - start)
+
+with timedImport("PyQt5.QtWidgets"):
+    from PyQt5.QtWidgets import QApplication, QMainWindow, QActionGroup, QSizePolicy, QMessageBox
+    from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QListWidget
+    from PyQt5.QtGui import QIcon
+    from PyQt5.QtCore import Qt, QCoreApplication, QThreadPool, QTimer
 import configparser
+import json
 
-from SysMLAPI import getProjects, deleteProject
-from SysMLwithLCA import SysMLLCAModel
-from openLCAAPI import openLCAServer
-
+CLOSE_WAIT = 5000 # milliseconds to wait for a cancelled operation when the window is closed
 
 
 def read_preferences():
@@ -81,7 +95,11 @@ class MainWindow(QMainWindow):
     preferences=None
     sysmlserver=None
     openLCAServerURL=None
+    theLCAServer=None
+    theLCAServerURL=None
     theModel=None
+    modelBridge=None
+    worker=None # the running background operation, see runInBackground
 
     def __init__(self):
         super().__init__()
@@ -95,9 +113,19 @@ class MainWindow(QMainWindow):
         self.openLCAServerURL=self.preferences["openlcaserver"]
 
         self.createMenuBar()
-        # Create a QWebEngineView widget
+        # the window is shown with a label, the web engine is loaded when the event loop runs
+        placeholder = QLabel('Click on the "Open" menu to select a project')
+        placeholder.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        placeholder.setMargin(8)
+        self.setCentralWidget(placeholder)
+        self.browser = None
+        self.createStatusBar()
+        QTimer.singleShot(0, self.createBrowser)
+
+    def createBrowser(self):
+        with timedImport("PyQt5.QtWebEngineWidgets"):
+            from PyQt5.QtWebEngineWidgets import QWebEngineView
         self.browser = QWebEngineView()
-        self.setCentralWidget(self.browser)
         self.browser.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         # Set HTML content
@@ -105,10 +133,15 @@ class MainWindow(QMainWindow):
         <p>Click on the "Open" menu to select a project</p>
         """
         self.browser.setHtml(html_content)
-        self.createStatusBar()
+        self.setCentralWidget(self.browser)
+        logging.debug("browser ready after %.3f s", time.perf_counter() - startTime)
     
     def createStatusBar(self):
         self.statusBar().showMessage("Ready")
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.clicked.connect(self.cancelBackground)
+        self.cancelButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelButton)
 
     def updateStatusBar(self, message):
         self.statusBar().showMessage(message)
@@ -116,9 +149,75 @@ class MainWindow(QMainWindow):
     def clearStatusBar(self):
         self.statusBar().clearMessage()
 
+    def runInBackground(self, description, function, onFinished, *args):
+        # runs function(*args, progress=...) on a worker thread and onFinished(result) in the GUI thread
+        # only one operation runs at a time, it can be cancelled with the button in the status bar
+        if self.worker:
+            QMessageBox.warning(self, "Busy", "Wait for the running operation to finish or cancel it.")
+            return
+        with timedImport("Workers"):
+            from Workers import Worker
+        worker = Worker(function, *args)
+        worker.signals.progress.connect(lambda phase, done, total: self.showProgress(description, phase, done, total))
+
+        def finished(result):
+            self.endBackground()
+            onFinished(result)
+
+        def failed(message):
+            self.endBackground()
+            self.updateStatusBar("Ready")
+            QMessageBox.critical(self, "Error", f"{description} failed: {message}.")
+
+        def cancelled():
+            self.endBackground()
+            self.updateStatusBar(f"{description} cancelled")
+
+        worker.signals.finished.connect(finished)
+        worker.signals.failed.connect(failed)
+        worker.signals.cancelled.connect(cancelled)
+        self.worker = worker
+        self.updateStatusBar(description)
+        self.cancelButton.setEnabled(True)
+        self.cancelButton.show()
+        QThreadPool.globalInstance().start(worker)
+
+    def showProgress(self, description, phase, done, total):
+        if phase == "download":
+            text = f"{done / 1e6:.1f} MB downloaded"
+        elif phase == "elements":
+            text = f"{done} elements loaded"
+        elif phase == "indexes":
+            text = "building indexes"
+        elif phase == "sync":
+            text = f"{done}/{total} processes synchronized"
+        else:
+            text = f"{phase} {done}/{total}" if total >= 0 else f"{phase} {done}"
+        self.updateStatusBar(f"{description}: {text}")
+
+    def cancelBackground(self):
+        if self.worker:
+            self.worker.cancel()
+            self.cancelButton.setEnabled(False)
+            self.updateStatusBar("Cancelling...")
+
+    def endBackground(self):
+        self.worker = None
+        self.cancelButton.hide()
+
+    def closeEvent(self, event):
+        # a running operation stops at its next progress report or when its request times out,
+        # the window does not wait longer than CLOSE_WAIT for it
+        if self.worker:
+            self.worker.cancel()
+            QThreadPool.globalInstance().waitForDone(CLOSE_WAIT)
+        super().closeEvent(event)
+
     def select_project_dialog(self):
         project = None
         try:
+            with timedImport("SysMLAPI"):
+                from SysMLAPI import getProjects
             projects = getProjects(self.sysmlserver)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to get projects: {e}")
@@ -179,8 +278,7 @@ class MainWindow(QMainWindow):
                 return
             project = filtered_projects[index]
             dialog.accept()
-            self.open_project(project)
-            self.synchronizeProcesses()
+            self.open_project(project, self.synchronizeProcesses)
             return project
 
         def delete_project():
@@ -191,6 +289,7 @@ class MainWindow(QMainWindow):
             project = filtered_projects[index]
             dialog.accept()
             try :
+                from SysMLAPI import deleteProject
                 deleteProject(self.sysmlserver, project['@id'])
                 print("project deleted: ", project)
             except Exception as e:
@@ -228,16 +327,23 @@ class MainWindow(QMainWindow):
         save_preferences(self.preferences)
         self.update_recent_projects_menu()
 
-    def open_project(self, theProject):
-        self.updateStatusBar(f"Opening project {theProject['name']}")
-        # tbd: is not updated WTF
+    def open_project(self, theProject, onLoaded=None):
+        # the model is loaded in the background, onLoaded() is called when it is shown
         print(f"Opening project {theProject['name']}")
-        self.theModel= SysMLLCAModel(self.sysmlserver, theProject['@id'])
-        self.update_recent_projects(theProject['@id'],theProject['name'])
-        self.setWindowTitle(f"{self.theModel.name} - SysML Life cycle analyzer")
-        self.set_SysML_Model_view()
-        self.updateStatusBar("Ready")
-        pass
+
+        def loaded(model):
+            self.theModel = model
+            self.update_recent_projects(theProject['@id'],theProject['name'])
+            self.setWindowTitle(f"{self.theModel.name} - SysML Life cycle analyzer")
+            self.set_SysML_Model_view()
+            self.updateStatusBar("Ready")
+            if onLoaded:
+                onLoaded()
+
+        with timedImport("SysMLwithLCA"):
+            from SysMLwithLCA import SysMLLCAModel
+        self.runInBackground(f"Opening project {theProject['name']}", SysMLLCAModel, loaded,
+                             self.sysmlserver, theProject['@id'])
     
     recent_projects_menu=None
 
@@ -272,6 +378,10 @@ class MainWindow(QMainWindow):
         run_menu = menu_bar.addMenu("Run")
         synchronize_action = run_menu.addAction("synchronize")
         synchronize_action.triggered.connect(self.synchronizeProcesses)
+        publish_flows_action = run_menu.addAction("publish LCA flows")
+        publish_flows_action.triggered.connect(self.publishFlows)
+        refresh_openlca_action = run_menu.addAction("refresh openLCA data")
+        refresh_openlca_action.triggered.connect(self.refreshOpenLCAData)
 
         # Create a view menu
         view_menu = menu_bar.addMenu("View")
@@ -320,6 +430,13 @@ class MainWindow(QMainWindow):
         entryLCA.setText(self.openLCAServerURL)
         layout.addWidget(entryLCA)
 
+        workers_label = QLabel("Concurrent requests to openLCA")
+        layout.addWidget(workers_label)
+
+        entryWorkers = QLineEdit()
+        entryWorkers.setText(str(self.getSyncWorkers()))
+        layout.addWidget(entryWorkers)
+
         button_layout = QHBoxLayout()
         ok_button = QPushButton("OK")
         cancel_button = QPushButton("Cancel")
@@ -332,6 +449,8 @@ class MainWindow(QMainWindow):
             self.preferences["sysmlserver"] = self.sysmlserver
             self.openLCAServerURL = entryLCA.text()
             self.preferences["openlcaserver"] = self.openLCAServerURL
+            if entryWorkers.text().strip().isdigit() and int(entryWorkers.text()) > 0:
+                self.preferences["syncworkers"] = entryWorkers.text().strip()
             save_preferences(self.preferences)
             dialog.accept()
 
@@ -344,45 +463,69 @@ class MainWindow(QMainWindow):
         dialog.exec_()
 
     def search_textbox(self):
+        # the SysML model view searches the index of the model (see SysMLModel.searchElements), highlights the
+        # matching elements and jumps from one to the next. The other views use the search of the page.
+        from SysMLModel import SEARCH_LIMIT
+        results = []
+        current = 0
+
+        def modelView():
+            return self.theModel is not None and self.modelBridge is not None and self.sysml_model_action.isChecked()
+
+        def show_result():
+            self.browser.page().runJavaScript(f"showElement({json.dumps(results[current])});")
+            result_label.setText(f"{current + 1} of {len(results)}{'+' if len(results) >= SEARCH_LIMIT else ''} elements")
+
         def perform_search():
+            nonlocal results, current
             search_term = search_entry.text()
             print("perform_search", search_term)
-            self.browser.page().runJavaScript("""
-                var elements = document.querySelectorAll('.highlight');
-                elements.forEach(function(element) {
-                    element.classList.remove('highlight');
-                });
-            """)
-            if search_term:
-                self.browser.page().runJavaScript(f"""
-                    var search_term = "{search_term}";
-                    var regex = new RegExp(search_term, 'gi');
-                    document.body.innerHTML = document.body.innerHTML.replace(regex, function(matched) {{
-                        return "<span class='highlight'>" + matched + "</span>";
-                    }});
-                    var elements = document.querySelectorAll('.highlight');
-                    elements.forEach(function(element) {{
-                        element.style.backgroundColor = 'yellow';
-                        element.style.color = 'black';
-                    }});
-                """)
-            search_dialog.accept()
-        
+            if not modelView():
+                self.browser.findText(search_term)
+                return
+            results = self.theModel.searchElements(search_term) if search_term.strip() else []
+            current = 0
+            self.modelBridge.highlight(results)
+            if results:
+                show_result()
+            else:
+                self.browser.page().runJavaScript("redraw();")
+                result_label.setText("no elements found" if search_term.strip() else "")
+
+        def next_result():
+            nonlocal current
+            if not modelView():
+                self.browser.findText(search_entry.text())
+            elif results:
+                current = (current + 1) % len(results)
+                show_result()
+
         search_dialog = QDialog(self)
         search_dialog.setWindowTitle("Search")
         search_dialog.setGeometry(100, 100, 300, 100)
 
         layout = QVBoxLayout(search_dialog)
 
-        search_label = QLabel("Search for:")
+        search_label = QLabel("Search for (words or prefixes, type:PartDefinition to filter by type):")
         layout.addWidget(search_label)
 
         search_entry = QLineEdit()
+        search_entry.returnPressed.connect(perform_search)
         layout.addWidget(search_entry)
 
+        result_label = QLabel("")
+        layout.addWidget(result_label)
+
+        button_layout = QHBoxLayout()
         search_button = QPushButton("Search")
+        search_button.setAutoDefault(False)
         search_button.clicked.connect(perform_search)
-        layout.addWidget(search_button)
+        next_button = QPushButton("Next")
+        next_button.setAutoDefault(False)
+        next_button.clicked.connect(next_result)
+        button_layout.addWidget(search_button)
+        button_layout.addWidget(next_button)
+        layout.addLayout(button_layout)
 
         search_dialog.exec_()
 
@@ -394,34 +537,58 @@ class MainWindow(QMainWindow):
         
         self.browser.page().toHtml(handle_html)
 
-    def get_LCA_processes(self):
-        s="<no model selected>"
-        if self.theModel:
-            s=f"""
+    def write_LCA_processes(self, stream, progress=None):
+        stream.write(f"""
             <!doctype html>
             <html><head><meta charset=\"UTF-8\"><title>{self.theModel.name}</title>
             <style>p {{ margin-left: 10px; margin-top:0px; margin-bottom:0px;}}
             h3 {{margin-bottom:0px;}}</style>
             </head>
             <body>
-            """
-            for p in self.theModel.getLCAParts():
-                s+=f"<h3>{p['name']}</h3>\n"
-                for exch in p['exchanges']:
-                    value = exch.get('value')
-                    if value and value.get('mRef'):
-                        unitElement = value['mRef']
-                        unit = unitElement.get('declaredShortName') if unitElement else "Number of items"
-                    else:
-                        unit = "Number of items"
-                    num = value['num'] if value else ''
-                    s+=f"<p>{exch['name']} : {num} {unit}</p>\n"
-            s+="</body></html>"
-        return s
+            """)
+        for p in self.theModel.getLCAParts(progress):
+            stream.write(f"<h3>{p['name']}</h3>\n")
+            for exch in p['exchanges']:
+                value = exch.get('value')
+                if value and value.get('mRef'):
+                    unitElement = value['mRef']
+                    unit = unitElement.get('declaredShortName') if unitElement else "Number of items"
+                else:
+                    unit = "Number of items"
+                num = value['num'] if value else ''
+                stream.write(f"<p>{exch['name']} : {num} {unit}</p>\n")
+        stream.write("</body></html>")
+
+    def get_LCA_processes(self, progress=None):
+        # rendered once per commit, see ViewCache
+        if not self.theModel:
+            return "<no model selected>"
+        from SysMLAPI import getViewCache
+        return getViewCache().text(self.theModel.project, self.theModel.commit, "lcaprocesses.html",
+                                   lambda stream: self.write_LCA_processes(stream, progress))
+
+    def getLCAServer(self):
+        # one openLCAServer per URL, so its flow cache is kept for the session
+        if self.theLCAServer is None or self.theLCAServerURL != self.openLCAServerURL:
+            with timedImport("openLCAAPI"):
+                from openLCAAPI import openLCAServer
+                from openLCAMirror import mirrorPath
+            self.theLCAServer = openLCAServer(self.openLCAServerURL, mirrorPath=mirrorPath(self.openLCAServerURL))
+            self.theLCAServerURL = self.openLCAServerURL
+        return self.theLCAServer
+
+    def getSyncWorkers(self):
+        # without a syncworkers entry in the preferences the default of openLCAAPI is used
+        with timedImport("openLCAAPI"):
+            from openLCAAPI import SYNC_WORKERS
+        try:
+            return max(1, int(self.preferences.get("syncworkers", SYNC_WORKERS)))
+        except ValueError:
+            return SYNC_WORKERS
 
     def set_LCA_Flows_view(self):
         try:
-            theLCAServer= openLCAServer(self.openLCAServerURL)
+            theLCAServer= self.getLCAServer()
             self.browser.setHtml("")
             flowsPackage = theLCAServer.getSysMLFlowsPackage("sysml")
             self.browser.setHtml(f"<html><body><pre><code>{flowsPackage}</code></pre></body></html>")
@@ -430,42 +597,108 @@ class MainWindow(QMainWindow):
             return
 
     def set_LCA_Processes_view(self):
-        self.browser.setHtml(self.get_LCA_processes())
+        self.runInBackground("Computing LCA processes", self.get_LCA_processes, self.browser.setHtml)
  
 
     def set_SysML_Model_view(self):
         self.sysml_model_action.setChecked(True)
         self.browser.setHtml("")
         if self.theModel:
-            self.theModel.asHTML()
-            self.browser.load(QUrl.fromLocalFile(os.path.abspath("model.api.html")))
+            # only the visible elements are rendered, the model stays in Python
+            with timedImport("ModelBrowser"):
+                from ModelBrowser import showModel
+            self.modelBridge = showModel(self.browser, self.theModel, self.modelBridge)
 
     def open_html_in_browser(self):
         import webbrowser
-        webbrowser.open(os.path.abspath("model.api.html"))
+        if self.theModel:
+            # written once per commit into the cache directory instead of the working directory
+            self.runInBackground("Writing HTML", self.theModel.getHTMLFile, lambda path: webbrowser.open(path.as_uri()))
+
+    def publishFlows(self):
+        # writes the openLCA flows tagged with sysml into the package openLCAFlows of the project
+        if not self.theModel:
+            QMessageBox.warning(self, "Error", "Open a SysML project first.")
+            return
+        try:
+            theLCAServer = self.getLCAServer()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to publish flows: {e}.")
+            return
+        model = self.theModel
+
+        def publish(progress):
+            return model.publishFlows(theLCAServer.getSysMLFlows("sysml"))
+
+        def published(counts):
+            summary = f"Published LCA flows: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed."
+            QMessageBox.information(self, "Success", summary)
+            self.updateStatusBar(summary)
+
+        self.runInBackground("Publishing LCA flows", publish, published)
+
+    def refreshOpenLCAData(self):
+        # the local mirror of the openLCA database is otherwise refreshed after REFRESH_INTERVAL only
+        try:
+            theLCAServer = self.getLCAServer()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to refresh: {e}.")
+            return
+        self.runInBackground("Refreshing openLCA data", lambda progress: theLCAServer.refreshMirror(),
+                             lambda result: self.updateStatusBar("openLCA data refreshed"))
 
     def synchronizeProcesses(self):
+        # the parts are computed and synchronized in the background
+        if not self.theModel:
+            return
         try:
-            theLCAServer= openLCAServer(self.openLCAServerURL)
-            if self.theModel:
-                parts = self.theModel.getLCAParts()
-                if len(parts) == 0:
-                    QMessageBox.warning(self, "Error", "No parts with lca exchanges found in the SysML model.")
-                else: 
-                    for p in parts:
-                        self.updateStatusBar(f"Synchronizing {p['name']} process")
-                        theLCAServer.createProcess(p['name'],p['exchanges'])
-                    QMessageBox.information(self, "Success", f"Synchronized {len(parts)} processes successfully.") 
-                    self.updateStatusBar(f"Synchronized {len(parts)} processes successfully.")
+            theLCAServer = self.getLCAServer()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to synchronize: {e}.")
+            return
+        model = self.theModel
+        workers = self.getSyncWorkers()
+
+        def synchronize(progress):
+            parts = model.getLCAParts(progress)
+            if len(parts) == 0:
+                return parts, None
+            progress("sync", 0, len(parts))
+            report = theLCAServer.syncProcesses(model.project, parts, workers,
+                                                lambda result, done, total: progress("sync", done, total))
+            return parts, report
+
+        def synchronized(result):
+            parts, report = result
+            if report is None:
+                QMessageBox.warning(self, "Error", "No parts with lca exchanges found in the SysML model.")
+                self.updateStatusBar("Ready")
+                return
+            failed = [r for r in report['results'] if r['error']]
+            actions = {}
+            for r in report['results']:
+                if not r['error']:
+                    actions[r['action']] = actions.get(r['action'], 0) + 1
+            counts = ", ".join(f"{count} {action}" for action, count in actions.items())
+            summary = f"Synchronized {len(parts)} processes ({counts}) in {report['seconds']:.1f} s ({report['processesPerSecond']:.1f} processes/s)."
+            if failed:
+                details = "\n".join(f"{r['name']}: {r['error']}" for r in failed)
+                QMessageBox.warning(self, "Error", f"{summary}\n\nFailed:\n{details}")
+            else:
+                QMessageBox.information(self, "Success", summary)
+            self.updateStatusBar(summary)
+
+        self.runInBackground("Synchronizing with openLCA", synchronize, synchronized)
 
 if __name__ == "__main__":
     logging.debug("im main block")
     try:
+        # QtWebEngineWidgets is imported after the QApplication has been created, which needs shared contexts
+        QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
         app = QApplication(sys.argv)
         window = MainWindow()
         window.show()
+        logging.debug("main window shown after %.3f s", time.perf_counter() - startTime)
         sys.exit(app.exec())
     except Exception as e:
         print(f"Fatal error: {e}")
@@ -0,0 +1,39 @@
+# tests of the connector against the fake servers of the benchmarks, run with python -m pytest from the repository
+# Each test gets an empty element cache in a temporary directory, so nothing is written into src/.cache.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+_root = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_root / "src"), str(_root / "benchmarks")]
+
+import SysMLAPI
+from ElementCache import PickleElementCache
+from FakeServers import FakeOpenLCAServer, FakeSysMLServer
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path):
+    # an empty element cache and view cache for each test
+    previous = SysMLAPI.getCache()
+    cache = PickleElementCache(tmp_path / "cache")
+    SysMLAPI.setCache(cache)
+    SysMLAPI.getViewCache().clear()
+    yield cache
+    SysMLAPI.setCache(previous)
+    SysMLAPI.getViewCache().clear()
+
+
+@pytest.fixture
+def sysml():
+    with FakeSysMLServer() as server:
+        yield server
+        SysMLAPI.closeClient(server.url)
+
+
+@pytest.fixture
+def openLCA():
+    with FakeOpenLCAServer() as server:
+        yield server
@@ -0,0 +1,146 @@
+import json
+import os
+
+import pytest
+
+import SysMLAPI
+from ElementCache import CorruptEntry
+from ModelGenerator import generateModel
+from SysMLAPI import SharedValues, applyChanges, getChanges, getClient, getElements, getElementsById, iterJSONArray, queryElements, primitiveConstraint
+
+ITEMS = [{'@id': 'a', 'declaredName': 'Größe "1"', 'value': [1, 2.5e3, -7], 'ownedRelationship': [{'@id': 'b'}]},
+         {'@id': 'b', 'declaredName': 'x ] , [ } {', 'body': 'line\nbreak \\ €', 'isAbstract': False, 'owner': None},
+         123456, "a ] string", 4.5e-3, True, None, [], {}, [[1], {'k': [2]}]]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 64, 1000])
+def test_iterJSONArray_chunk_sizes(size):
+    data = json.dumps(ITEMS, ensure_ascii=False).encode("utf-8")
+    assert list(iterJSONArray(chunked(data, size))) == ITEMS
+
+
+def test_iterJSONArray_every_split():
+    # the multibyte characters, escapes, numbers and literals are split at every byte
+    data = b" \n[ " + json.dumps(ITEMS, ensure_ascii=False, indent=1).encode("utf-8")[1:]
+    for split in range(len(data) + 1):
+        assert list(iterJSONArray([data[:split], b"", data[split:]])) == ITEMS, split
+
+
+def test_iterJSONArray_empty_and_invalid():
+    assert list(iterJSONArray([b" [", b" ] "])) == []
+    with pytest.raises(Exception, match="no JSON array"):
+        list(iterJSONArray([b'{"error": "x"}']))
+    with pytest.raises(Exception, match="incomplete"):
+        list(iterJSONArray([b'[{"@id": "a"}, {"@id": ']))
+    with pytest.raises(Exception, match="incomplete"):
+        list(iterJSONArray([b'[1, 2']))
+    with pytest.raises(Exception, match="incomplete"):
+        list(iterJSONArray([]))
+
+
+def test_SharedValues_shares_strings_and_references():
+    shared = SharedValues()
+    first = shared.element(json.loads('{"@id": "a", "owner": {"@id": "p"}, "ownedRelationship": [{"@id": "r"}]}'))
+    second = shared.element(json.loads('{"@id": "b", "owner": {"@id": "p"}, "ownedRelationship": [{"@id": "r"}]}'))
+    assert first['owner'] is second['owner']
+    assert first['ownedRelationship'][0] is second['ownedRelationship'][0]
+    assert first == {'@id': 'a', 'owner': {'@id': 'p'}, 'ownedRelationship': [{'@id': 'r'}]}
+
+
+def test_applyChanges():
+    elements = {'a': {'@id': 'a'}, 'b': {'@id': 'b'}, 'c': {'@id': 'c'}}
+    applyChanges(elements, {'a': None, 'b': {'@id': 'b', 'declaredName': 'B'}, 'd': {'@id': 'd'}, 'missing': None})
+    assert elements == {'b': {'@id': 'b', 'declaredName': 'B'}, 'c': {'@id': 'c'}, 'd': {'@id': 'd'}}
+    assert list(elements) == ['b', 'c', 'd']
+
+
+def test_getElements_pages_and_cache(sysml, cache):
+    elements = generateModel(2500, realistic=False)
+    project = sysml.addProject(elements)
+    assert list(getElements(sysml.url, project)) == elements
+    assert cache.contains(project, sysml.head(project))
+    sysml.resetStats()
+    assert list(getElements(sysml.url, project)) == elements
+    assert sysml.resetStats().get("requests") == 1 # only the head commit
+
+
+def test_getElements_applies_changes_to_cached_commit(sysml, cache):
+    elements = generateModel(2500, realistic=False)
+    project = sysml.addProject(elements)
+    base = sysml.head(project)
+    list(getElements(sysml.url, project))
+    sysml.changeElements(project, 20)
+    removed, added = elements[5], {'@id': 'new', '@type': 'PartDefinition', 'declaredName': 'new'}
+    sysml.addCommit(project, [{'@type': 'DataVersion', 'identity': {'@id': removed['@id']}, 'payload': None},
+                              {'@type': 'DataVersion', 'identity': {'@id': 'new'}, 'payload': added}])
+    head = sysml.head(project)
+    expected = {id: json.loads(sysml.commits[head].element(id)) for id in sysml.commits[head].ids}
+    sysml.resetStats()
+    loaded = {element['@id']: element for element in getElements(sysml.url, project)}
+    assert loaded == expected
+    assert sysml.resetStats()["requests"] < 10 # the commits and their changes, no pages of elements
+    assert cache.contains(project, head) and cache.contains(project, base)
+    changes = getChanges(sysml.url, project, base, head)
+    assert len(changes) == 22 and changes[removed['@id']] is None and changes['new'] == added
+
+
+def test_getElements_recovers_from_corrupt_entry(sysml, cache):
+    elements = generateModel(2500, realistic=False)
+    project = sysml.addProject(elements)
+    list(getElements(sysml.url, project))
+    path = cache.path(project, sysml.head(project))
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(CorruptEntry):
+        list(cache.read(project, sysml.head(project)))
+    assert not path.exists()
+    path.write_bytes(data[:len(data) // 2])
+    # the elements passed on before the entry turned out to be corrupt are not passed on again
+    loaded = list(getElements(sysml.url, project))
+    assert sorted(e['@id'] for e in loaded) == sorted(e['@id'] for e in elements)
+    assert list(getElements(sysml.url, project)) == elements
+
+
+def test_queryElements_follows_pages(sysml, monkeypatch):
+    monkeypatch.setattr(SysMLAPI, "PAGE_SIZE_FOR_ELEMENTS", 7)
+    elements = generateModel(1000, realistic=False)
+    project = sysml.addProject(elements)
+    expected = [e for e in elements if e['@type'] == 'FeatureValue']
+    assert len(expected) > 7
+    assert queryElements(sysml.url, project, primitiveConstraint('@type', 'FeatureValue')) == expected
+    first = sysml.head(project)
+    sysml.changeElements(project, 10)
+    assert queryElements(sysml.url, project, primitiveConstraint('@type', 'FeatureValue'), first) == expected
+
+
+def test_getElementsById(sysml, monkeypatch):
+    monkeypatch.setattr(SysMLAPI, "ID_BATCH_SIZE", 10)
+    elements = generateModel(1000, realistic=False)
+    project = sysml.addProject(elements)
+    ids = [e['@id'] for e in elements[::17]]
+    found = getElementsById(sysml.url, project, sysml.head(project), ids + ids[:3] + ['missing'])
+    assert found == {e['@id']: e for e in elements[::17]}
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_gets_own_client(sysml):
+    parent = getClient(sysml.url)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child = getClient(sysml.url)
+            ok = child is not parent and child.get(f"{sysml.url}/projects").status_code == 200
+            os.write(write, b"1" if ok else b"0")
+        finally:
+            os._exit(0)
+    os.close(write)
+    result = os.read(read, 1)
+    os.waitpid(pid, 0)
+    os.close(read)
+    assert result == b"1"
+    assert getClient(sysml.url) is parent
@@ -0,0 +1,129 @@
+import contextlib
+import copy
+import gc
+import io
+import random
+import threading
+
+import pytest
+
+from ModelGenerator import generateModel
+from SysMLAPI import applyChanges
+from SysMLModel import freezingLoads
+from SysMLwithLCA import SysMLLCAModel
+
+QUERIES = ['renamed1', 'P0', 'type:PartDefinition P', 'x0', 'flow', 'type:MetadataUsage', 'type:FeatureValue', 'kg']
+
+
+def quietly(function, *args, **kwargs):
+    # the models print their progress
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def asDict(element):
+    return element if isinstance(element, dict) else element.toDict()
+
+
+def randomChanges(model, seed=1):
+    # renamed, deleted and new elements, including metadata usages
+    r = random.Random(seed)
+    ids = list(model.theModel)
+    changes = {}
+    for id in r.sample(ids, 300):
+        changes[id] = dict(asDict(model.theModel[id]), declaredName=f"renamed{r.randint(0, 50)}")
+    for id in r.sample(list(model.getElementsOfType('MetadataUsage')), 30) + r.sample(ids, 100):
+        changes[id] = None
+    for i in range(50):
+        changes[f"new{i}"] = {'@id': f"new{i}", '@type': 'PartDefinition', 'declaredName': 'P0', 'ownedRelationship': [{'@id': ids[i]}]}
+    return changes
+
+
+def assertSameIndexes(updated, fresh):
+    sets = lambda index: {key: set(value) for key, value in index.items() if value}
+    references = lambda model: {id: {p: sorted(v) for p, v in properties.items() if v}
+                                for id, properties in model.incomingReferences.items() if any(properties.values())}
+    assert sets(updated.elementsByType) == sets(fresh.elementsByType)
+    assert updated.elementIdsByName == fresh.elementIdsByName
+    assert sets(updated.elementsByMetadata) == sets(fresh.elementsByMetadata)
+    assert references(updated) == references(fresh)
+    for query in QUERIES:
+        assert updated.searchElements(query, limit=None) == fresh.searchElements(query, limit=None), query
+        assert updated.searchElements(query, limit=5) == fresh.searchElements(query, limit=5), query
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("searchFirst", [False, True])
+def test_updateIndexes_matches_fresh_load(compact, searchFirst):
+    model = quietly(SysMLLCAModel.fromElements, copy.deepcopy(generateModel(5000)), compact=compact)
+    model.buildIncomingReferences()
+    if searchFirst: # the words are only indexed by the first search, the update has to keep them
+        model.searchElements('P1')
+    changes = randomChanges(model)
+    previous = {id: model.theModel.get(id) for id in changes}
+    applyChanges(model.theModel, changes)
+    model.updateIndexes(previous)
+    fresh = quietly(SysMLLCAModel.fromElements, [asDict(e) for e in model.theModel.values()], compact=compact)
+    fresh.buildIncomingReferences()
+    assertSameIndexes(model, fresh)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_refresh_matches_fresh_load(sysml, compact):
+    project = sysml.addProject(generateModel(3000))
+    model = quietly(SysMLLCAModel, sysml.url, project, compact=compact)
+    model.buildIncomingReferences()
+    model.searchElements('P1')
+    parts = model.getLCAParts()
+    first = model.commit
+    sysml.changeElements(project, 40)
+    assert quietly(model.refresh) == 40
+    assert model.commit == sysml.head(project)
+    fresh = quietly(SysMLLCAModel, sysml.url, project, compact=compact)
+    fresh.buildIncomingReferences()
+    assertSameIndexes(model, fresh)
+    assert model.getFlows() == fresh.getFlows()
+    assert quietly(model.refresh) == 0
+    # the LCA parts are cached per commit
+    assert model.getLCAParts() == fresh.computeLCAParts()
+    assert quietly(SysMLLCAModel, sysml.url, project, commit=first, compact=compact).getLCAParts() is parts
+
+
+def test_search_type_only_without_word_index():
+    model = quietly(SysMLLCAModel.fromElements, generateModel(2000))
+    expected = [id for id, element in model.theModel.items() if element['@type'] == 'PartDefinition']
+    assert model.searchElements('type:PartDefinition', limit=None) == expected
+    assert model.searchElements('type:PartDefinition', limit=3) == expected[:3]
+    assert model.searchElements('', types=['PartDefinition'], limit=None) == expected
+    assert model.searchTerms is None
+    assert model.searchElements('P1', limit=None)
+    assert model.searchTerms is not None
+
+
+def test_freezingLoads_unfreezes_after_last_load():
+    gc.unfreeze()
+    first, second = freezingLoads(), freezingLoads()
+    first.__enter__()
+    second.__enter__()
+    gc.freeze()
+    first.__exit__(None, None, None)
+    assert gc.get_freeze_count() > 0 # the other load is still running
+    second.__exit__(None, None, None)
+    assert gc.get_freeze_count() == 0
+
+
+def test_concurrent_loads():
+    elements = generateModel(3000)
+    models = [None] * 4
+
+    def load(i):
+        models[i] = SysMLLCAModel.fromElements(copy.deepcopy(elements))
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(len(models))]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert gc.get_freeze_count() == 0
+    assert all(len(model.theModel) == len(elements) for model in models)
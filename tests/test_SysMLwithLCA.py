@@ -0,0 +1,125 @@
+import contextlib
+import io
+
+import pytest
+
+import SysMLwithLCA
+from ModelGenerator import generateModel
+from SysMLwithLCA import FLOWS_PACKAGE, SysMLLCAModel
+from openLCAAPI import openLCAServer
+
+
+def quietly(function, *args, **kwargs):
+    # the models print their progress
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def modelWithNamespace(size=2000):
+    # the flows package is created in the root namespace, the attributes of flows in kg are typed by Mass,
+    # those of flows without a flow property by Integer
+    elements = generateModel(size)
+    elements.append({'@id': 'root', '@type': 'Namespace', 'ownedRelationship': [], 'ownedMember': []})
+    elements.append({'@id': 'mass', '@type': 'AttributeDefinition', 'declaredName': 'Mass', 'ownedRelationship': []})
+    elements.append({'@id': 'integer', '@type': 'DataType', 'declaredName': 'Integer', 'ownedRelationship': []})
+    return elements
+
+
+def flow(id, name, flowProperty='Mass'):
+    return {'uuid': id, 'name': name, 'flowProperty': flowProperty, 'unit': 'kg' if flowProperty else None}
+
+
+def packageFlows(model):
+    # uuid -> (name, type) of the attributes with @lcaflow in the flows package
+    package = model.theModel[model.findElementId(FLOWS_PACKAGE, 'Package')]
+    typeOf = lambda a: [t['type']['@id'] for t in model.getMetaChain(a, model.FEATURE_TYPINGS) or []]
+    return {model.getExternalRef(a): (a['declaredName'], typeOf(a)) for a in model.getMetaChain(package, model.OWNED_MEMBERS) or []
+            if a['@type'] == 'AttributeUsage' and model.usesMetadata(a, model.FlowId)}
+
+
+def test_publishFlows(sysml):
+    project = sysml.addProject(modelWithNamespace())
+    model = quietly(SysMLLCAModel, sysml.url, project)
+    modelFlows = list(model.getFlows().values())
+    flows = [flow(f"new-{i}", f"new {i}", 'Mass' if i % 2 else None) for i in range(10)] + \
+            [flow(id, 'elsewhere') for id in modelFlows[:3]]
+
+    assert quietly(model.publishFlows, flows) == {'added': 10, 'changed': 0, 'removed': 0}
+    assert model.commit == sysml.head(project)
+    assert packageFlows(model) == {f"new-{i}": (f"new {i}", ['mass' if i % 2 else 'integer']) for i in range(10)}
+    # the flows of the model outside of the package are not added again
+    assert sorted(model.getFlows().values()) == sorted(modelFlows + [f"new-{i}" for i in range(10)])
+
+    commit = model.commit
+    assert quietly(model.publishFlows, flows) == {'added': 0, 'changed': 0, 'removed': 0}
+    assert sysml.head(project) == commit # nothing changed, no commit
+
+    changed = [dict(f) for f in flows[2:10]]
+    changed[0]['name'] = 'renamed'
+    changed[1]['flowProperty'] = None
+    assert quietly(model.publishFlows, changed) == {'added': 0, 'changed': 2, 'removed': 2}
+    assert packageFlows(model) == {f['uuid']: (f['name'], ['mass' if f['flowProperty'] else 'integer']) for f in changed}
+    # no element refers to a removed element of the package
+    for element in model.theModel.values():
+        for key in ('owningRelationship', 'owningRelatedElement'):
+            assert not element.get(key) or element[key]['@id'] in model.theModel
+
+    fresh = quietly(SysMLLCAModel, sysml.url, project)
+    assert packageFlows(fresh) == packageFlows(model)
+
+
+def test_publishFlows_from_openLCA(sysml, openLCA):
+    project = sysml.addProject(modelWithNamespace())
+    openLCA.addFlows([f"flow-{i}" for i in range(5)])
+    openLCA.addFlows([f"other-{i}" for i in range(3)], tags=('other',))
+    flows = openLCAServer(openLCA.url).getSysMLFlows('sysml')
+    assert {(f['uuid'], f['flowProperty'], f['unit']) for f in flows} == {(f"flow-{i}", 'Mass', 'kg') for i in range(5)}
+    model = quietly(SysMLLCAModel, sysml.url, project)
+    assert quietly(model.publishFlows, flows)['added'] == 5
+    assert set(packageFlows(model)) == {f"flow-{i}" for i in range(5)}
+
+
+def test_getFlowsPackageChanges_without_root_namespace():
+    model = quietly(SysMLLCAModel.fromElements, generateModel(1000))
+    with pytest.raises(Exception, match="No root namespace"):
+        model.getFlowsPackageChanges([flow('new', 'new')])
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_lca_subset_has_the_same_parts(sysml, compact):
+    project = sysml.addProject(generateModel(4000, lcaParts=10))
+    full = quietly(SysMLLCAModel, sysml.url, project, compact=compact)
+    subset = quietly(SysMLLCAModel, sysml.url, project, compact=compact, lcaSubset=True)
+    assert subset.lcaSubset and len(subset.theModel) < len(full.theModel)
+    assert subset.computeLCAParts() == full.computeLCAParts()
+
+
+def test_lca_subset_falls_back_to_complete_model(sysml, monkeypatch):
+    project = sysml.addProject(generateModel(2000))
+
+    def fail(*args):
+        raise Exception("query failed")
+
+    monkeypatch.setattr(SysMLwithLCA, "getLCASubset", fail)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        model = SysMLLCAModel(sysml.url, project, lcaSubset=True)
+    assert "Warning: LCA subset could not be loaded (query failed)" in output.getvalue()
+    assert not model.lcaSubset
+    assert len(model.theModel) == len(sysml.commits[model.commit].ids)
+
+
+def test_rollup_skips_exchanges_without_flow():
+    elements = generateModel(2000)
+    subsetting = next(e for e in elements if e['@type'] == 'Subsetting')
+    elements.remove(subsetting)
+    for element in elements:
+        for key in ('ownedRelationship', 'ownedElement'):
+            if subsetting['@id'] in [r['@id'] for r in element.get(key) or []]:
+                element[key] = [r for r in element[key] if r['@id'] != subsetting['@id']]
+    model = quietly(SysMLLCAModel.fromElements, elements)
+    complete = quietly(SysMLLCAModel.fromElements, generateModel(2000))
+    parts = model.computeLCAParts()
+    assert len(parts) == len(complete.computeLCAParts())
+    count = lambda parts: sum(len(p['exchanges']) for p in parts)
+    assert count(parts) < count(complete.computeLCAParts())
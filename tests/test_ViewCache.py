@@ -0,0 +1,88 @@
+import contextlib
+import io
+import pickle
+
+import SysMLAPI
+import ViewCache as ViewCacheModule
+from ElementCache import PickleElementCache
+from ModelGenerator import generateModel
+from SysMLwithLCA import SysMLLCAModel
+from ViewCache import PICKLE_FORMAT, VIEW_VERSION, ViewCache
+
+
+class Counting:
+    # compute function that counts its calls
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_value_is_kept_per_commit(tmp_path):
+    cache = ViewCache(tmp_path)
+    compute = Counting([1, 2])
+    assert cache.value('p', 'c', 'x.pickle', compute) == [1, 2]
+    assert cache.value('p', 'c', 'x.pickle', compute) == [1, 2]
+    assert compute.calls == 1
+    assert (tmp_path / f"p_c.v{VIEW_VERSION}.{PICKLE_FORMAT}.x.pickle").exists()
+    # a new process reads the file
+    assert ViewCache(tmp_path).value('p', 'c', 'x.pickle', compute) == [1, 2]
+    assert compute.calls == 1
+    assert ViewCache(tmp_path).value('p', 'other', 'x.pickle', compute) == [1, 2]
+    assert compute.calls == 2
+
+
+def test_value_depends_on_python_version(tmp_path, monkeypatch):
+    cache = ViewCache(tmp_path)
+    assert cache.value('p', 'c', 'x.pickle', lambda: 'this version') == 'this version'
+    monkeypatch.setattr(ViewCacheModule, "PICKLE_FORMAT", "py20")
+    assert ViewCache(tmp_path).value('p', 'c', 'x.pickle', lambda: 'other version') == 'other version'
+    assert len(list(tmp_path.glob("p_c.*.x.pickle"))) == 2
+
+
+def test_corrupt_pickle_is_computed_again(tmp_path):
+    ViewCache(tmp_path).value('p', 'c', 'x.pickle', lambda: [1, 2])
+    path = next(tmp_path.glob("*x.pickle"))
+    path.write_bytes(b"\x80\x04\x95garbage" * 3)
+    assert ViewCache(tmp_path).value('p', 'c', 'x.pickle', lambda: 'recomputed') == 'recomputed'
+    with open(path, "rb") as f:
+        assert pickle.load(f) == 'recomputed'
+
+
+def test_nothing_is_cached_without_commit(tmp_path):
+    cache = ViewCache(tmp_path)
+    compute = Counting('value')
+    cache.value('p', None, 'x.pickle', compute)
+    cache.value('p', None, 'x.pickle', compute)
+    assert compute.calls == 2
+    assert cache.text('p', None, 'x.html', lambda f: f.write('first')) == 'first'
+    assert cache.text('p', None, 'x.html', lambda f: f.write('second')) == 'second'
+    first = cache.file('p', None, 'x.html', lambda f: f.write('first'))
+    second = cache.file('p', None, 'x.html', lambda f: f.write('second'))
+    assert first != second and second.read_text(encoding="utf-8") == 'second'
+    assert not cache.memory
+
+
+def test_text_and_file(tmp_path):
+    cache = ViewCache(tmp_path)
+    assert cache.text('p', 'c', 'x.html', lambda f: f.write('<html/>')) == '<html/>'
+    assert ViewCache(tmp_path).text('p', 'c', 'x.html', lambda f: f.write('changed')) == '<html/>'
+    path = cache.file('p', 'c', 'y.html', lambda f: f.write('<p/>'))
+    assert cache.file('p', 'c', 'y.html', lambda f: f.write('changed')) == path
+    assert path.read_text(encoding="utf-8") == '<p/>'
+
+
+def test_setCache_moves_view_cache(tmp_path, sysml):
+    SysMLAPI.setCache(PickleElementCache(tmp_path / "other"))
+    assert SysMLAPI.getViewCache().directory == tmp_path / "other"
+    project = sysml.addProject(generateModel(1000))
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = SysMLLCAModel(sysml.url, project)
+    assert model.getLCAParts() is model.getLCAParts()
+    assert list((tmp_path / "other").glob(f"{project}_{model.commit}.*lcaparts.pickle"))
+    html = model.asHTML()
+    assert list((tmp_path / "other").glob(f"{project}_{model.commit}.*.html"))
+    assert model.asHTML() == html
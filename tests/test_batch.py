@@ -0,0 +1,70 @@
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import sys
+from pathlib import Path
+
+import pytest
+
+from ModelGenerator import generateModel
+from SysMLwithLCA import SysMLLCAModel
+
+# the worker processes are forked, they inherit the element cache of the test and find runProject in the module "batch"
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="needs forked worker processes")
+
+
+@pytest.fixture(scope="module")
+def batch():
+    spec = importlib.util.spec_from_file_location("batch", Path(__file__).resolve().parent.parent / "src" / "sysml-lca-batch.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["batch"] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules["batch"]
+
+
+def run(batch, tmp_path, arguments):
+    summary = tmp_path / "summary.json"
+    with contextlib.redirect_stderr(io.StringIO()):
+        code = batch.main(arguments + ["--summary", str(summary)])
+    return code, json.loads(summary.read_text(encoding="utf-8")) if summary.exists() else None
+
+
+def test_all_projects_in_forked_processes(batch, sysml, tmp_path):
+    projects = [sysml.addProject(generateModel(1500, seed=i), name=f"model {i}") for i in range(6)]
+    code, summary = run(batch, tmp_path, ["--all", "--processes", "4", "--no-sync", "--sysml", sysml.url])
+    assert code == batch.EXIT_OK
+    assert summary['succeeded'] == 6 and summary['failed'] == 0
+    assert [p['project'] for p in summary['projects']] == projects
+    assert [p['name'] for p in summary['projects']] == [f"model {i}" for i in range(6)]
+    assert all(p['elements'] >= 1500 and p['parts'] > 0 for p in summary['projects'])
+
+
+def test_sync_and_failed_project(batch, sysml, openLCA, tmp_path):
+    projects = [sysml.addProject(generateModel(1500, seed=i)) for i in range(3)]
+    flows = set()
+    for i in range(3):
+        with contextlib.redirect_stdout(io.StringIO()):
+            flows.update(SysMLLCAModel.fromElements(generateModel(1500, seed=i)).getFlows().values())
+    openLCA.addFlows(sorted(flows))
+    arguments = ["--processes", "2", "--no-mirror", "--sysml", sysml.url, "--openlca", openLCA.url]
+    code, summary = run(batch, tmp_path, projects + ["missing"] + arguments)
+    assert code == batch.EXIT_FAILED
+    assert summary['succeeded'] == 3 and summary['failed'] == 1
+    missing = summary['projects'][-1]
+    assert missing['project'] == "missing" and missing['error'].startswith("load:")
+    for result in summary['projects'][:3]:
+        assert result['actions'] == {'created': result['parts']}
+    # a second run finds the processes of the first one
+    code, summary = run(batch, tmp_path, projects + arguments)
+    assert code == batch.EXIT_OK
+    assert all(result['actions'] == {'unchanged': result['parts']} for result in summary['projects'])
+    assert len(openLCA.getAll('Process')) == sum(result['parts'] for result in summary['projects'])
+
+
+def test_invalid_arguments(batch, tmp_path):
+    assert run(batch, tmp_path, [])[0] == batch.EXIT_ERROR
+    assert run(batch, tmp_path, ["--all", "--processes", "0"])[0] == batch.EXIT_ERROR
+    assert run(batch, tmp_path, ["--all", "--sysml", "http://127.0.0.1:1"])[0] == batch.EXIT_ERROR
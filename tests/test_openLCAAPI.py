@@ -0,0 +1,113 @@
+import contextlib
+import copy
+import io
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ModelGenerator import generateModel
+from SysMLwithLCA import SysMLLCAModel
+from openLCAAPI import exchangesHash, openLCAServer, syncTag
+
+
+@pytest.fixture
+def parts(openLCA):
+    # the LCA parts of a generated model, its flows exist in openLCA
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = SysMLLCAModel.fromElements(generateModel(2000, lcaParts=12))
+    openLCA.addFlows(sorted(set(model.getFlows().values())))
+    return copy.deepcopy(model.computeLCAParts())
+
+
+def sync(server, project, parts):
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = server.syncProcesses(project, parts, 4)
+    assert [r for r in report['results'] if r['error']] == []
+    return report
+
+
+def actions(report):
+    return Counter(r['action'] for r in report['results'])
+
+
+def processesByPart(openLCA, project):
+    result = {}
+    for process in openLCA.getAll('Process'):
+        if f"sysml-project:{project}" in process.get('tags', []):
+            partId = next(t[len("sysml-id:"):] for t in process['tags'] if t.startswith("sysml-id:"))
+            result[partId] = process
+    return result
+
+
+def test_exchangesHash():
+    unit = {'@id': 'kg', 'declaredName': 'kilogram'}
+    exchanges = [{'id': 'a', 'value': {'num': 1.5, 'mRef': unit}}, {'id': 'b', 'value': {'num': -2, 'mRef': None}}]
+    assert exchangesHash('P', exchanges) == exchangesHash('P', exchanges[::-1])
+    # only the id of the unit is part of the hash
+    assert exchangesHash('P', exchanges) == exchangesHash('P', [dict(exchanges[0], value={'num': 1.5, 'mRef': {'@id': 'kg'}}), exchanges[1]])
+    assert exchangesHash('P', exchanges) != exchangesHash('Q', exchanges)
+    assert exchangesHash('P', exchanges) != exchangesHash('P', [exchanges[0], {'id': 'b', 'value': {'num': -2, 'mRef': unit}}])
+    assert exchangesHash('P', exchanges) != exchangesHash('P', [exchanges[0], {'id': 'b', 'value': {'num': -3, 'mRef': None}}])
+
+
+def test_syncProcesses_creates_updates_and_deletes(openLCA, parts):
+    server = openLCAServer(openLCA.url)
+    report = sync(server, "project", parts)
+    assert actions(report) == {'created': len(parts)}
+    processes = processesByPart(openLCA, "project")
+    assert set(processes) == {p['id'] for p in parts}
+    for p in parts:
+        process = processes[p['id']]
+        assert process['name'] == f"produce {p['name']}"
+        assert syncTag("sysml-hash", exchangesHash(p['name'], p['exchanges'])) in process['tags']
+        product = next(e['flow'] for e in process['exchanges'] if e.get('isQuantitativeReference'))
+        assert not any(t.startswith("sysml-hash:") for t in openLCA.entities['Flow'][product['@id']]['tags'])
+
+    # nothing changed: no process is written
+    versions = {id: process['lastChange'] for id, process in processes.items()}
+    report = sync(server, "project", parts)
+    assert actions(report) == {'unchanged': len(parts)}
+    assert {id: process['lastChange'] for id, process in processesByPart(openLCA, "project").items()} == versions
+
+    changed, renamed, removed = parts[0], parts[1], parts[2]
+    changed['exchanges'][0]['value']['num'] += 1
+    renamed['name'] = 'renamed'
+    productFlows = len(openLCA.getAll('Flow'))
+    report = sync(server, "project", [p for p in parts if p is not removed])
+    assert actions(report) == {'updated': 2, 'deleted': 1, 'unchanged': len(parts) - 3}
+    after = processesByPart(openLCA, "project")
+    assert removed['id'] not in after
+    assert len(openLCA.getAll('Flow')) == productFlows - 1 # the product flow of the removed part
+    # updated processes keep their ids and product flows
+    for part in (changed, renamed):
+        assert after[part['id']]['@id'] == processes[part['id']]['@id']
+        assert syncTag("sysml-hash", exchangesHash(part['name'], part['exchanges'])) in after[part['id']]['tags']
+    product = next(e['flow'] for e in after[renamed['id']]['exchanges'] if e.get('isQuantitativeReference'))
+    assert openLCA.entities['Flow'][product['@id']]['name'] == 'renamed'
+
+
+def test_syncProcesses_keeps_other_projects_and_removes_duplicates(openLCA, parts):
+    server = openLCAServer(openLCA.url)
+    sync(server, "other", parts[:3])
+    sync(server, "project", parts)
+    # a second process of a part, e.g. of an interrupted synchronization
+    duplicate = copy.deepcopy(processesByPart(openLCA, "project")[parts[0]['id']])
+    duplicate['@id'] = 'duplicate'
+    openLCA.store(duplicate)
+    report = sync(server, "project", parts)
+    assert actions(report) == {'deleted': 1, 'unchanged': len(parts)}
+    assert 'duplicate' not in {p['@id'] for p in openLCA.getAll('Process')}
+    assert len(processesByPart(openLCA, "other")) == 3
+
+
+def test_warmFlowCache_fetches_each_flow_once(openLCA, parts):
+    server = openLCAServer(openLCA.url)
+    ids = [exchange['id'] for p in parts for exchange in p['exchanges']]
+    openLCA.resetStats()
+    with ThreadPoolExecutor(4) as executor:
+        server.warmFlowCache(ids + ['missing'], executor)
+    assert openLCA.resetStats()['requests'] == len(set(ids)) + 1
+    assert all(server.getFlow(id) is not None for id in ids)
+    assert server.getFlow('missing') is None
+    assert openLCA.resetStats().get('requests', 0) == 0